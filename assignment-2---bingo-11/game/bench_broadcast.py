@@ -0,0 +1,73 @@
+import contextlib
+import os
+import secrets
+import selectors
+import socket
+import threading
+import time
+
+import click
+
+from src.playing_area import PlayingArea
+from src.profile import Profile
+from src.protocol import *
+
+
+def drain(sel: selectors.BaseSelector, stop: threading.Event):
+    """Reads (and discards) everything sent to the players."""
+    while not stop.is_set():
+        for key, _ in sel.select(timeout=0.1):
+            key.fileobj.recv(1 << 20)
+
+
+def measure(send, profiles: list[Profile], repeat: int) -> float:
+    """Returns the median latency (in ms) of a broadcast, until it is written to every connection."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        send()
+        for p in profiles:
+            p.outbox.join()
+        times.append(time.perf_counter() - t0)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+@click.command()
+@click.option('-P',       'players', type=int, multiple=True, default=[1, 10, 50, 100], help='Numbers of players')
+@click.option('-N',       type=int,  default=100,   help='Size of the deck')
+@click.option('--codec',  type=click.Choice(['BINARY', 'JSON']), default='BINARY', help='Codec of the players')
+@click.option('--repeat', type=int,  default=5,     help='Repetitions of each measurement (median is reported)')
+def main(players, n, codec, repeat):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        pa = PlayingArea(n, 'localhost', 0, False)
+    msg = Protocol.playing_deck('Caller', secrets.token_bytes(16 * n), secrets.token_bytes(256))
+
+    print(f'{"P":>5} | {"per-user":>10} | {"broadcast":>10} | {"speedup":>7}')
+    for n_players in players:
+        sel = selectors.DefaultSelector()
+        stop = threading.Event()
+        profiles, ends = [], []
+        for i in range(n_players):
+            conn, end = socket.socketpair()
+            p = Profile(f'Player{i}', b'', b'', b'', conn, True)
+            p.codec = Codec[codec]
+            sel.register(end, selectors.EVENT_READ)
+            profiles.append(p)
+            ends.append(end)
+        t = threading.Thread(target=drain, args=[sel, stop])
+        t.start()
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            t_send = measure(lambda: [pa.send(p, msg) for p in profiles], profiles, repeat)
+            t_broadcast = measure(lambda: pa.broadcast(profiles, msg), profiles, repeat)
+        print(f'{n_players:5} | {t_send:8.2f}ms | {t_broadcast:8.2f}ms | {t_send / t_broadcast:6.1f}x')
+
+        stop.set()
+        t.join()
+        for p, end in zip(profiles, ends):
+            pa.close(p)
+            end.close()
+
+
+if __name__ == '__main__':
+    main()
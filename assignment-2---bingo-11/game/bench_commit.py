@@ -0,0 +1,187 @@
+import contextlib
+import os
+import selectors
+import socket
+import threading
+import time
+
+import click
+
+from src.card import Card
+from src.keychain import KeyChain
+from src.playing_area import PlayingArea
+from src.profile import Profile
+from src.protocol import *
+
+
+class Inboxes:
+    """Reads everything the playing area sends to the users (so sending never blocks), keeping the frames of the
+    sampled users."""
+
+    def __init__(self, ends: list[socket.socket], sampled: int):
+        self.buffers = [bytearray() for _ in range(sampled)]
+        self.cond = threading.Condition()
+        self.stop = threading.Event()
+        self.sel = selectors.DefaultSelector()
+        for i, end in enumerate(ends):
+            self.sel.register(end, selectors.EVENT_READ, i)
+        self.thread = threading.Thread(target=self.collect, daemon=True)
+        self.thread.start()
+
+    def collect(self):
+        while not self.stop.is_set():
+            for key, _ in self.sel.select(timeout=0.05):
+                data = key.fileobj.recv(1 << 20)
+                if key.data < len(self.buffers):
+                    with self.cond:
+                        self.buffers[key.data] += data
+                        self.cond.notify_all()
+
+    def frames(self, i: int, n: int) -> list[bytes]:
+        """Waits for the next n frames sent to a sampled user."""
+        frames = []
+        with self.cond:
+            while len(frames) < n:
+                buf = self.buffers[i]
+                size = 5 + int.from_bytes(buf[1:5], 'big') if len(buf) >= 5 else None
+                if size is None or len(buf) < size:
+                    self.cond.wait()
+                    continue
+                frames.append(bytes(buf[:size]))
+                del buf[:size]
+        return frames
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.sel.close()
+
+
+def decode(frame: bytes) -> tuple[Message, bytes, bytes]:
+    """Message of a frame, with its body and signature."""
+    codec, signature_size = Protocol.parse_flag(frame[0])
+    sm, m = frame[5:5 + signature_size], frame[5 + signature_size:]
+    return Protocol.decode(m, codec), m, sm
+
+
+def receive(pa: PlayingArea, p: Profile, frame: bytes):
+    """Handles a frame sent by a user, as the playing area does when reading it."""
+    msg, m, sm = decode(frame)
+    pa.handle(p.conn, p, msg, pa.verify(m, sm, p.public_key_pem))
+
+
+def forward(pa: PlayingArea, p: Profile, frame: bytes):
+    """Previous handling of a commit: forwarded to the caller and every other player as soon as it is received."""
+    msg, m, sm = decode(frame)
+    pa.verify(m, sm, p.public_key_pem)
+    room = p.room
+    pa.broadcast([room.get_caller()] + [pl for pl in room.get_players() if pl is not p], msg)
+
+
+def timed(f, *args) -> float:
+    t0 = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t0
+
+
+def commit_phase(n: int, players: int, sample: int, bundle: bool, kc: KeyChain, codec: Codec) -> dict:
+    """Runs the commit phase of a game, returning the frames and signatures it took and the time of each role.
+
+    Every user shares one key pair (signing and verifying take as long with any key). Only the first users
+    (including the caller) validate the cards they receive, all of them doing the same work; the responses of the
+    others are signed beforehand.
+    """
+    # Logs of the playing area are discarded
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        pa = PlayingArea(n, 'localhost', 0, False)
+        pa.sock.close()
+        room = pa.get_room(PlayingArea.DEFAULT_ROOM)
+        users, ends = [], []
+        for i in range(players + 1):
+            conn, end = socket.socketpair()
+            p = Profile(f'Player{i}' if i else 'Caller', kc.public_key_pem, b'', b'', conn, i > 0, i, room)
+            p.codec = codec
+            room.add_profile(p) if i else room.set_caller(p)
+            users.append(p)
+            ends.append(end)
+        sample = min(sample, players + 1)
+        inboxes = Inboxes(ends, sample)
+        card = Card(n)
+        card.generate_numbers()
+        numbers = card.numbers
+        numbers_signature = kc.sign(b''.join([x.to_bytes(4, 'big') for x in numbers]))
+        signed_frame = lambda msg: Protocol.frame(msg, kc, codec)
+        commits = [signed_frame(Protocol.commit_card(p.nickname, numbers, numbers_signature)) for p in users[1:]]
+        # Responses of the users not sampled (one per card received, or one per bundle)
+        to_command = Command.COMMIT_BUNDLE if bundle else Command.COMMIT_CARD
+        respond = lambda p, data: signed_frame(Protocol.response(p.nickname, to_command, 'OK', '', data))
+        cards = lambda p: [pl.nickname for pl in users[1:] if pl is not p]
+        responses = [(p, respond(p, () if bundle else (nickname,)))
+                     for p in users[sample:] for nickname in ([None] if bundle else cards(p))]
+
+        receive(pa, users[0], signed_frame(Protocol.start_game(users[0].nickname)))
+        for i in range(sample):
+            inboxes.frames(i, 1)
+        sent, signed = pa.metrics.messages_sent.total(), pa.metrics.signatures.count('sign')
+
+        # Playing area: cards committed
+        t_parea = sum(timed(receive if bundle else forward, pa, p, frame) for p, frame in zip(users[1:], commits))
+        # Users: cards validated and answered
+        t_users = []
+        for i, p in enumerate(users[:sample]):
+            received = inboxes.frames(i, 1 if bundle else len(cards(p)))
+            t0 = time.perf_counter()
+            for frame in received:
+                msg, _, _ = decode(frame)
+                entries = msg.commits if bundle else [(msg.sent_by, msg.numbers, msg.numbers_signature)]
+                for nickname, card_numbers, card_signature in entries:
+                    if nickname != p.nickname:
+                        card.validate_numbers(card_numbers, card_signature, kc, kc.public_key_pem)
+                    if not bundle:
+                        responses.append((p, respond(p, (nickname,))))
+                if bundle:
+                    responses.append((p, respond(p, ())))
+            t_users.append(time.perf_counter() - t0)
+        # Playing area: responses
+        t_parea += sum(timed(receive, pa, p, frame) for p, frame in responses)
+        result = {
+            'frames': pa.metrics.messages_sent.total() - sent + len(responses),
+            'signatures': pa.metrics.signatures.count('sign') - signed + len(responses),
+            'parea': t_parea * 1000,
+            'user': max(t_users) * 1000,
+        }
+
+    inboxes.close()
+    for p, end in zip(users, ends):
+        pa.close(p)
+        end.close()
+    return result
+
+
+@click.command()
+@click.option('-P',         'players', type=int, multiple=True, default=[10, 100, 1000], help='Numbers of players')
+@click.option('-N',         type=int, default=100, help='Size of the deck')
+@click.option('--key_size', type=click.Choice(['1024', '2048', '3072', '4096']), default='2048',
+              help='Size (in bits) of the RSA keys of the playing area and the users')
+@click.option('--codec',    type=click.Choice(['BINARY', 'JSON']), default='BINARY', help='Codec of the users')
+@click.option('--sample',   type=int, default=5, help='Users validating the cards they receive (the rest only answer)')
+@click.option('--per_card', type=int, default=100,
+              help='Largest number of players also measured with the previous forward of each card')
+def main(players, n, key_size, codec, sample, per_card):
+    Protocol.SIGNATURE_SIZE = int(key_size) // 8
+    kc = KeyChain(asymmetric_key_size=Protocol.SIGNATURE_SIZE, symmetric_key_size=32)
+    kc.generate_asymmetric()
+
+    print(f'{"P":>5} | {"scheme":>8} | {"frames":>8} | {"signatures":>10} | {"parea":>10} | {"user":>10} | '
+          f'{"phase":>10}')
+    for n_players in players:
+        for bundle in (False, True):
+            if not bundle and n_players > per_card:
+                continue
+            r = commit_phase(n, n_players, sample, bundle, kc, Codec[codec])
+            print(f'{n_players:5} | {"bundle" if bundle else "per-card":>8} | {r["frames"]:8} | {r["signatures"]:10} | '
+                  f'{r["parea"]:8.1f}ms | {r["user"]:8.1f}ms | {r["parea"] + r["user"]:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import time
+
+import click
+
+from src.deck import Deck
+from src.keychain import KeyChain
+
+
+def measure(f, repeat: int) -> float:
+    """Returns the best time (in ms) of a call."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def split(numbers: bytes) -> list[bytes]:
+    """Numbers of a deck, as the list the previous validation took."""
+    return [numbers[i:i + Deck.SIZE] for i in range(0, len(numbers), Deck.SIZE)]
+
+
+def validate_quadratic(numbers: list[bytes], numbers_shuffled: list[bytes]) -> bool:
+    """Previous validation of a deck, checking every number against the list of shuffled numbers."""
+    if len(numbers) != len(set(numbers_shuffled)) or len(numbers) != len(numbers_shuffled):
+        return False
+    for n in numbers:
+        if n not in numbers_shuffled:
+            return False
+    return True
+
+
+@click.command()
+@click.option('-N',          'sizes', type=int, multiple=True, default=[1_000, 10_000, 100_000, 1_000_000],
+              help='Sizes of the deck')
+@click.option('--quadratic', type=int, default=10_000, help='Largest deck also validated with the previous O(N^2) check')
+@click.option('--repeat',    type=int, default=3,      help='Repetitions of each measurement (best is reported)')
+def main(sizes, quadratic, repeat):
+    kc = KeyChain(asymmetric_key_size=256, symmetric_key_size=32, cc=False)
+    kc.generate_symmetric()
+
+    print(f'{"N":>9} | {"reset":>10} | {"shuffle":>10} | {"encrypt":>10} | {"decrypt":>10} | '
+          f'{"validate":>10} | {"O(N^2)":>10}')
+    for n in sizes:
+        deck = Deck(n)
+        t_reset = measure(deck.reset_numbers, repeat)
+        t_shuffle = measure(deck.shuffle_numbers, repeat)
+        t_encrypt = measure(lambda: deck.encrypt_numbers(kc), 1)
+        t_decrypt = measure(lambda: deck.decrypt_numbers(kc), 1)
+        # Validated as in a game: the encrypted deck, against the same deck shuffled by another user
+        deck.encrypt_numbers(kc)
+        other = Deck(n)
+        other.numbers = deck.numbers
+        other.shuffle_numbers()
+        shuffled = other.numbers
+        t_validate = measure(lambda: deck.validate_numbers(shuffled), repeat)
+        t_quadratic = f'{measure(lambda: validate_quadratic(split(deck.numbers), split(shuffled)), 1):8.2f}ms' \
+            if n <= quadratic else '-'
+        print(f'{n:9} | {t_reset:8.2f}ms | {t_shuffle:8.2f}ms | {t_encrypt:8.2f}ms | {t_decrypt:8.2f}ms | '
+              f'{t_validate:8.2f}ms | {t_quadratic:>10}')
+
+
+if __name__ == '__main__':
+    main()
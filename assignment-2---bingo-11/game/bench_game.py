@@ -0,0 +1,326 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+import click
+
+from src.caller import Caller
+from src.player import Player
+from src.playing_area import PlayingArea
+from src.protocol import *
+from src.supervisor import Supervisor, owner
+
+PHASES = ('cards', 'shuffle', 'keys', 'winners', 'game')
+
+
+class BenchCaller(Caller):
+    """Caller starting each game as soon as every player has joined."""
+
+    START_DELAY = 0
+
+    def new_game(self):
+        # Keep playing with the players left after disqualifications
+        self.min_players = min(self.min_players, max(self.n_players, 1))
+        super().new_game()
+
+
+class TracedPlayingArea(PlayingArea):
+    """Playing area recording when each phase of a game starts and the CPU time of its threads."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cond = threading.Condition()
+        self.games = []     # Timestamps of the phases of every game
+        self.current = None
+        self.first = None   # Counters when the first game started
+        self.cpu = 0.0
+        self.active = 0     # Connections being read
+
+    def read(self, conn: socket.socket, route: bool = True):
+        with self.cond:
+            self.active += 1
+        try:
+            super().read(conn, route)
+        finally:
+            with self.cond:
+                self.cpu += time.thread_time()
+                self.active -= 1
+                self.cond.notify_all()
+
+    def handle(self, conn, this_p, msg: Message, valid: bool):
+        now = time.perf_counter()
+        with self.cond:
+            if msg.command == Command.START_GAME and this_p and not this_p.is_player:
+                self.current = {'start': now}
+                if self.first is None:
+                    self.first = self.stats()
+            elif self.current is not None:
+                phase = {Command.SHUFFLE_DECK: 'shuffle', Command.PLAYING_DECK: 'keys',
+                         Command.SYMMETRIC_KEY: 'winners'}.get(msg.command, None)
+                # Phases start with the first message of their kind (winners are computed after the last key)
+                if phase and (phase not in self.current or phase == 'winners'):
+                    self.current[phase] = now
+        this_p = super().handle(conn, this_p, msg, valid)
+        with self.cond:
+            ended = msg.command == Command.DISQUALIFY or (msg.command == Command.WINNER and this_p and
+                                                         not this_p.is_player)
+            if ended and self.current is not None:
+                self.current['end'] = time.perf_counter()
+                self.current['disqualified'] = msg.command == Command.DISQUALIFY
+                self.current['stats'] = self.stats()
+                self.games.append(self.current)
+                self.current = None
+                self.cond.notify_all()
+        return this_p
+
+
+def run_user(cls, args: list, results, ready=None):
+    """Joins the playing area and plays until it disconnects, reporting the latency of joining and the CPU time."""
+    user = cls(*args)
+    # Join at the same time as the other players (after generating the keys)
+    if ready is not None:
+        ready.wait()
+    t0, cpu0 = time.monotonic(), time.thread_time()
+    user.join()
+    results.put((user.nickname, t0, time.monotonic()))
+    user.game_loop()
+    results.put((user.nickname, time.thread_time() - cpu0))
+
+
+def percentiles(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {}
+    return {f'p{q}': values[min(len(values) - 1, len(values) * q // 100)] * 1000 for q in (50, 90, 99)}
+
+
+def play(pa: TracedPlayingArea, n, players, games, prob_cheat, codec, suite, processes, timeout, trace):
+    """Joins the caller and the players and plays the games, returning the joins and the CPU time of each role."""
+    threading.Thread(target=pa.run, daemon=True).start()
+    port = pa.sock.getsockname()[1]
+
+    # Users, each on its own thread or process
+    if processes:
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        start = lambda *args: context.Process(target=run_user, args=args, daemon=True).start()
+        ready = context.Barrier(players)
+    else:
+        results = queue.Queue()
+        ready = threading.Barrier(players)
+        start = lambda *args: threading.Thread(target=run_user, args=args, daemon=True).start()
+    joins = {}
+    traces = lambda nickname: f'{trace}.{nickname}.json' if trace else None
+    start(BenchCaller, [n, 'localhost', port, 'Caller', prob_cheat, False, players, codec, 0, 'default',
+                        traces('Caller'), None, suite], results)
+    nickname, t0, t1 = results.get(timeout=timeout)
+    joins[nickname] = (t0, t1)
+    for i in range(players):
+        start(Player, [n, 'localhost', port, f'Player{i}', prob_cheat, False, codec, 0, 'default', traces(f'Player{i}'),
+                       None, suite], results, ready)
+    while len(joins) < players + 1:
+        nickname, t0, t1 = results.get(timeout=timeout)
+        joins[nickname] = (t0, t1)
+
+    # Games
+    with pa.cond:
+        while len(pa.games) < games:
+            # Stop when a game takes too long (or does not start)
+            ended = len(pa.games)
+            if not pa.cond.wait_for(lambda: len(pa.games) > ended, timeout):
+                break
+
+    # Disconnect the users, which report their CPU time
+    for room in list(pa.rooms.values()):
+        for p in room.profiles:
+            with contextlib.suppress(OSError):
+                p.conn.shutdown(socket.SHUT_RDWR)
+    cpu = {'parea': 0.0, 'caller': 0.0, 'players': 0.0}
+    for _ in range(players + 1):
+        nickname, t = results.get(timeout=timeout)
+        cpu['caller' if nickname == 'Caller' else 'players'] += t
+    with pa.cond:
+        pa.cond.wait_for(lambda: pa.active == 0, timeout)
+        cpu['parea'] = pa.cpu
+    return joins, cpu
+
+
+def play_workers(n, players, games, prob_cheat, codec, suite, processes, timeout, workers, rooms):
+    """Plays the games of several rooms at once on the workers of a playing area, returning the games per second."""
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    # Arguments of the playing area of each worker (without logs), counters reported every 0.1 seconds
+    args = [n, 'localhost', port, False, 0, Protocol.MAX_FRAME_SIZE, 0.0, False, 0, 1000, None, 0,
+            Protocol.MAX_FRAME_SIZE, 0.0, suite]
+    supervisor = Supervisor(workers, PlayingArea, args, 0.1)
+    for i in range(workers):
+        supervisor.start(i)
+    finished = lambda: sum(supervisor.worker_stats(i)['games_finished'] for i in range(workers))
+    try:
+        # Rooms spread evenly across the workers (the n-th room is served by the n % workers worker)
+        names, i = [], 0
+        while len(names) < rooms:
+            if owner(f'room{i}', workers) == len(names) % workers:
+                names.append(f'room{i}')
+            i += 1
+
+        # Users, each on its own thread or process
+        if processes:
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            start = lambda *args: context.Process(target=run_user, args=args, daemon=True).start()
+            ready = context.Barrier(players * rooms)
+        else:
+            results = queue.Queue()
+            ready = threading.Barrier(players * rooms)
+            start = lambda *args: threading.Thread(target=run_user, args=args, daemon=True).start()
+        # Workers report once they are listening
+        deadline = time.monotonic() + timeout
+        while not all(supervisor.worker_stats(i)['heartbeat'] for i in range(workers)):
+            if time.monotonic() > deadline:
+                raise queue.Empty
+            time.sleep(0.05)
+        for room in names:
+            start(BenchCaller, [n, 'localhost', port, 'Caller', prob_cheat, False, players, codec, 0, room, None, None,
+                                suite], results)
+        for _ in names:
+            results.get(timeout=timeout)
+        for room in names:
+            for i in range(players):
+                start(Player, [n, 'localhost', port, f'Player{i}', prob_cheat, False, codec, 0, room, None, None, suite],
+                      results, ready)
+        for _ in range(players * rooms):
+            results.get(timeout=timeout)
+
+        # Games
+        t0, games0 = time.monotonic(), finished()
+        last, t_last = games0, t0
+        while finished() - games0 < games * rooms:
+            time.sleep(0.05)
+            if finished() != last:
+                last, t_last = finished(), time.monotonic()
+            elif time.monotonic() - t_last > timeout:
+                break
+        played = int(finished() - games0)
+        return played, played / (time.monotonic() - t0)
+    finally:
+        for p in supervisor.processes:
+            p.terminate()
+        for p in supervisor.processes:
+            p.join()
+
+
+@click.command()
+@click.option('-N',           type=int,   default=100,   help='Size of the deck')
+@click.option('-P',           'players', type=int, default=4, help='Number of players')
+@click.option('-G',           'games', type=int, default=10, help='Games played back-to-back')
+@click.option('--prob_cheat', type=float, default=0.0,   help='Probability of each user cheating')
+@click.option('--key_size',   type=click.Choice(['1024', '2048', '3072', '4096']), default='2048',
+              help='Size (in bits) of the RSA keys of the playing area and the users')
+@click.option('--codec',      type=click.Choice(['BINARY', 'JSON']), default='BINARY', help='Codec of the users')
+@click.option('--suite',      type=click.Choice(['RSA_PSS', 'ED25519']), default='RSA_PSS',
+              help='Signature suite of the playing area and the users')
+@click.option('--processes',  type=bool,  default=False, help='Run each user in its own process')
+@click.option('--timeout',    type=float, default=60.0,  help='Seconds to wait for each join and game')
+@click.option('--trace',      type=str,   default='',    help='Prefix of the trace file of each role (disabled if empty)')
+@click.option('--workers',    type=int,   default=0,
+              help='Worker processes of the playing area, each serving its own rooms (0 to play a single traced room)')
+@click.option('--rooms',      type=int,   default=4,     help='Rooms played at the same time (if there are workers)')
+@click.option('--output',     type=str,   default='bench_game.jsonl', help='File the results are appended to')
+def main(n, players, games, prob_cheat, key_size, codec, suite, processes, timeout, trace, workers, rooms, output):
+    # Signatures of every frame are as long as the keys
+    Protocol.SIGNATURE_SIZE = int(key_size) // 8
+    if workers:
+        bench_workers(n, players, games, prob_cheat, key_size, codec, suite, processes, timeout, workers, rooms, output)
+        return
+    # Logs of every role are discarded (users in other processes inherit it)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        pa = TracedPlayingArea(n, 'localhost', 0, False, trace=f'{trace}.parea.json' if trace else None, suite=suite)
+        try:
+            joins, cpu = play(pa, n, players, games, prob_cheat, codec, suite, processes, timeout, trace)
+        except queue.Empty:
+            joins, cpu = None, None
+    if joins is None:
+        print(f'[ERROR] Users did not join or disconnect in {timeout} seconds.')
+        sys.exit(1)
+    with pa.cond:
+        played = pa.games[:games]
+        first, last = pa.first, played[-1]['stats'] if played else pa.stats()
+    player_joins = [joins[f'Player{i}'] for i in range(players)]
+    joins_per_sec = players / (max(t1 for _, t1 in player_joins) - min(t0 for t0, _ in player_joins))
+
+    # Report
+    latencies = {phase: [] for phase in PHASES}
+    for g in played:
+        if g['disqualified']:
+            continue
+        marks = [g['start'], g.get('shuffle'), g.get('keys'), g.get('winners'), g['end']]
+        for phase, t0, t1 in zip(PHASES, marks, marks[1:]):
+            if t0 is not None and t1 is not None:
+                latencies[phase].append(t1 - t0)
+        latencies['game'].append(g['end'] - g['start'])
+    n_games = max(len(played), 1)
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': {'N': n, 'P': players, 'G': games, 'prob_cheat': prob_cheat, 'key_size': int(key_size),
+                   'codec': codec, 'suite': suite, 'processes': processes},
+        'games': len(played),
+        'disqualified': sum(g['disqualified'] for g in played),
+        'joins_per_sec': joins_per_sec,
+        'join_ms': percentiles([t1 - t0 for t0, t1 in player_joins]),
+        'phase_ms': {phase: percentiles(values) for phase, values in latencies.items()},
+        'per_game': {counter: (last[counter] - (first or last)[counter]) / n_games
+                     for counter in ('messages_received', 'messages_sent', 'bytes_received', 'bytes_sent')},
+        'cpu_s_per_game': {role: t / n_games for role, t in cpu.items()},
+    }
+    with open(output, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+
+    print(f'{len(played)}/{games} games ({result["disqualified"]} disqualified), {joins_per_sec:.1f} joins/s')
+    print(f'{"phase":>8} | {"p50":>9} | {"p90":>9} | {"p99":>9}')
+    for phase, p in result['phase_ms'].items():
+        if p:
+            print(f'{phase:>8} | {p["p50"]:7.1f}ms | {p["p90"]:7.1f}ms | {p["p99"]:7.1f}ms')
+    print('per game: ' + ', '.join(f'{int(v)} {k.replace("_", " ")}' for k, v in result['per_game'].items()))
+    print('CPU per game: ' + ', '.join(f'{role} {t * 1000:.1f}ms' for role, t in result['cpu_s_per_game'].items()))
+    print(f'Results appended to {output}.')
+    sys.exit(0 if len(played) == games else 1)
+
+
+def bench_workers(n, players, games, prob_cheat, key_size, codec, suite, processes, timeout, workers, rooms, output):
+    """Reports the games per second of several rooms played on the workers of a playing area."""
+    # Logs of every role are discarded (workers and users in other processes inherit it)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        try:
+            played, games_per_sec = play_workers(n, players, games, prob_cheat, codec, suite, processes, timeout,
+                                                 workers, rooms)
+        except queue.Empty:
+            played = None
+    if played is None:
+        print(f'[ERROR] Workers or users did not start in {timeout} seconds.')
+        sys.exit(1)
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': {'N': n, 'P': players, 'G': games, 'prob_cheat': prob_cheat, 'key_size': int(key_size),
+                   'codec': codec, 'suite': suite, 'processes': processes, 'workers': workers, 'rooms': rooms},
+        'games': played,
+        'games_per_sec': games_per_sec,
+    }
+    with open(output, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+
+    print(f'{played}/{games * rooms} games in {rooms} rooms on {workers} workers, {games_per_sec:.2f} games/s')
+    print(f'Results appended to {output}.')
+    sys.exit(0 if played >= games * rooms else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import base64
+import json
+import secrets
+import time
+import tracemalloc
+
+import click
+
+from src.protocol import *
+from src.utils import str_to_bytes
+
+
+def samples(n: int, players: int) -> list[Message]:
+    """One message of each command, sized for a deck of n numbers and a given number of players."""
+    pem = secrets.token_bytes(451)
+    sig = secrets.token_bytes(256)
+    deck = secrets.token_bytes(16 * n)
+    card = list(range(n // 4))
+    nicknames = [f'Player{i}' for i in range(players)]
+    return [
+        Protocol.join('Player0', 'PLAYER', 'Player0', pem, sig, secrets.token_bytes(1500), ['BINARY', 'JSON']),
+        Protocol.response('parea', Command.REQUEST_USERS, 'OK', '',
+                          tuple([[i, nickname, pem, sig] for i, nickname in enumerate(nicknames)])),
+        Protocol.sign_user('parea', 1, 'Player0', pem),
+        Protocol.start_game('parea', [(nickname, pem) for nickname in nicknames]),
+        Protocol.disconnect('parea', 'Player0', 'Invalid signature.'),
+        Protocol.commit_card('Player0', card, sig),
+        Protocol.commit_bundle('parea', [(nickname, card, sig) for nickname in nicknames]),
+        Protocol.disqualify('Caller', 'Player0', 'Invalid card.'),
+        Protocol.shuffle_deck('Player0', deck, sig),
+        Protocol.sign_deck('Player0', deck, sig),
+        Protocol.playing_deck('Caller', deck, sig),
+        Protocol.symmetric_key('Player0', secrets.token_bytes(32)),
+        Protocol.decks_keys('parea', [(nickname, deck, secrets.token_bytes(32)) for nickname in nicknames]),
+        Protocol.winner('Caller', nicknames[:1]),
+        Protocol.request_log('Player0'),
+        Protocol.request_users('Player0'),
+        Protocol.request_disqualify('parea', 'Player0', 'Invalid signature.'),
+        Protocol.resume('Player0', 'Player0', secrets.token_bytes(700), sig, 12),
+    ]
+
+
+def chain_decode(m: bytes) -> Message:
+    """Baseline: the previous decoding of JSON bodies, an if/elif chain over the commands checking the keys of each
+    message (with the fields and commands added since, as they would have been added to it)."""
+    d = json.loads(m, object_hook=str_to_bytes)
+
+    if 'command' not in d:
+        raise ProtocolBadFormat(m)
+
+    b64 = base64.b64decode
+    if d['command'] == Command.JOIN.value and 'sent_by' in d and 'role' in d and 'nickname' in d and \
+            'public_key_pem' in d and 'cc_signature' in d and 'cc_certificate' in d:
+        msg = Protocol.join(d['sent_by'], d['role'], d['nickname'], b64(d['public_key_pem'].encode('utf-8')),
+                            b64(d['cc_signature'].encode('utf-8')), b64(d['cc_certificate'].encode('utf-8')),
+                            d.get('codecs', [Codec.JSON.name]), d.get('room', 'default'),
+                            d.get('suites', ['RSA_PSS']))
+    elif d['command'] == Command.RESPONSE.value and 'sent_by' in d and 'to_command' in d and 'status' in d and \
+            'message' in d and 'data' in d:
+        if d['to_command'] == Command.SIGN_USER.value:
+            data = (d['data'][0], b64(d['data'][1].encode('utf-8')))
+        elif d['to_command'] == Command.REQUEST_USERS.value:
+            data = tuple([[sequence, nickname, b64(public_key_pem.encode('utf-8')), b64(signature.encode('utf-8'))]
+                          for sequence, nickname, public_key_pem, signature in d['data']])
+        elif d['to_command'] == Command.JOIN.value:
+            data = (d['data'][0], d['data'][1], b64(d['data'][2].encode('utf-8')), b64(d['data'][3].encode('utf-8')))
+        else:
+            data = tuple(d['data'])
+        msg = Protocol.response(d['sent_by'], Command(d['to_command']), d['status'], d['message'], data)
+    elif d['command'] == Command.SIGN_USER.value and 'sent_by' in d and 'sequence' in d and 'nickname' in d and \
+            'public_key_pem' in d:
+        msg = Protocol.sign_user(d['sent_by'], d['sequence'], d['nickname'], b64(d['public_key_pem'].encode('utf-8')))
+    elif d['command'] == Command.DISCONNECT.value and 'sent_by' in d and 'nickname' in d and 'reason' in d:
+        msg = Protocol.disconnect(d['sent_by'], d['nickname'], d['reason'])
+    elif d['command'] == Command.START_GAME.value and 'sent_by' in d and 'public_key_pems' in d:
+        msg = Protocol.start_game(d['sent_by'], [(nickname, b64(public_key_pem.encode('utf-8')))
+                                                 for nickname, public_key_pem in d['public_key_pems']],
+                                  d.get('game', 0))
+    elif d['command'] == Command.COMMIT_CARD.value and 'sent_by' in d and 'numbers' in d and \
+            'numbers_signature' in d:
+        msg = Protocol.commit_card(d['sent_by'], d['numbers'], b64(d['numbers_signature'].encode('utf-8')))
+    elif d['command'] == Command.DISQUALIFY.value and 'sent_by' in d and 'nickname' in d and 'reason' in d:
+        msg = Protocol.disqualify(d['sent_by'], d['nickname'], d['reason'])
+    elif d['command'] == Command.SHUFFLE_DECK.value and 'sent_by' in d and 'numbers' in d and \
+            'numbers_signature' in d:
+        msg = Protocol.shuffle_deck(d['sent_by'], b''.join([b64(n.encode('utf-8')) for n in d['numbers']]),
+                                    b64(d['numbers_signature'].encode('utf-8')))
+    elif d['command'] == Command.SIGN_DECK.value and 'sent_by' in d and 'numbers' in d and 'numbers_signature' in d:
+        msg = Protocol.sign_deck(d['sent_by'], b''.join([b64(n.encode('utf-8')) for n in d['numbers']]),
+                                 b64(d['numbers_signature'].encode('utf-8')))
+    elif d['command'] == Command.PLAYING_DECK.value and 'sent_by' in d and 'numbers' in d and \
+            'numbers_signature' in d:
+        msg = Protocol.playing_deck(d['sent_by'], b''.join([b64(n.encode('utf-8')) for n in d['numbers']]),
+                                    b64(d['numbers_signature'].encode('utf-8')))
+    elif d['command'] == Command.SYMMETRIC_KEY.value and 'sent_by' in d and 'symmetric_key' in d:
+        msg = Protocol.symmetric_key(d['sent_by'], b64(d['symmetric_key'].encode('utf-8')))
+    elif d['command'] == Command.DECKS_KEYS.value and 'sent_by' in d and 'decks_keys' in d:
+        msg = Protocol.decks_keys(d['sent_by'], [(nickname, b''.join([b64(n.encode('utf-8')) for n in numbers]),
+                                                  b64(symmetric_key.encode('utf-8')))
+                                                 for nickname, numbers, symmetric_key in d['decks_keys']])
+    elif d['command'] == Command.WINNER.value and 'sent_by' in d and 'nicknames' in d:
+        msg = Protocol.winner(d['sent_by'], d['nicknames'])
+    elif d['command'] == Command.REQUEST_LOG.value and 'sent_by' in d:
+        msg = Protocol.request_log(d['sent_by'], d.get('offset', 0), d.get('limit', 0), d.get('first', 0),
+                                   d.get('last', 0), d.get('filter_command', ''), d.get('filter_nickname', ''))
+    elif d['command'] == Command.REQUEST_USERS.value and 'sent_by' in d:
+        msg = Protocol.request_users(d['sent_by'])
+    elif d['command'] == Command.REQUEST_DISQUALIFY.value and 'sent_by' in d and 'nickname' in d and 'reason' in d:
+        msg = Protocol.request_disqualify(d['sent_by'], d['nickname'], d['reason'])
+    elif d['command'] == Command.COMMIT_BUNDLE.value and 'sent_by' in d and 'commits' in d:
+        msg = Protocol.commit_bundle(d['sent_by'], [(nickname, numbers, b64(numbers_signature.encode('utf-8')))
+                                                    for nickname, numbers, numbers_signature in d['commits']])
+    elif d['command'] == Command.RESUME.value and 'sent_by' in d and 'nickname' in d and 'ticket' in d and \
+            'ticket_signature' in d and 'received' in d:
+        msg = Protocol.resume(d['sent_by'], d['nickname'], b64(d['ticket'].encode('utf-8')),
+                              b64(d['ticket_signature'].encode('utf-8')), d['received'], d.get('room', 'default'))
+    else:
+        raise ProtocolBadFormat(m)
+    return msg
+
+
+def measure_chain(msg: Message, repeat: int) -> float:
+    """Returns the best decoding time (in ms) of the JSON body of a message with the baseline if/elif chain."""
+    m = Protocol.serialize(msg, Codec.JSON)
+    assert repr(chain_decode(m)) == repr(Protocol.decode(m, Codec.JSON))
+    t_dec = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        chain_decode(m)
+        t_dec = min(t_dec, time.perf_counter() - t0)
+    return t_dec * 1000
+
+
+def measure(msg: Message, codec: Codec, repeat: int) -> (int, float, float):
+    """Returns the size of the body and the best encoding and decoding times (in ms)."""
+    t_enc, t_dec = float('inf'), float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        m = Protocol.serialize(msg, codec)
+        t1 = time.perf_counter()
+        Protocol.decode(m, codec)
+        t2 = time.perf_counter()
+        t_enc, t_dec = min(t_enc, t1 - t0), min(t_dec, t2 - t1)
+    # Frame: flag + length + signature + body
+    return 1 + 4 + 256 + len(m), t_enc * 1000, t_dec * 1000
+
+
+def allocated(msg: Message, codec: Codec) -> int:
+    """Returns the peak memory (in bytes) allocated to decode a message."""
+    m = Protocol.serialize(msg, codec)
+    tracemalloc.start()
+    Protocol.decode(m, codec)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@click.command()
+@click.option('-N',        'sizes',   type=int, multiple=True, default=[100, 10_000, 100_000], help='Sizes of the deck')
+@click.option('--players', type=int,  default=4, help='Number of players in the game')
+@click.option('--repeat',  type=int,  default=5, help='Repetitions of each measurement (best is reported)')
+@click.option('--alloc',   is_flag=True, help='Also report the memory allocated to decode each message')
+def main(sizes, players, repeat, alloc):
+    print(f'{"N":>7} | {"command":18} | {"json B":>10} | {"bin B":>10} | {"ratio":>5} | '
+          f'{"json enc":>9} | {"bin enc":>9} | {"chain dec":>9} | {"json dec":>9} | {"speedup":>7} | {"bin dec":>9}'
+          + (f' | {"json alloc":>10} | {"bin alloc":>10}' if alloc else ''))
+    for n in sizes:
+        for msg in samples(n, players):
+            j_len, j_enc, j_dec = measure(msg, Codec.JSON, repeat)
+            b_len, b_enc, b_dec = measure(msg, Codec.BINARY, repeat)
+            c_dec = measure_chain(msg, repeat)
+            print(f'{n:7} | {msg.command.value:18} | {j_len:10} | {b_len:10} | {b_len / j_len:5.2f} | '
+                  f'{j_enc:7.3f}ms | {b_enc:7.3f}ms | {c_dec:7.3f}ms | {j_dec:7.3f}ms | {c_dec / j_dec:6.2f}x | '
+                  f'{b_dec:7.3f}ms'
+                  + (f' | {allocated(msg, Codec.JSON):9}B | {allocated(msg, Codec.BINARY):9}B' if alloc else ''))
+
+
+if __name__ == '__main__':
+    main()
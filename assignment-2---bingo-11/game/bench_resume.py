@@ -0,0 +1,136 @@
+import contextlib
+import os
+import queue
+import random
+import socket
+import sys
+import threading
+import time
+
+import click
+
+from bench_game import percentiles
+from src.caller import Caller
+from src.player import Player
+from src.playing_area import PlayingArea
+from src.protocol import *
+
+
+class BenchCaller(Caller):
+    """Caller starting each game as soon as every player is in the room."""
+
+    START_DELAY = 0
+
+
+class BenchPlayer(Player):
+    """Player reporting when it is back in the game after losing its connection."""
+
+    def __init__(self, *args, rejoined: queue.Queue):
+        super().__init__(*args)
+        self.rejoined = rejoined
+
+    def resume(self) -> bool:
+        resumed = super().resume()
+        self.rejoined.put((self.nickname, time.perf_counter(), resumed))
+        return resumed
+
+
+def start(f, *args) -> threading.Thread:
+    t = threading.Thread(target=f, args=args, daemon=True)
+    t.start()
+    return t
+
+
+def drops(n, players, n_drops, interval, grace, timeout, seed) -> dict:
+    """Plays while the connection of a random player is dropped every interval, returning the latency of each
+    reconnection and the games finished and aborted meanwhile.
+
+    Without a grace window (no tickets) a dropped player leaves and joins again as a new player, with a new key pair
+    and the signature of the caller, as a player restarted after losing its connection would.
+    """
+    pa = PlayingArea(n, 'localhost', 0, False, resume_grace=grace)
+    start(pa.run)
+    port = pa.sock.getsockname()[1]
+    rng = random.Random(seed)
+    rejoined = queue.Queue()
+    new_player = lambda nickname: BenchPlayer(n, 'localhost', port, nickname, 0.0, False, rejoined=rejoined)
+
+    caller = BenchCaller(n, 'localhost', port, 'Caller', 0.0, False, players)
+    caller.join()
+    start(caller.game_loop)
+    users = {}
+    for i in range(players):
+        p = new_player(f'Player{i}')
+        p.join()
+        users[p.nickname] = (p, start(p.game_loop))
+
+    latencies = []
+    m = pa.metrics
+    finished, aborted, t_start = m.games_finished.total(), m.games_aborted.total(), time.perf_counter()
+    for _ in range(n_drops):
+        time.sleep(interval)
+        p, t = users[rng.choice(sorted(users))]
+        t0 = time.perf_counter()
+        p.sock.shutdown(socket.SHUT_RDWR)
+        if grace:
+            nickname, t1, resumed = rejoined.get(timeout=timeout)
+            if not resumed:
+                raise RuntimeError(f'{nickname} did not resume its session.')
+        else:
+            # Leaves once its loop sees the connection lost, then joins again (retrying while a game is played)
+            t.join(timeout)
+            p = new_player(p.nickname)
+            p.join()
+            t1 = time.perf_counter()
+            users[p.nickname] = (p, start(p.game_loop))
+        latencies.append(t1 - t0)
+    elapsed = time.perf_counter() - t_start
+
+    # Users leave without resuming
+    for p, _ in list(users.values()) + [(caller, None)]:
+        p.ticket = None
+        with contextlib.suppress(OSError):
+            p.sock.shutdown(socket.SHUT_RDWR)
+    pa.sock.close()
+    return {
+        'reconnect_ms': percentiles(latencies),
+        'finished_per_hour': (m.games_finished.total() - finished) / elapsed * 3600,
+        'aborted_per_hour': (m.games_aborted.total() - aborted) / elapsed * 3600,
+    }
+
+
+@click.command()
+@click.option('-N',             type=int,   default=100,  help='Size of the deck')
+@click.option('-P',             'players', type=int, default=4, help='Number of players')
+@click.option('-D',             'n_drops', type=int, default=20, help='Connections dropped')
+@click.option('--interval',     type=float, default=0.5,  help='Seconds between drops')
+@click.option('--resume_grace', type=float, default=10.0, help='Grace window (in seconds) of the sessions')
+@click.option('--key_size',     type=click.Choice(['1024', '2048', '3072', '4096']), default='2048',
+              help='Size (in bits) of the RSA keys of the playing area and the users')
+@click.option('--timeout',      type=float, default=30.0, help='Seconds to wait for each reconnection')
+@click.option('--seed',         type=int,   default=0,    help='Seed of the choice of the players dropped')
+def main(n, players, n_drops, interval, resume_grace, key_size, timeout, seed):
+    # Signatures of every frame are as long as the keys
+    Protocol.SIGNATURE_SIZE = int(key_size) // 8
+    results = {}
+    for scheme, grace in (('rejoin', 0.0), ('resume', resume_grace)):
+        # Logs of every role are discarded
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(devnull):
+            try:
+                results[scheme] = drops(n, players, n_drops, interval, grace, timeout, seed)
+            except queue.Empty:
+                results[scheme] = None
+        if results[scheme] is None:
+            print(f'[ERROR] Players did not reconnect in {timeout} seconds ({scheme}).')
+            sys.exit(1)
+
+    print(f'{"scheme":>6} | {"p50":>9} | {"p90":>9} | {"p99":>9} | {"finished/h":>10} | {"aborted/h":>10}')
+    for scheme, r in results.items():
+        p = r['reconnect_ms']
+        print(f'{scheme:>6} | {p["p50"]:7.1f}ms | {p["p90"]:7.1f}ms | {p["p99"]:7.1f}ms | '
+              f'{r["finished_per_hour"]:10.0f} | {r["aborted_per_hour"]:10.0f}')
+
+
+if __name__ == '__main__':
+    main()
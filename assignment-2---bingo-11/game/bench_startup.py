@@ -0,0 +1,90 @@
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import click
+
+from src.keychain import KeyChain, KeyStore
+from src.logger import Logger
+from src.player import Player
+from src.protocol import Protocol
+
+IMPORT = '''
+import sys, time
+t0 = time.perf_counter()
+import src.player
+print(time.perf_counter() - t0, 'PyKCS11' in sys.modules, 'cryptography.x509' in sys.modules)
+'''
+
+
+def measure(f, repeat: int) -> float:
+    """Returns the mean time (in ms) of a call."""
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def measure_import(repeat: int) -> tuple[float, bool]:
+    """Returns the best time (in ms) of importing a player in a new interpreter and whether it loads PKCS#11 or x509."""
+    best, eager = float('inf'), False
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', IMPORT], capture_output=True, text=True, check=True).stdout.split()
+        best = min(best, float(out[0]) * 1000)
+        eager = eager or 'True' in out[1:]
+    return best, eager
+
+
+@click.command()
+@click.option('-U',         'users', type=int, default=20, help='Players started in each measurement')
+@click.option('--key_size', 'key_sizes', type=click.Choice(['1024', '2048', '3072', '4096']), multiple=True,
+              default=['1024', '2048', '3072'], help='Sizes (in bits) of the RSA keys, can be repeated')
+@click.option('--repeat',   type=int, default=5, help='Repetitions of the import (best is reported)')
+def main(users, key_sizes, repeat):
+    t_import, eager = measure_import(repeat)
+    print(f'import: {t_import:.1f}ms ({"loads" if eager else "does not load"} PKCS#11 and x509)')
+
+    # Players connect to a socket that accepts (and keeps) every connection, without reading
+    server = socket.create_server(('localhost', 0))
+    port = server.getsockname()[1]
+    conns = []
+    threading.Thread(target=lambda: [conns.append(server.accept()[0]) for _ in iter(int, 1)], daemon=True).start()
+    players = []
+
+    # Logs of the players are discarded
+    devnull = open(os.devnull, 'w')
+    print(f'{"key size":>8} | {"generate":>10} | {"store new":>10} | {"store hit":>10} | '
+          f'{"player":>10} | {"player hit":>10}')
+    for key_size in map(int, key_sizes):
+        Protocol.SIGNATURE_SIZE = key_size // 8
+        with tempfile.TemporaryDirectory() as directory:
+            store = KeyStore(directory, b'bench')
+            kc = KeyChain(asymmetric_key_size=key_size // 8, symmetric_key_size=32)
+            kc.logger = Logger('bench.log', kc)
+            t_generate = measure(kc.generate_asymmetric, users)
+
+            # Startup of a player until it is connected, without and with the key store
+            start = lambda key_store: players.append(Player(100, 'localhost', port, f'Player{len(players) % users}',
+                                                            0.0, False, key_store=key_store))
+            with contextlib.redirect_stdout(devnull):
+                # Every key pair is generated and stored, then loaded
+                nicknames = iter(range(users))
+                t_new = measure(lambda: kc.load_asymmetric(store, f'Player{next(nicknames)}'), users)
+                nicknames = iter(range(users))
+                t_hit = measure(lambda: kc.load_asymmetric(store, f'Player{next(nicknames)}'), users)
+                t_player = measure(lambda: start(None), users)
+                t_player_hit = measure(lambda: start(store), users)
+            for p in players:
+                p.sock.close()
+            players.clear()
+        print(f'{key_size:8} | {t_generate:8.2f}ms | {t_new:8.2f}ms | {t_hit:8.2f}ms | '
+              f'{t_player:8.2f}ms | {t_player_hit:8.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import time
+
+import click
+
+from src.card import Card
+from src.keychain import KeyChain, Suite
+from src.protocol import *
+
+
+def measure(f, repeat: int) -> float:
+    """Returns the mean time (in ms) of a call."""
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def suite(name: Suite, key_size: int, n: int, codec: Codec, repeat: int) -> dict:
+    """Times generating a key pair and signing and verifying the frame of a committed card with a suite."""
+    Protocol.SIGNATURE_SIZE = key_size // 8
+    kc = KeyChain(asymmetric_key_size=key_size // 8, symmetric_key_size=32, suite=name)
+    t_generate = measure(kc.generate_asymmetric, max(repeat // 100, 1))
+    card = Card(n)
+    card.generate_numbers()
+    numbers_signature = kc.sign(b''.join([x.to_bytes(4, 'big') for x in card.numbers]))
+    msg = Protocol.commit_card('Player0', card.numbers, numbers_signature)
+    frame = Protocol.frame(msg, kc, codec)
+    parsed_codec, signature_size = Protocol.parse_flag(frame[0])
+    sm, m = frame[5:5 + signature_size], frame[5 + signature_size:]
+    assert parsed_codec == codec and KeyChain.verify(m, sm, kc.public_key_pem)
+    return {
+        'generate': t_generate,
+        'sign': measure(lambda: Protocol.frame(msg, kc, codec), repeat),
+        'verify': measure(lambda: KeyChain.verify(m, sm, kc.public_key_pem), repeat),
+        'signature': signature_size,
+        'frame': len(frame),
+    }
+
+
+@click.command()
+@click.option('-N',         type=int, default=100, help='Size of the deck')
+@click.option('--key_size', 'key_sizes', type=click.Choice(['1024', '2048', '3072', '4096']), multiple=True,
+              default=['2048', '3072'], help='Sizes (in bits) of the RSA keys, can be repeated')
+@click.option('--codec',    type=click.Choice(['BINARY', 'JSON']), default='BINARY', help='Codec of the frames')
+@click.option('--repeat',   type=int, default=1000, help='Frames signed and verified with each suite')
+def main(n, key_sizes, codec, repeat):
+    suites = [(f'RSA-PSS-{key_size}', Suite.RSA_PSS, int(key_size)) for key_size in key_sizes]
+    suites.append(('Ed25519', Suite.ED25519, 2048))
+
+    print(f'{"suite":>12} | {"generate":>10} | {"sign":>9} | {"verify":>9} | {"signs/s":>8} | {"verifies/s":>10} | '
+          f'{"signature":>9} | {"frame":>6}')
+    for label, name, key_size in suites:
+        r = suite(name, key_size, n, Codec[codec], repeat)
+        print(f'{label:>12} | {r["generate"]:8.2f}ms | {r["sign"]:7.3f}ms | {r["verify"]:7.3f}ms | '
+              f'{1000 / r["sign"]:8.0f} | {1000 / r["verify"]:10.0f} | {r["signature"]:8}B | {r["frame"]:5}B')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import tempfile
+import time
+
+import click
+
+from src.keychain import KeyChain
+from src.logger import Logger
+from src.logverify import LogVerifier
+
+
+def generate(fname: str, n: int, kc: KeyChain, checkpoint: int):
+    """Writes a log of n chained entries, reusing a few signed messages (signing every entry would take longer than verifying)."""
+    messages = [f'[PROTO] Received COMMIT_CARD message from Player{i}.' for i in range(100)]
+    signatures = [kc.sign(bytes(msg, 'utf-8')).hex() for msg in messages]
+    with open(fname, 'wb') as f:
+        last = Logger.CHECKPOINT_HEADER if checkpoint else Logger.HEADER
+        f.write(bytes(last + '\n', 'utf-8'))
+        for seq in range(1, n + 1):
+            hash_prev = hashlib.sha256(last.encode()).hexdigest()
+            if checkpoint and seq % (checkpoint + 1) == 0:
+                msg, msg_sign = Logger.CHECKPOINT, kc.sign(bytes(hash_prev, 'utf-8')).hex()
+            elif checkpoint:
+                msg, msg_sign = messages[seq % len(messages)], ''
+            else:
+                msg, msg_sign = messages[seq % len(messages)], signatures[seq % len(messages)]
+            last = ', '.join([str(seq), str(time.time()), hash_prev, f'"{msg}"', msg_sign])
+            f.write(bytes(last + '\n', 'utf-8'))
+
+
+@click.command()
+@click.option('-M',           'sizes',      type=int, multiple=True, default=[100_000, 1_000_000],
+              help='Entries of the log')
+@click.option('--workers',    type=int,  multiple=True, default=[1, 2, 4], help='Numbers of processes verifying')
+@click.option('--checkpoint', type=int,  default=0, help='Entries between checkpoints (0 to sign every entry)')
+def main(sizes, workers, checkpoint):
+    kc = KeyChain(asymmetric_key_size=256, symmetric_key_size=32)
+    kc.generate_asymmetric()
+
+    print(f'{"M":>9} | {"workers":>7} | {"time":>9} | {"entries/s":>10} | {"speedup":>7}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            fname = os.path.join(tmp, 'parea.log')
+            generate(fname, n, kc, checkpoint)
+            base = None
+            for w in workers:
+                verifier = LogVerifier(fname, kc.public_key_pem, w, allow_unsigned_tail=True)
+                t0 = time.perf_counter()
+                assert verifier.verify(), verifier.reason
+                elapsed = time.perf_counter() - t0
+                base = base or elapsed
+                print(f'{n:9} | {w:7} | {elapsed:8.2f}s | {n / elapsed:10.0f} | {base / elapsed:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
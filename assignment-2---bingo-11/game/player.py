@@ -1,5 +1,6 @@
 import click
 
+from src.keychain import KeyStore, KeyStoreError
 from src.player import Player
 
 
@@ -10,8 +11,26 @@ from src.player import Player
 @click.option('--nickname',   type=str,   default='Player',    help='Nickname of the player')
 @click.option('--prob_cheat', type=float, default=0.0,         help='Probability of cheating')
 @click.option('--cc',         type=bool,  default=False,       help='Use citizen card for authentication')
-def main(n, parea_addr, parea_port, nickname, prob_cheat, cc):
-    p = Player(n, parea_addr, parea_port, nickname, prob_cheat, cc)
+@click.option('--codec',      type=click.Choice(['BINARY', 'JSON']), default='BINARY', help='Preferred message codec')
+@click.option('--deck_workers', type=int, default=0, help='Processes encrypting large decks (0 to disable)')
+@click.option('--room',       type=str,   default='default',   help='Game room to join')
+@click.option('--trace',      type=str,   default='',          help='Trace file of the games (disabled if empty)')
+@click.option('--key_store',  type=str,   default='',
+              help='Directory of key pairs reused across runs, by nickname (disabled if empty)')
+@click.option('--key_store_pass', type=str, default='', envvar='KEY_STORE_PASS',
+              help='Passphrase encrypting the key store (or the KEY_STORE_PASS environment variable)')
+@click.option('--suite',      type=click.Choice(['RSA_PSS', 'ED25519']), default='RSA_PSS',
+              help='Signature suite of the key pair (and preferred suite of the playing area)')
+def main(n, parea_addr, parea_port, nickname, prob_cheat, cc, codec, deck_workers, room, trace, key_store,
+         key_store_pass, suite):
+    if key_store and not key_store_pass:
+        raise click.BadParameter('a passphrase is required to encrypt the key store', param_hint='--key_store_pass')
+    key_store = KeyStore(key_store, key_store_pass.encode('utf-8')) if key_store else None
+    try:
+        p = Player(n, parea_addr, parea_port, nickname, prob_cheat, cc, codec, deck_workers, room, trace, key_store,
+                   suite)
+    except KeyStoreError as e:
+        raise click.ClickException(str(e))
     p.run()
 
 
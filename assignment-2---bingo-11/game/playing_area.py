@@ -1,6 +1,8 @@
 import click
 
+from src.async_playing_area import AsyncPlayingArea
 from src.playing_area import PlayingArea
+from src.supervisor import Supervisor
 
 
 @click.command()
@@ -8,8 +10,45 @@ from src.playing_area import PlayingArea
 @click.option('--own_addr', type=str,  default='localhost', help='Address of the playing area')
 @click.option('--own_port', type=int,  default=5000,        help='Port of the playing area')
 @click.option('--log',      type=bool, default=True,        help='Write logs to file')
-def main(n, own_addr, own_port, log):
-    pa = PlayingArea(n, own_addr, own_port, log)
+@click.option('--mode',     type=click.Choice(['thread', 'async']), default='thread',
+              help='Serve each connection on its own thread or all on a single event loop')
+@click.option('--verify_workers', type=int, default=0,
+              help='Processes verifying signatures of received messages (0 to verify in the receiving thread)')
+@click.option('--max_frame_size', type=int, default=64 * 1024 * 1024,
+              help='Maximum size (in bytes) of a received frame')
+@click.option('--log_flush_interval', type=float, default=0.0,
+              help='Seconds between flushes of the log file (0 to flush every batch of entries)')
+@click.option('--log_fsync', type=bool, default=False, help='Sync the log file to disk on every flush')
+@click.option('--log_checkpoint', type=int, default=0,
+              help='Sign the log every this many entries instead of every entry (0 to sign every entry)')
+@click.option('--log_checkpoint_ms', type=int, default=1000,
+              help='Maximum milliseconds between checkpoints of the log (if checkpoints are enabled)')
+@click.option('--trace', type=str, default='',
+              help='Trace file of the phases of the games, in Chrome trace event format (disabled if empty)')
+@click.option('--metrics_port', type=int, default=0,
+              help='Local port serving the metrics in Prometheus text format on /metrics (0 to disable)')
+@click.option('--max_queue_size', type=int, default=64 * 1024 * 1024,
+              help='Maximum bytes queued to be sent to a user before it is disconnected for falling behind')
+@click.option('--resume_grace', type=float, default=0.0,
+              help='Seconds a player that lost its connection can resume its session with its ticket (0 to disable)')
+@click.option('--suite', type=click.Choice(['RSA_PSS', 'ED25519']), default='RSA_PSS',
+              help='Signature suite of the log and the tickets (frames are signed with the suite of each user)')
+@click.option('--workers', type=int, default=0,
+              help='Processes sharing the port, each serving its own rooms (0 to serve every room in this process)')
+@click.option('--stats_interval', type=float, default=5.0,
+              help='Seconds between reports of the counters of the workers (if there are workers)')
+def main(n, own_addr, own_port, log, mode, verify_workers, max_frame_size, log_flush_interval, log_fsync,
+         log_checkpoint, log_checkpoint_ms, trace, metrics_port, max_queue_size, resume_grace, suite,
+         workers, stats_interval):
+    args = [n, own_addr, own_port, log, verify_workers, max_frame_size, log_flush_interval, log_fsync,
+            log_checkpoint, log_checkpoint_ms, trace, metrics_port, max_queue_size, resume_grace, suite]
+    if workers:
+        Supervisor(workers, AsyncPlayingArea if mode == 'async' else PlayingArea, args, stats_interval).run()
+        return
+    if mode == 'async':
+        pa = AsyncPlayingArea(*args)
+    else:
+        pa = PlayingArea(*args)
     pa.run()
 
 
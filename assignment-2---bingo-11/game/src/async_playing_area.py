@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+
+from .playing_area import PlayingArea
+from .protocol import *
+
+
+class StreamConn:
+    """Socket-like view of an asyncio stream, so handlers can send to it as they do to a socket."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.closed = False
+
+    def fileno(self) -> int:
+        return -1 if self.closed or self.writer.is_closing() else self.writer.get_extra_info('socket').fileno()
+
+    def sendall(self, data: bytes):
+        """Queues data in the transport, which writes it when the socket is ready."""
+        self.writer.write(data)
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+class StreamOutbox:
+    """Outbound queue of a stream: the write buffer of its transport, bounded as the outboxes of the threads."""
+
+    def __init__(self, conn: StreamConn, max_size: int, on_overflow=None):
+        self.conn = conn
+        self.max_size = max_size
+        self.on_overflow = on_overflow
+
+    def put(self, parts: list[bytes]) -> bool:
+        """Queues a frame, returning whether it was queued (not if the connection is closed or too slow)."""
+        if self.conn.fileno() == -1:
+            return False
+        transport = self.conn.writer.transport
+        size = transport.get_write_buffer_size()
+        if size and size + sum(len(part) for part in parts) > self.max_size:
+            self.conn.closed = True
+            if self.on_overflow:
+                self.on_overflow()
+            # Discards the buffer, the reader of the connection handles it as any other disconnection
+            transport.abort()
+            return False
+        self.conn.writer.writelines(parts)
+        return True
+
+    def join(self, timeout: float = None) -> bool:
+        return True
+
+    def close(self):
+        """Closes the connection once every frame queued is sent (done by the transport)."""
+        self.conn.close()
+
+
+class AsyncPlayingArea(PlayingArea):
+    """Playing area serving every connection on a single asyncio event loop."""
+
+    def __init__(self, N, addr, port, log, verify_workers=0, max_frame_size=Protocol.MAX_FRAME_SIZE,
+                 log_flush_interval=0.0, log_fsync=False, log_checkpoint=0, log_checkpoint_ms=1000, trace=None,
+                 metrics_port=0, max_queue_size=Protocol.MAX_FRAME_SIZE, resume_grace=0.0, suite='RSA_PSS',
+                 router=None):
+        super().__init__(N, addr, port, log, verify_workers, max_frame_size, log_flush_interval, log_fsync,
+                         log_checkpoint, log_checkpoint_ms, trace, metrics_port, max_queue_size, resume_grace, suite,
+                         router)
+        # Connections are accepted by the event loop instead of the selector
+        self.sel.unregister(self.sock)
+        self.sock.setblocking(False)
+        self.loop = None
+
+    async def read_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Read data from connection."""
+        conn = StreamConn(writer)
+        if not self.router:
+            self.metrics.connections.inc()
+        self.metrics.active_connections.inc()
+        this_p = None # User profile of this connection
+        while True:
+            logger = this_p.room.logger if this_p else self.logger
+            try:
+                msg, m, sm = await Protocol.recv_msg_async(reader, logger, self.max_frame_size)
+            except ProtocolBadFormat:
+                # A frame that cannot be decoded ends the connection, as if the user disconnected
+                logger.log('[WARN ] Malformed frame received, closing the connection.')
+                msg = None
+            # User disconnected
+            if msg is None:
+                self.metrics.active_connections.dec()
+                self.disconnected(conn, this_p)
+                return
+            self.metrics.received(msg.command.value, 5 + len(sm) + len(m))
+            start = self.tracer.now() if self.tracer else 0
+            valid = await self.verify_async(m, sm, self.signer_key(this_p, msg))
+            this_p = self.handle(conn, this_p, msg, valid)
+            if self.tracer:
+                self.trace_message(this_p, msg, start)
+
+    def outbox(self, p) -> StreamOutbox:
+        """Outbound queue of a user, its stream already queuing (every send is done on the event loop)."""
+        if p.outbox is None:
+            p.outbox = StreamOutbox(p.conn, self.max_queue_size, lambda: self.overflowed(p))
+        return p.outbox
+
+    def later(self, delay: float, f, *args):
+        """Calls a function after some seconds, on the event loop."""
+        self.loop.call_later(delay, f, *args)
+
+    async def verify_async(self, m: bytes, sm: bytes, public_key_pem: bytes) -> bool:
+        """Verifies the signature of a message, letting other connections run while on the pool of processes."""
+        start = time.perf_counter()
+        if self.vpool:
+            valid = await asyncio.wrap_future(self.vpool.submit(m, sm, public_key_pem))
+        else:
+            valid = self.kc.verify(m, sm, public_key_pem)
+        self.verified(valid, start)
+        return valid
+
+    def adopt(self, conn: socket.socket):
+        """Serves a connection handed off by another worker (called from the thread receiving it)."""
+        asyncio.run_coroutine_threadsafe(self.serve_conn(conn), self.loop)
+
+    async def serve_conn(self, conn: socket.socket):
+        conn.setblocking(False)
+        reader, writer = await asyncio.open_connection(sock=conn)
+        await self.read_async(reader, writer)
+
+    async def route_async(self, conn: socket.socket):
+        """Sends a new connection to the worker serving its room, waiting for its join message on another thread."""
+        conn.setblocking(True)
+        if await self.loop.run_in_executor(None, self.router.route, conn):
+            await self.serve_conn(conn)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        if self.router:
+            # Accept the connections here to route them before they are wrapped in streams
+            self.router.start(self)
+            self.sock.listen(self.BACKLOG)
+            while True:
+                conn, addr = await self.loop.sock_accept(self.sock)
+                self.metrics.connections.inc()
+                self.loop.create_task(self.route_async(conn))
+        server = await asyncio.start_server(self.read_async, sock=self.sock, backlog=self.BACKLOG)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        """Playing area loop."""
+        self.logger.log('[INFO ] Playing area is running (async)...')
+
+        asyncio.run(self.serve())
@@ -8,13 +8,15 @@ from .utils import *
 
 
 class Caller(User):
+    START_DELAY = 5     # Seconds of countdown before starting a game
 
-    def __init__(self, N, parea_addr, parea_port, nickname, prob_cheat, cc, min_players):
-        super().__init__(N, parea_addr, parea_port, nickname, prob_cheat, cc)
+    def __init__(self, N, parea_addr, parea_port, nickname, prob_cheat, cc, min_players, codec='BINARY', deck_workers=0,
+                 room='default', trace=None, key_store=None, suite='RSA_PSS'):
+        super().__init__(N, parea_addr, parea_port, nickname, prob_cheat, cc, codec, deck_workers, room, trace,
+                         key_store, suite)
         self.pdeck.prob_cheat = prob_cheat
         self.min_players = min_players
         self.n_players = 0
-        self.n_commited = 0
         self.n_winners = 0
         # Thread to start game
         self.t_sgame = threading.Thread(target=self.start_game)
@@ -25,7 +27,6 @@ class Caller(User):
 
         self.logger.log('[INFO ] Creating new game...')
         self.started = False
-        self.n_commited = 0
         self.n_winners = 0
         self.card.clear_user_cards()
         self.deck.reset_numbers()
@@ -40,7 +41,7 @@ class Caller(User):
     def start_game(self):
         """Thread to start the game."""
 
-        for i in range(5, 0, -1):
+        for i in range(self.START_DELAY, 0, -1):
             self.logger.log(f'[INFO ] Game will start in {i} seconds...')
             sleep(1)
             if self.t_sgame_cancel.is_set():
@@ -48,12 +49,30 @@ class Caller(User):
                 return
         # Send game start message to playing area
         sgame_msg = Protocol.start_game(self.nickname)
-        Protocol.send_msg(self.sock, sgame_msg, self.kc, self.logger)
+        self.send(sgame_msg)
 
     def run(self):
         """Caller loop."""
         self.logger.log('[INFO ] Caller is running...')
 
+        start = self.tracer.now() if self.tracer else 0
+        self.join()
+        if self.tracer:
+            self.tracer.complete('join', 'phase', start, lane='game')
+
+        # Create a thread to run the game loop
+        t0 = threading.Thread(target=self.game_loop)
+        t0.start()
+
+        # Create a thread to receive user input
+        t1 = threading.Thread(target=self.stdin_loop)
+        t1.start()
+
+        t0.join()
+
+    def join(self):
+        """Joins the playing area as caller."""
+
         # Sign nickname and public key with citizen card
         m = bytes(repr(json.dumps({
             'nickname': self.nickname,
@@ -63,7 +82,8 @@ class Caller(User):
         cert = self.kc.get_cert_cc()
 
         # Create join message
-        join_msg = Protocol.join(self.nickname, 'CALLER', self.nickname, self.kc.public_key_pem, sm, cert)
+        join_msg = Protocol.join(self.nickname, 'CALLER', self.nickname, self.kc.public_key_pem, sm, cert,
+                                 self.codecs, self.room, self.suites)
 
         n_attempts = 0
         while True:
@@ -74,10 +94,10 @@ class Caller(User):
 
             self.logger.log('[INFO ] Attempting to join playing area...')
             # Send join message to playing area
-            Protocol.send_msg(self.sock, join_msg, self.kc, self.logger)
+            self.send(join_msg)
 
             # Receive response of join message from playing area
-            msg, m, sm = Protocol.recv_msg(self.sock, self.logger)
+            msg, m, sm = Protocol.recv_msg(self.sock, self.logger, reader=self.reader)
             if msg.command == Command.RESPONSE and msg.to_command == Command.JOIN and msg.status == 'NOK':
                 self.logger.log(f'[INFO ] {msg.message}')
                 sleep(1)
@@ -95,25 +115,16 @@ class Caller(User):
             sm = self.kc.sign(m)
             # Send response of sign user message to playing area
             resp_suser_msg = Protocol.response(self.nickname, Command.SIGN_USER, 'OK', '', (suser_msg.nickname, sm))
-            Protocol.send_msg(self.sock, resp_suser_msg, self.kc, self.logger)
+            self.send(resp_suser_msg)
 
             # Receive response to join message from playing area
-            resp_join_msg, m, sm = Protocol.recv_msg(self.sock, self.logger)
+            resp_join_msg, m, sm = Protocol.recv_msg(self.sock, self.logger, reader=self.reader)
             if resp_join_msg.to_command == Command.JOIN and resp_join_msg.status == 'OK':
                 self.logger.log(f'[INFO ] {resp_join_msg.message}')
+                self.set_codec(resp_join_msg)
                 break
             sleep(1)
 
-        # Create a thread to run the game loop
-        t0 = threading.Thread(target=self.game_loop)
-        t0.start()
-
-        # Create a thread to receive user input
-        t1 = threading.Thread(target=self.stdin_loop)
-        t1.start()
-
-        t0.join()
-
     def stdin_loop(self):
         """User input loop."""
         while True:
@@ -121,25 +132,30 @@ class Caller(User):
             if self.sock.fileno() == -1:
                 return
             self.logger.log(f'[INPUT] Requested command {cmd}')
-            if cmd == '/logs':
-                # Send request log message to playing area
-                rlog_msg = Protocol.request_log(self.nickname)
-                Protocol.send_msg(self.sock, rlog_msg, self.kc, self.logger)
+            if cmd.split()[:1] == ['/logs']:
+                options = parse_log_options(cmd.split()[1:])
+                if options is None:
+                    self.logger.log('[WARN ] Invalid options of /logs.')
+                else:
+                    # Send request log message to playing area
+                    rlog_msg = Protocol.request_log(self.nickname, **options)
+                    self.send(rlog_msg)
             if cmd == '/users':
                 # Send request users message to playing area
                 rusers_msg = Protocol.request_users(self.nickname)
-                Protocol.send_msg(self.sock, rusers_msg, self.kc, self.logger)
+                self.send(rusers_msg)
 
 
     def game_loop(self):
         """Normal game loop."""
         while True:
-            msg, m, sm = Protocol.recv_msg(self.sock, self.logger)
+            msg, m, sm = Protocol.recv_msg(self.sock, self.logger, reader=self.reader)
             # Playing area disconnected
             if msg is None:
                 self.logger.log('[INFO ] Playing area disconnected.')
                 self.sock.close()
                 return
+            start = self.tracer.now() if self.tracer else 0
 
             # Take appropriate action
             if msg.command == Command.RESPONSE:
@@ -151,8 +167,8 @@ class Caller(User):
             if msg.command == Command.DISCONNECT:
                 self.__disconnect(msg)
             if self.started:
-                if msg.command == Command.COMMIT_CARD:
-                    self.__commit_card(msg)
+                if msg.command == Command.COMMIT_BUNDLE:
+                    self.__commit_bundle(msg)
                 if msg.command == Command.SIGN_DECK:
                     self.__sign_deck(msg)
                 if msg.command == Command.DECKS_KEYS:
@@ -161,10 +177,14 @@ class Caller(User):
                     self.__winner(msg)
                 if msg.command == Command.REQUEST_DISQUALIFY:
                     self.__request_disqualify(msg)
+            if self.tracer:
+                self.trace_message(msg, start)
 
     def __response(self, resp_msg: ResponseMessage):
 
-        if resp_msg.to_command == Command.REQUEST_LOG:
+        if resp_msg.to_command == Command.REQUEST_LOG and resp_msg.status == 'NOK':
+            self.logger.log(f'[WARN ] {resp_msg.message}')
+        elif resp_msg.to_command == Command.REQUEST_LOG:
             print_log(resp_msg.data)
         elif resp_msg.to_command == Command.REQUEST_USERS:
             print_users(resp_msg.data)
@@ -180,7 +200,7 @@ class Caller(User):
         sm = self.kc.sign(m)
         # Send response of sign user message to playing area
         resp_suser_msg = Protocol.response(self.nickname, Command.SIGN_USER, 'OK', '', (suser_msg.nickname, sm))
-        Protocol.send_msg(self.sock, resp_suser_msg, self.kc, self.logger)
+        self.send(resp_suser_msg)
         self.n_players += 1
 
         # Create thread to start game if not already exists
@@ -208,57 +228,56 @@ class Caller(User):
     def __start_game(self, sgame_msg: StartGameMessage):
         self.logger.log('[INFO ] Game started!')
         self.started = True
+        self.game = sgame_msg.game
+        if self.tracer:
+            self.tracer.begin('game')
 
         # Store everyone's public key pem
         for nickname, public_key_pem in sgame_msg.public_key_pems:
             self.kc.set_user_public_key_pem(nickname, public_key_pem)
 
-    def __commit_card(self, ccard_msg: CommitCardMessage):
-
-        # Validate card
-        if self.card.validate_numbers(ccard_msg.numbers, ccard_msg.numbers_signature, self.kc,
-                                      self.kc.get_user_public_key_pem(ccard_msg.sent_by)):
-            # Store card
-            self.card.set_user_card(ccard_msg.sent_by, ccard_msg.numbers)
-            # Send response of commit card message to playing area
-            resp_msg = Protocol.response(self.nickname, Command.COMMIT_CARD, 'OK', '', (ccard_msg.sent_by,))
-            Protocol.send_msg(self.sock, resp_msg, self.kc, self.logger)
-
-            self.n_commited += 1
-            # Check if all player cards are committed
-            if self.n_commited == self.n_players:
-                # Generate the symmetric key
-                self.kc.generate_symmetric()
-                # Encrypt the numbers of the deck
-                self.deck.encrypt_numbers(self.kc)
-                # Shuffle the deck
-                self.deck.shuffle_numbers()
-                # Send shuffle deck message to playing area
-                shdeck_msg = Protocol.shuffle_deck(self.nickname, self.deck.numbers,
-                                                   self.kc.sign(b''.join(self.deck.numbers)))
-                Protocol.send_msg(self.sock, shdeck_msg, self.kc, self.logger)
-        else:
+    def __commit_bundle(self, ccbundle_msg: CommitBundleMessage):
+
+        # Validate and store the cards of every player
+        invalid = self.validate_commits(ccbundle_msg)
+        for nickname in invalid:
             # Send disqualify message to playing area
-            disq_msg = Protocol.disqualify(self.nickname, ccard_msg.sent_by, 'Invalid card.')
-            Protocol.send_msg(self.sock, disq_msg, self.kc, self.logger)
+            disq_msg = Protocol.disqualify(self.nickname, nickname, 'Invalid card.')
+            self.send(disq_msg)
+        if invalid:
+            return
+        # Send a single response of commit bundle message to playing area
+        resp_msg = Protocol.response(self.nickname, Command.COMMIT_BUNDLE, 'OK', '', ())
+        self.send(resp_msg)
+
+        # Generate the symmetric key
+        self.kc.generate_symmetric()
+        # Encrypt the numbers of the deck
+        self.deck.encrypt_numbers(self.kc)
+        # Shuffle the deck
+        self.deck.shuffle_numbers()
+        # Send shuffle deck message to playing area
+        numbers = self.deck.numbers
+        shdeck_msg = Protocol.shuffle_deck(self.nickname, numbers, self.kc.sign(numbers))
+        self.send(shdeck_msg)
 
     def __sign_deck(self, sideck_msg: SignDeckMessage):
 
         public_key_pem = self.kc.get_user_public_key_pem(sideck_msg.sent_by)
-        if not self.kc.verify(b''.join(sideck_msg.numbers), sideck_msg.numbers_signature, public_key_pem):
+        if not self.kc.verify(sideck_msg.numbers, sideck_msg.numbers_signature, public_key_pem):
             # Send disqualify message to playing area
             rdisq_msg = Protocol.disqualify(self.nickname, sideck_msg.sent_by, 'Invalid deck signature.')
-            Protocol.send_msg(self.sock, rdisq_msg, self.kc, self.logger)
+            self.send(rdisq_msg)
 
         self.pdeck.numbers = sideck_msg.numbers
-        self.pdeck.numbers_signature = self.kc.sign(b''.join(sideck_msg.numbers))
+        self.pdeck.numbers_signature = self.kc.sign(sideck_msg.numbers)
         # Send playing deck message to playing area
         pdeck_msg = Protocol.playing_deck(self.nickname, self.pdeck.numbers, self.pdeck.numbers_signature)
-        Protocol.send_msg(self.sock, pdeck_msg, self.kc, self.logger)
+        self.send(pdeck_msg)
 
         # Send symmetric key message to playing area
         skey_msg = Protocol.symmetric_key(self.nickname, self.kc.symmetric_key)
-        Protocol.send_msg(self.sock, skey_msg, self.kc, self.logger)
+        self.send(skey_msg)
 
     def __decks_keys(self, dkeys_msg: DecksKeysMessage):
 
@@ -271,7 +290,7 @@ class Caller(User):
             else:
                 # Send disqualify message to playing area
                 disq_msg = Protocol.disqualify(self.nickname, nickname, 'Invalid shuffled deck.')
-                Protocol.send_msg(self.sock, disq_msg, self.kc, self.logger)
+                self.send(disq_msg)
                 # Create a new game
                 self.new_game()
         self.logger.log(f'[INFO ] Playing deck: {self.pdeck.get_numbers_plaintext()}')
@@ -290,16 +309,18 @@ class Caller(User):
             if self.n_winners == self.n_players:
                 # Send winner message to playing area
                 winner_msg = Protocol.winner(self.nickname, self.winners)
-                Protocol.send_msg(self.sock, winner_msg, self.kc, self.logger)
+                self.send(winner_msg)
+                if self.tracer:
+                    self.tracer.end('game', 'game', 'phase', {'game': self.game}, 'game')
                 # Create a new game
                 self.new_game()
         else:
             # Send disqualify message to playing area
             disq_msg = Protocol.disqualify(self.nickname, winner_msg.sent_by, 'Invalid winners.')
-            Protocol.send_msg(self.sock, disq_msg, self.kc, self.logger)
+            self.send(disq_msg)
 
     def __request_disqualify(self, rdisq_msg: RequestDisqualifyMessage):
 
         # Send disqualify message to playing area
         disq_msg = Protocol.disqualify(self.nickname, rdisq_msg.nickname, rdisq_msg.reason)
-        Protocol.send_msg(self.sock, disq_msg, self.kc, self.logger)
+        self.send(disq_msg)
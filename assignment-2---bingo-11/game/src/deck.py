@@ -1,59 +1,125 @@
 from __future__ import annotations
 
+import multiprocessing
 import random
+import sys
 
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+# NumPy is imported when first needed (shuffling and validating decks)
 from .keychain import KeyChain
+from .winners import WinnerEngine
 
 
 class Deck:
+    SIZE = 16                   # Bytes of each number
+    PARALLEL_THRESHOLD = 1 << 16  # Numbers from which encryption is split between processes (if enabled)
+    pool = None                 # Processes shared by every deck, created when first needed
 
-    def __init__(self, N, prob_cheat=0.0, logger=None):
+    def __init__(self, N, prob_cheat=0.0, logger=None, workers=0):
         self.N = N
         self.prob_cheat = prob_cheat
         self.logger = logger
-        self.numbers = [n.to_bytes(16, 'big') for n in range(0, self.N)]
+        self.workers = workers
+        self.buffer = bytearray()  # Numbers of the deck, stored contiguously
+        self.reset_numbers()
         self.numbers_signature = None
 
+    @property
+    def numbers(self) -> bytes:
+        """All the numbers of the deck, concatenated (as they are sent and signed)."""
+        return bytes(self.buffer)
+
+    @numbers.setter
+    def numbers(self, numbers: bytes):
+        self.buffer = bytearray(numbers)
+
+    def __len__(self):
+        return len(self.buffer) // self.SIZE
+
     def reset_numbers(self):
-        self.numbers = [n.to_bytes(16, 'big') for n in range(0, self.N)]
+        # Numbers 0..N-1 in big-endian, written one byte column at a time
+        values = array('Q', range(0, self.N))
+        if sys.byteorder == 'little':
+            values.byteswap()
+        raw = values.tobytes()
+        self.buffer = bytearray(self.SIZE * self.N)
+        offset = self.SIZE - values.itemsize
+        for k in range(values.itemsize):
+            self.buffer[offset + k::self.SIZE] = raw[k::values.itemsize]
 
     def shuffle_numbers(self):
-        random.shuffle(self.numbers)
+        import numpy as np
+        # Numbers permuted as fixed-size records (seeded from random, as random.shuffle was)
+        numbers = np.frombuffer(self.buffer, f'S{self.SIZE}')
+        order = np.random.default_rng(random.getrandbits(128)).permutation(len(numbers))
+        self.buffer = bytearray(numbers[order].tobytes())
 
     def encrypt_numbers(self, kc: KeyChain):
-        self.numbers = [kc.encrypt(n) for n in self.numbers]
+        self.buffer = self.__ecb(kc.symmetric_key)
 
     def decrypt_numbers(self, kc: KeyChain, key=None):
-        self.numbers = [kc.decrypt(n, key) for n in self.numbers]
+        self.buffer = self.__ecb(kc.symmetric_key if key is None else key, decrypt=True)
 
-    def validate_numbers(self, numbers_shuffled: list[bytes]) -> bool:
-        # Check repeated numbers
-        if len(self.numbers) != len(set(numbers_shuffled)):
-            return False
+    def __ecb(self, key: bytes, decrypt=False) -> bytearray:
+        """Encrypts (or decrypts) the whole deck at once, split between processes if it is large enough."""
+        if not self.workers or len(self) < self.PARALLEL_THRESHOLD:
+            return bytearray(KeyChain.ecb(key, self.buffer, decrypt))
+        if Deck.pool is None:
+            # Started by a fork server, as users encrypt decks while other threads (the logger writer) hold locks
+            Deck.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('forkserver'))
+        step = -(-len(self) // self.workers) * self.SIZE
+        chunks = [bytes(self.buffer[i:i + step]) for i in range(0, len(self.buffer), step)]
+        return bytearray(b''.join(Deck.pool.map(KeyChain.ecb, [key] * len(chunks), chunks, [decrypt] * len(chunks))))
+
+    def validate_numbers(self, numbers_shuffled: bytes) -> bool:
+        import numpy as np
         # Check invalid size
-        if len(self.numbers) != self.N:
+        if len(self) != self.N or len(numbers_shuffled) != len(self.buffer):
+            return False
+        if not self.N:
+            return True
+        # Numbers as pairs of 64-bit words
+        shuffled = np.frombuffer(numbers_shuffled, np.uint64).reshape(-1, 2)
+        numbers = np.frombuffer(self.buffer, np.uint64).reshape(-1, 2)
+        bits = np.uint64(max(self.N - 1, 1).bit_length())
+        high, keys, words = self.__sort_keyed(np, numbers, bits)
+        if not np.any(high[1:] == high[:-1]):
+            # Numbers of the deck are distinct (so must be the shuffled ones) and sorted by their distinct keys;
+            # a number is identified by its key and its first word
+            _, shuffled_keys, shuffled_words = self.__sort_keyed(np, shuffled, bits)
+            return bool(np.array_equal(shuffled_keys, keys) and np.array_equal(shuffled_words, words))
+        # Keys shared by some numbers: sort both decks by the whole numbers
+        shuffled = shuffled[np.lexsort((shuffled[:, 1], shuffled[:, 0]))]
+        numbers = numbers[np.lexsort((numbers[:, 1], numbers[:, 0]))]
+        # Check repeated numbers
+        if np.any(np.all(shuffled[1:] == shuffled[:-1], axis=1)):
             return False
         # Check all numbers
-        for n in self.numbers:
-            if n not in numbers_shuffled:
-                return False
-        return True
+        return bool(np.array_equal(shuffled, numbers))
+
+    @staticmethod
+    def __sort_keyed(np, numbers, bits):
+        """Sorts numbers by the high bits of the XOR of their two words (a single sort, with the index of each number
+        in the low bits), returning those bits and the XOR and first word of each number, in that order."""
+        keys = numbers[:, 0] ^ numbers[:, 1]
+        order = keys >> bits << bits | np.arange(len(numbers), dtype=np.uint64)
+        order.sort()
+        index = order & ((np.uint64(1) << bits) - np.uint64(1))
+        return order >> bits, keys[index], numbers[:, 0][index]
 
     def get_numbers_plaintext(self) -> list:
-        return [int.from_bytes(n, 'big') for n in self.numbers]
+        return [int.from_bytes(self.buffer[i:i + self.SIZE], 'big') for i in range(0, len(self.buffer), self.SIZE)]
 
     def get_winners(self, user_cards: dict[str, list]) -> list[str]:
-        for n in self.get_numbers_plaintext():
-            for nickname, card_numbers in user_cards.items():
-                user_cards[nickname] = [m for m in card_numbers if m != n]
-            winners = [nickname for nickname, card_numbers in user_cards.items() if len(card_numbers) == 0]
-            if len(winners) > 0:
-                # CHEATING
-                if random.random() < self.prob_cheat:
-                    losers = [nickname for nickname in user_cards.keys() if nickname not in winners]
-                    if len(losers) > 0:
-                        i = random.randint(0, len(losers) - 1)
-                        winners = [losers[i]]
-                        self.logger.log(f'[CHEAT] CHEATING: Choosing different player {losers[i]} as winner.')
-                return winners
-        return []
+        winners = WinnerEngine(self.N, user_cards).get_winners(self.get_numbers_plaintext())
+        if len(winners) > 0:
+            # CHEATING
+            if random.random() < self.prob_cheat:
+                losers = [nickname for nickname in user_cards.keys() if nickname not in winners]
+                if len(losers) > 0:
+                    i = random.randint(0, len(losers) - 1)
+                    winners = [losers[i]]
+                    self.logger.log(f'[CHEAT] CHEATING: Choosing different player {losers[i]} as winner.')
+        return winners
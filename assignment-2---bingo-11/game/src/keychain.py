@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import hashlib
+import os
 import random
 import secrets
-import PyKCS11
+import threading
+import time
 
-from cryptography import x509
+from collections import OrderedDict
+from enum import Enum
+from urllib.parse import quote
+
+# PyKCS11 and cryptography.x509 are imported when first needed (only citizen cards use them)
 from cryptography.hazmat.backends import default_backend as db
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa, padding
 from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.hashes import SHA1, Hash
@@ -15,13 +22,113 @@ from cryptography.hazmat.primitives.hashes import SHA1, Hash
 PKCS11_LIB = '/usr/lib/x86_64-linux-gnu/pkcs11/opensc-pkcs11.so'
 
 
+class Suite(Enum):
+    """Signature algorithm of a key pair, carried in the flag byte of every frame it signs."""
+    RSA_PSS = 0     # RSA-PSS with SHA-256 (signatures as long as the key)
+    ED25519 = 1     # Ed25519 (64-byte signatures)
+
+
+class KeyCache:
+    """Bounded LRU of parsed keys, certificates and verified signatures, shared by all threads."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(*parts: bytes) -> bytes:
+        """Key of an entry, computed from the digest of each part (so parts cannot be shifted)."""
+        return b''.join(hashlib.sha256(part).digest() for part in parts)
+
+    def get(self, key, load=None):
+        """Returns the cached value of a key, loading (and caching) it on a miss if a loader is given."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        if load is None:
+            return None
+        value = load()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class KeyStoreError(Exception):
+    """Exception when a stored key pair exists but cannot be loaded."""
+
+
+class KeyStore:
+    """Directory of key pairs encrypted with a passphrase, one per nickname and key size, reused across runs."""
+
+    def __init__(self, directory: str, passphrase: bytes):
+        self.directory = directory
+        self.passphrase = passphrase
+
+    def path(self, nickname: str, kind: str) -> str:
+        return os.path.join(self.directory, f'{quote(nickname, safe="")}.{kind}.pem')
+
+    def load(self, nickname: str, kind: str):
+        """Private key of a kind (see KeyChain.key_kind) stored for a nickname, None if there is none.
+
+        A key that cannot be read or decrypted (wrong passphrase, corrupt file) raises KeyStoreError, so it is never
+        replaced by a new one.
+        """
+        path = self.path(nickname, kind)
+        try:
+            with open(path, 'rb') as f:
+                return serialization.load_pem_private_key(f.read(), self.passphrase)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            raise KeyStoreError(f'Unable to load the key pair of {nickname} from {path} (wrong passphrase or corrupt '
+                                f'file): {e}') from e
+
+    def save(self, nickname: str, kind: str, private_key):
+        """Stores the private key of a nickname, readable only by its owner."""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self.path(nickname, kind)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.BestAvailableEncryption(self.passphrase)
+            ))
+        # Replaced at once, so users with the same nickname never read a partial file
+        os.replace(tmp, path)
+
+
 class KeyChain:
+    cache = KeyCache()  # Shared by every key chain of the process
 
-    def __init__(self, asymmetric_key_size, symmetric_key_size, prob_cheat=0.0, cc=False):
-        self.asymmetric_key_size = asymmetric_key_size
+    def __init__(self, asymmetric_key_size, symmetric_key_size, prob_cheat=0.0, cc=False, suite=Suite.RSA_PSS):
+        self.suite = suite  # Signature algorithm of the key pair
+        self.asymmetric_key_size = asymmetric_key_size  # Bytes of RSA keys
         self.symmetric_key_size = symmetric_key_size
         self.prob_cheat = prob_cheat
         self.logger = None
+        self.metrics = None     # Latency of signing (if set)
         # Generated
         self.private_key = None
         self.private_key_pem = None
@@ -45,21 +152,55 @@ class KeyChain:
 
     def clear_user_public_key_pems(self):
         self.user_public_key_pems = {}
+        KeyChain.cache.clear()
 
     """Assymmetric"""
 
+    @property
+    def key_kind(self) -> str:
+        """Algorithm (and size) of the key pair, as named in key stores."""
+        return 'ed25519' if self.suite == Suite.ED25519 else str(8 * self.asymmetric_key_size)
+
     def generate_asymmetric(self):
         """Generates an assymmetric key pair to sign messages."""
-        # Generate key pair
-        self.private_key = rsa.generate_private_key(
+        if self.suite == Suite.ED25519:
+            self.set_asymmetric(ed25519.Ed25519PrivateKey.generate())
+            return
+        self.set_asymmetric(rsa.generate_private_key(
             public_exponent=65537,
             key_size=8 * self.asymmetric_key_size
-        )
+        ))
+
+    def load_asymmetric(self, store: KeyStore, nickname: str):
+        """Loads the key pair of a nickname from a key store, generating (and storing) it on the first run."""
+        private_key = store.load(nickname, self.key_kind)
+        if private_key is not None:
+            if self.suite == Suite.ED25519:
+                valid = isinstance(private_key, ed25519.Ed25519PrivateKey)
+            else:
+                valid = isinstance(private_key, rsa.RSAPrivateKey) and \
+                    private_key.key_size == 8 * self.asymmetric_key_size
+            if not valid:
+                raise KeyStoreError(f'The key pair of {nickname} in {store.path(nickname, self.key_kind)} is not a '
+                                    f'{self.key_kind} key.')
+            self.set_asymmetric(private_key)
+            self.logger.log(f'[INFO ] Loaded the key pair of {nickname} from {store.directory}.')
+            return
+        self.generate_asymmetric()
+        store.save(nickname, self.key_kind, self.private_key)
+        self.logger.log(f'[INFO ] Stored the key pair of {nickname} in {store.directory}.')
+
+    def set_asymmetric(self, private_key):
+        self.private_key = private_key
         self.public_key = self.private_key.public_key()
-        # PEM representation
+        # PEM representation (Ed25519 keys have no traditional format)
+        if self.suite == Suite.ED25519:
+            private_format = serialization.PrivateFormat.PKCS8
+        else:
+            private_format = serialization.PrivateFormat.TraditionalOpenSSL
         self.private_key_pem = self.private_key.private_bytes(
             encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            format=private_format,
             encryption_algorithm=serialization.NoEncryption()
         )
         self.public_key_pem = self.public_key.public_bytes(
@@ -68,11 +209,17 @@ class KeyChain:
         )
 
     def sign(self, m: bytes) -> bytes:
-        """Signs a message with the private key."""
-        signature = self.private_key.sign(m, padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()),
-            salt_length=padding.PSS.MAX_LENGTH
-        ), hashes.SHA256())
+        """Signs a message with the private key, with the algorithm of its suite."""
+        start = time.perf_counter()
+        if self.suite == Suite.ED25519:
+            signature = self.private_key.sign(m)
+        else:
+            signature = self.private_key.sign(m, padding.PSS(
+                mgf=padding.MGF1(hashes.SHA256()),
+                salt_length=padding.PSS.MAX_LENGTH
+            ), hashes.SHA256())
+        if self.metrics:
+            self.metrics.signatures.observe(time.perf_counter() - start, 'sign')
         # CHEATING
         if random.random() < self.prob_cheat:
             i = random.randint(0, len(signature) - 1)
@@ -82,13 +229,17 @@ class KeyChain:
 
     @classmethod
     def verify(cls, m: bytes, sm: bytes, public_key_pem: bytes) -> bool:
-        """Verifies a signature with the public key."""
-        public_key = serialization.load_pem_public_key(public_key_pem, backend=None)
+        """Verifies a signature with the public key, with the algorithm of its suite (known from the key)."""
+        public_key = cls.cache.get(('pem', KeyCache.digest(public_key_pem)),
+                                   lambda: serialization.load_pem_public_key(public_key_pem, backend=None))
         try:
-            public_key.verify(sm, m, padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ), hashes.SHA256())
+            if isinstance(public_key, ed25519.Ed25519PublicKey):
+                public_key.verify(sm, m)
+            else:
+                public_key.verify(sm, m, padding.PSS(
+                    mgf=padding.MGF1(hashes.SHA256()),
+                    salt_length=padding.PSS.MAX_LENGTH
+                ), hashes.SHA256())
             return True
         except:
             return False
@@ -103,28 +254,29 @@ class KeyChain:
         """Encrypts a message with the symmetric key."""
         if key is None:
             key = self.symmetric_key
-        cipher = Cipher(
-            algorithm=algorithms.AES(key),
-            mode=modes.ECB()
-        )
-        encryptor = cipher.encryptor()
-        return encryptor.update(m) + encryptor.finalize()
+        return KeyChain.ecb(key, m)
 
     def decrypt(self, c: bytes, key=None) -> bytes:
         """Decrypts a message with the symmetric key."""
         if key is None:
             key = self.symmetric_key
+        return KeyChain.ecb(key, c, decrypt=True)
+
+    @staticmethod
+    def ecb(key: bytes, data: bytes, decrypt=False) -> bytes:
+        """Encrypts (or decrypts) with AES-ECB any number of 16-byte blocks in a single call."""
         cipher = Cipher(
             algorithm=algorithms.AES(key),
             mode=modes.ECB()
         )
-        decryptor = cipher.decryptor()
-        return decryptor.update(c) + decryptor.finalize()
+        ctx = cipher.decryptor() if decrypt else cipher.encryptor()
+        return ctx.update(data) + ctx.finalize()
 
     """Citizen card"""
 
     def init_cc(self):
         if self.cc:
+            import PyKCS11
             pkcs11 = PyKCS11.PyKCS11Lib()
             pkcs11.load(PKCS11_LIB)
             slots = pkcs11.getSlotList(tokenPresent=True)
@@ -151,6 +303,7 @@ class KeyChain:
     def sign_cc(self, m: bytes) -> bytes:
         """Signs a message with the citizen card."""
         if self.cc:
+            import PyKCS11
             return bytes(self.session_1.sign(
                 key=self.private_key_cc,
                 data=m,
@@ -171,7 +324,14 @@ class KeyChain:
         if cert_cc_bytes == bytes(1):
             return True  # Not using citizen card
 
-        cert_cc = x509.load_der_x509_certificate(cert_cc_bytes, backend=db())
+        # Signature already verified with this certificate
+        verified_key = ('verified', KeyCache.digest(cert_cc_bytes, m, sm))
+        if cls.cache.get(verified_key):
+            return True
+
+        from cryptography import x509
+        cert_cc = cls.cache.get(('der', KeyCache.digest(cert_cc_bytes)),
+                                lambda: x509.load_der_x509_certificate(cert_cc_bytes, backend=db()))
 
         # Hash the message
         md = Hash(SHA1(), backend=db())
@@ -181,6 +341,7 @@ class KeyChain:
         public_key_cc = cert_cc.public_key()
         try:
             public_key_cc.verify(sm, digest, PKCS1v15(), SHA1())
+            cls.cache.put(verified_key, True)
             return True
         except:
             return False
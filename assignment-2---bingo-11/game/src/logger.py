@@ -1,53 +1,262 @@
+import atexit
 import hashlib
+import os
+import queue
+import re
+import struct
+import sys
 import threading
+import time
 from datetime import datetime
 
 from .keychain import KeyChain
 
 
 class Logger:
-    n_log = 1
-    last = None
-    lock = threading.Lock()
+    HEADER = 'sequence, timestamp, hash(prev_entry), text, signature'
+    CHECKPOINT_HEADER = HEADER + ', checkpoint'     # Only checkpoint entries are signed
+    CHECKPOINT = '[CHECK] Checkpoint.'
+    OFFSET = struct.Struct('>Q')    # Record of the index, with the offset of the entry of each sequence number
+    PUT_TIMEOUT = 1.0   # Seconds to wait for room in the queue before dropping an entry
 
-    def __init__(self, fname: str, kc: KeyChain, write: bool = False):
+    def __init__(self, fname: str, kc: KeyChain, write: bool = False, queue_size: int = 10000,
+                 batch_size: int = 256, flush_interval: float = 0.0, fsync: bool = False,
+                 checkpoint: int = 0, checkpoint_interval: float = 1.0):
         self.fname = fname
+        self.index_fname = f'{fname}.idx'
         self.kc = kc
         self.write = write
+        # Chain of entries of this log
+        self.n_log = 1
+        self.last = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # Seconds between flushes (0 to flush every batch)
+        self.fsync = fsync
+        # Checkpoint mode: instead of signing every entry, sign the head of the chain every
+        # checkpoint entries or checkpoint_interval seconds (0 to sign every entry)
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.unsigned = 0   # Entries since the last checkpoint
+        self.last_checkpoint = time.monotonic()
+        self.flushed = 0    # Bytes of the log file that can be read
+        self.metrics = None     # Latency of writing batches (if set)
+        # Entries waiting to be written, in the order they were logged
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0        # Entries not written (the writer fell behind or failed)
+        self.lock = threading.Lock()    # Guards the count of dropped entries (the queue is thread-safe)
+        self.failed = None      # Error that stopped the writer (entries are no longer written)
+        self.writer = None
+        if self.write:
+            self.writer = threading.Thread(target=self.__write, name='logger', daemon=True)
+            self.writer.start()
+            # Write every pending entry before exiting
+            atexit.register(self.close)
 
     def log(self, msg: str):
         """Logs a message."""
 
-        with self.lock:
-            if self.write:
-                with open(f'{self.fname}', 'a+') as f:
-                    if Logger.n_log == 1:
-                        # Clear previous log
-                        f.seek(0)
-                        f.truncate(0)
-                        # Write header
-                        Logger.last = 'sequence, timestamp, hash(prev_entry), text, signature'
-                        f.write(Logger.last + '\n')
-                    # Compute missing data
-                    hash_prev = hashlib.sha256(Logger.last.encode()).hexdigest()
-                    msg_str = f'\"{msg}\"'
-                    msg_sign = self.kc.sign(bytes(msg, 'utf-8')).hex()
-                    # Write new log entry
-                    entry = ', '.join(
-                        [str(Logger.n_log), str(datetime.timestamp(datetime.now())), hash_prev, msg_str, msg_sign])
-                    f.write(entry + '\n')
-                    # Update variables
-                    Logger.n_log += 1
-                    Logger.last = entry
-            # Print new log entry
-            print(msg)
+        if self.write:
+            # Entries are signed and chained by the writer thread (never waiting for it forever, nor holding a lock
+            # other threads or logs need while waiting)
+            queued = False
+            if self.failed is None and self.writer.is_alive():
+                try:
+                    self.queue.put((datetime.timestamp(datetime.now()), msg), timeout=self.PUT_TIMEOUT)
+                    queued = True
+                except queue.Full:
+                    pass
+            if not queued:
+                with self.lock:
+                    self.dropped += 1
+                if self.metrics:
+                    self.metrics.log_dropped.inc()
+        # Print new log entry
+        print(msg)
+
+    def __write(self):
+        """Writer thread: writes the logged messages until closed or until writing fails, which is reported (and the
+        entries logged after it dropped)."""
+
+        try:
+            self.__write_batches()
+        except Exception as e:
+            # Without its traceback, the files left open by the writer are closed
+            self.failed = e.with_traceback(None)
+            print(f'[ERROR] Failed to write the log {self.fname}, no longer writing it: {e!r}', file=sys.stderr)
+            # Keep releasing the threads waiting for a flush or for the writer to close
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                if not isinstance(item, tuple):
+                    item.set()
+
+    def __write_batches(self):
+        """Writes the logged messages to the file, in batches, with a single open file handle."""
+
+        f = None
+        index = None
+        written = 0     # Bytes written to the log file
+        dirty = False   # Entries written but not flushed
+        last_flush = time.monotonic()
+        while True:
+            # Wait for an entry (or until the next flush or checkpoint is due) and take the ones queued meanwhile
+            deadlines = []
+            if dirty:
+                deadlines.append(last_flush + self.flush_interval)
+            if self.unsigned:
+                deadlines.append(self.last_checkpoint + self.checkpoint_interval)
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while 0 < len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            waiting = []    # Flush requests and the closing request (None)
+            for item in batch:
+                if not isinstance(item, tuple):
+                    waiting.append(item)
+                    continue
+                if f is None:
+                    # Clear previous log (and its index)
+                    f = open(f'{self.fname}', 'wb')
+                    index = open(self.index_fname, 'wb')
+                    # Public key to verify the log
+                    with open(f'{self.fname}.pem', 'wb') as pem:
+                        pem.write(self.kc.public_key_pem)
+                    # Write header
+                    self.last = self.CHECKPOINT_HEADER if self.checkpoint else self.HEADER
+                    lines.append(self.last)
+                lines.append(self.__entry(*item))
+                if self.unsigned >= self.checkpoint > 0:
+                    lines.append(self.__checkpoint())
+            # Sign the entries left when their time is up or before closing
+            if self.unsigned and (None in waiting or
+                                  time.monotonic() - self.last_checkpoint >= self.checkpoint_interval):
+                lines.append(self.__checkpoint())
+            start = time.perf_counter()
+            if lines:
+                data = [bytes(line + '\n', 'utf-8') for line in lines]
+                offsets = bytearray()
+                for d in data:
+                    offsets += self.OFFSET.pack(written)
+                    written += len(d)
+                f.write(b''.join(data))
+                index.write(offsets)
+                dirty = True
+
+            # Flush (and sync) according to the policy, or when requested
+            if dirty and (waiting or time.monotonic() - last_flush >= self.flush_interval):
+                f.flush()
+                index.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                    os.fsync(index.fileno())
+                self.flushed = written
+                dirty = False
+                last_flush = time.monotonic()
+            if self.metrics and lines:
+                self.metrics.log_writes.observe(time.perf_counter() - start)
+            for request in waiting:
+                if request is None:
+                    if f is not None:
+                        f.close()
+                        index.close()
+                    return
+                request.set()
+
+    def __entry(self, timestamp: float, msg: str, signed: bool = False) -> str:
+        """Builds the next entry of the log, chained to the previous one."""
+
+        # Compute missing data
+        hash_prev = hashlib.sha256(self.last.encode()).hexdigest()
+        msg_str = f'\"{msg}\"'
+        if self.checkpoint:
+            # Checkpoints sign the head of the chain, which covers all previous entries
+            msg_sign = self.kc.sign(bytes(hash_prev, 'utf-8')).hex() if signed else ''
+            self.unsigned = 0 if signed else self.unsigned + 1
+        else:
+            msg_sign = self.kc.sign(bytes(msg, 'utf-8')).hex()
+        # Log entry
+        entry = ', '.join([str(self.n_log), str(timestamp), hash_prev, msg_str, msg_sign])
+        # Update variables
+        self.n_log += 1
+        self.last = entry
+        return entry
+
+    def __checkpoint(self) -> str:
+        """Builds a checkpoint entry, signing the head of the chain."""
+
+        self.last_checkpoint = time.monotonic()
+        return self.__entry(datetime.timestamp(datetime.now()), self.CHECKPOINT, signed=True)
+
+    def flush(self):
+        """Waits until every message logged so far is written to the file."""
+
+        if self.writer is not None and self.writer.is_alive():
+            done = threading.Event()
+            self.queue.put(done)
+            done.wait()
+
+    def close(self):
+        """Writes the pending messages and stops the writer thread."""
+
+        if self.writer is not None and self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+            # Later messages are only printed
+            self.write = False
+            atexit.unregister(self.close)
+
+    def entries(self, first: int = 0, last: int = 0):
+        """Yields the entries from sequence number first to last (0 for the last one), seeking to them through the index."""
+
+        self.flush()
+        end = self.flushed
+        if not os.path.exists(self.index_fname):
+            return
+        with open(self.index_fname, 'rb') as index:
+            index.seek(self.OFFSET.size * first)
+            record = index.read(self.OFFSET.size)
+            if len(record) < self.OFFSET.size:
+                return
+            start, = self.OFFSET.unpack(record)
+            if last > 0:
+                index.seek(self.OFFSET.size * (last + 1))
+                record = index.read(self.OFFSET.size)
+                if len(record) == self.OFFSET.size:
+                    end = min(end, self.OFFSET.unpack(record)[0])
+        with open(f'{self.fname}', 'rb') as f:
+            f.seek(start)
+            pos = start
+            for line in f:
+                pos += len(line)
+                if pos > end:
+                    return
+                yield line.decode('utf-8').rstrip('\n')
+
+    def search(self, first: int = 0, last: int = 0, command: str = '', nickname: str = ''):
+        """Yields the entries from sequence number first to last whose text mentions a command and/or a nickname."""
+
+        words = [re.compile(rf'\b{re.escape(word)}\b') for word in (command, nickname) if word]
+        for entry in self.entries(first, last):
+            # Text of the entry, between the hash of the previous entry and the signature
+            text = entry.split(', ', 3)[-1].rsplit(', ', 1)[0]
+            if all(word.search(text) for word in words):
+                yield entry
 
     def get_all(self):
         """Returns all the logs."""
 
         log = []
-        with self.lock:
-            with open(f'{self.fname}', 'r') as f:
-                for line in f:
-                    log.append(line.strip())
+        self.flush()
+        with open(f'{self.fname}', 'r') as f:
+            for line in f:
+                log.append(line.strip())
         return log
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import hashlib
+import os
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .keychain import KeyChain
+from .logger import Logger
+
+
+class LogChunk:
+    """Result of verifying a chunk of consecutive entries of a log."""
+
+    def __init__(self):
+        self.entries = 0
+        self.first_seq = None           # Sequence number of the first entry
+        self.first_hash_prev = None     # Hash of the previous entry, as found in the first entry
+        self.last_seq = None
+        self.last_hash = None           # Hash of the last entry, to be found in the next chunk
+        self.last_checkpoint = None     # Sequence number of the last checkpoint (checkpoint mode)
+        self.broken = None              # Sequence number of the first broken entry
+        self.broken_first = False       # Broken before its first entry (the one after the last of the previous chunk)
+        self.reason = None
+
+    def malformed(self, reason: str):
+        """Marks the line after the last entry verified as broken."""
+        if self.last_seq is None:
+            self.broken_first = True
+        else:
+            self.broken = self.last_seq + 1
+        self.reason = reason
+
+
+def verify_chunk(fname: str, start: int, end: int, public_key_pem: bytes, checkpoint: bool) -> LogChunk:
+    """Verifies the links and signatures of the entries between two byte offsets of a log."""
+
+    chunk = LogChunk()
+    prev_hash = None
+    with open(fname, 'rb') as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            line_start = pos
+            pos += len(line)
+            if pos > end:
+                break
+            line = line.rstrip(b'\n')
+            entry_hash = hashlib.sha256(line).hexdigest()
+            fields = line.decode('utf-8', 'replace').split(', ', 3)
+            # Header (only the first line of the log, anywhere else it would start a new chain)
+            if line_start == 0:
+                if line.decode('utf-8', 'replace') not in (Logger.HEADER, Logger.CHECKPOINT_HEADER):
+                    chunk.broken, chunk.reason = 0, 'Malformed header.'
+                    return chunk
+                chunk.last_seq, chunk.last_hash, prev_hash = 0, entry_hash, entry_hash
+                continue
+            if fields[0] == 'sequence':
+                chunk.malformed('Broken link with the previous entry (header of another log).')
+                return chunk
+            try:
+                seq = int(fields[0])
+                hash_prev = fields[2]
+                text, signature = fields[3].rsplit(', ', 1)
+                signature = bytes.fromhex(signature)
+            except (IndexError, ValueError):
+                chunk.malformed('Malformed entry.')
+                return chunk
+            chunk.entries += 1
+            if chunk.first_seq is None:
+                chunk.first_seq, chunk.first_hash_prev = seq, hash_prev
+            # Check the link with the previous entry (the one of the first entry is checked between chunks)
+            if prev_hash is not None and (seq != chunk.last_seq + 1 or hash_prev != prev_hash):
+                chunk.broken, chunk.reason = seq, 'Broken link with the previous entry.'
+                return chunk
+            # Check the signature of the entry (or of the chain, by checkpoints)
+            if checkpoint:
+                if signature:
+                    if text != f'"{Logger.CHECKPOINT}"' or not KeyChain.verify(bytes(hash_prev, 'utf-8'), signature,
+                                                                              public_key_pem):
+                        chunk.broken, chunk.reason = seq, 'Invalid checkpoint signature.'
+                        return chunk
+                    chunk.last_checkpoint = seq
+            elif not KeyChain.verify(bytes(text[1:-1], 'utf-8'), signature, public_key_pem):
+                chunk.broken, chunk.reason = seq, 'Invalid signature.'
+                return chunk
+            chunk.last_seq, chunk.last_hash, prev_hash = seq, entry_hash, entry_hash
+    return chunk
+
+
+class LogVerifier:
+    """Verifies a hash-chained log, splitting it in chunks between a pool of processes."""
+
+    def __init__(self, fname: str, public_key_pem: bytes, workers: int = None, chunk_size: int = 4 * 1024 * 1024,
+                 allow_unsigned_tail: bool = False):
+        self.fname = fname
+        self.public_key_pem = public_key_pem
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size    # Bytes of the log verified by each job
+        # Accept entries after the last checkpoint (the log of a running playing area), which are not tamper-evident:
+        # a closed log always ends with a checkpoint
+        self.allow_unsigned_tail = allow_unsigned_tail
+        # Results
+        self.entries = 0
+        self.checkpoint = False
+        self.broken = None
+        self.reason = None
+        self.unsigned = 0               # Entries after the last checkpoint (checkpoint mode)
+
+    def chunks(self):
+        """Yields the byte offsets of the chunks of the log, aligned to its lines."""
+
+        size = os.path.getsize(self.fname)
+        with open(self.fname, 'rb') as f:
+            start = 0
+            while start < size:
+                f.seek(start + self.chunk_size)
+                f.readline()
+                end = min(f.tell(), size)
+                yield start, end
+                start = end
+
+    def verify(self) -> bool:
+        """Verifies the whole log, stopping at the first broken entry."""
+
+        with open(self.fname, 'r') as f:
+            self.checkpoint = f.readline().rstrip('\n') == Logger.CHECKPOINT_HEADER
+
+        last_seq, last_hash, last_checkpoint = None, None, 0
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            chunks = self.chunks()
+            while True:
+                # Keep a few jobs per process in flight, reading the log as it is verified
+                for start, end in chunks:
+                    pending.append(executor.submit(verify_chunk, self.fname, start, end, self.public_key_pem,
+                                                   self.checkpoint))
+                    if len(pending) >= 2 * self.workers:
+                        break
+                if not pending:
+                    break
+                chunk = pending.popleft().result()
+                # Check the link between the chunks
+                if chunk.first_seq is not None and last_seq is not None and \
+                        (chunk.first_seq != last_seq + 1 or chunk.first_hash_prev != last_hash):
+                    self.broken, self.reason = chunk.first_seq, 'Broken link with the previous entry.'
+                elif chunk.broken_first:
+                    self.broken, self.reason = (last_seq or 0) + 1, chunk.reason
+                elif chunk.broken is not None:
+                    self.broken, self.reason = chunk.broken, chunk.reason
+                if self.broken is not None:
+                    for future in pending:
+                        future.cancel()
+                    return False
+                self.entries += chunk.entries
+                if chunk.last_seq is not None:
+                    last_seq, last_hash = chunk.last_seq, chunk.last_hash
+                if chunk.last_checkpoint is not None:
+                    last_checkpoint = chunk.last_checkpoint
+        if self.checkpoint and last_seq is not None:
+            self.unsigned = last_seq - last_checkpoint
+            if self.unsigned and not self.allow_unsigned_tail:
+                self.broken = last_checkpoint + 1
+                self.reason = f'The last {self.unsigned} entries are not covered by a checkpoint.'
+                return False
+        return True
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Counter:
+    """Count of events, by the values of its labels."""
+
+    TYPE = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *labels, n=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        if not values and not self.labels:
+            values[()] = 0
+        for labels, value in sorted(values.items()):
+            yield self.name, self.format_labels(labels), value
+
+    def format_labels(self, labels: tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{escape(str(value))}"' for name, value in zip(self.labels, labels)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Gauge(Counter):
+    """Value that goes up and down (or is read from a function when rendered)."""
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def dec(self, *labels, n=1):
+        self.inc(*labels, n=-n)
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, '', self.function()
+        else:
+            yield from super().samples()
+
+
+class Histogram(Counter):
+    """Distribution of observed values (such as latencies, in seconds), in cumulative buckets."""
+
+    TYPE = 'histogram'
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels, None)
+            if counts is None:
+                # Count of each bucket (and above the last one), followed by the sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def count(self, *labels) -> int:
+        """Number of values observed with the given labels."""
+        with self.lock:
+            return sum(self.values.get(labels, [0])[:-1])
+
+    def samples(self):
+        with self.lock:
+            values = {labels: list(counts) for labels, counts in self.values.items()}
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ('+Inf',), counts):
+                cumulative += n
+                yield f'{self.name}_bucket', self.format_labels(labels, f'le="{bound}"'), cumulative
+            yield f'{self.name}_sum', self.format_labels(labels), counts[-1]
+            yield f'{self.name}_count', self.format_labels(labels), cumulative
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Metrics of a process, rendered in the Prometheus text format."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.metrics = []
+        self.server = None
+
+    def add(self, metric: Counter) -> Counter:
+        metric.name = f'{self.prefix}_{metric.name}'
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.TYPE}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, addr: str, port: int):
+        """Serves the metrics on /metrics, on a thread of its own."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass    # Scrapes are not logged
+
+        self.server = ThreadingHTTPServer((addr, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+
+
+class PlayingAreaMetrics(Metrics):
+    """Metrics of the playing area."""
+
+    # Labels of the reasons of disqualifications (reasons are free text sent by peers, so only a fixed set is kept)
+    DISQUALIFY_REASONS = ('signature', 'deck', 'card', 'winner')
+
+    def __init__(self):
+        super().__init__('parea')
+        # Connections
+        self.connections = self.add(Counter('connections_total', 'Connections accepted.'))
+        self.handoffs = self.add(Counter('handoffs_total', 'Connections handed off to another worker.'))
+        self.active_connections = self.add(Gauge('active_connections', 'Connections being served.'))
+        self.outbox_overflows = self.add(Counter('outbox_overflows_total',
+                                                 'Connections closed for falling behind their outbound queue.'))
+        self.sessions = self.add(Counter('sessions_total',
+                                         'Sessions of players that lost their connection, by outcome.', ('outcome',)))
+        self.threads = self.add(Gauge('threads', 'Threads of the process.', function=threading.active_count))
+        # Messages
+        self.messages_received = self.add(Counter('messages_received_total', 'Messages received, by command.',
+                                                  ('command',)))
+        self.messages_sent = self.add(Counter('messages_sent_total', 'Messages sent, by command.', ('command',)))
+        self.bytes_received = self.add(Counter('bytes_received_total', 'Bytes of the frames received, by command.',
+                                               ('command',)))
+        self.bytes_sent = self.add(Counter('bytes_sent_total', 'Bytes of the frames sent, by command.',
+                                           ('command',)))
+        # Signatures
+        self.signatures = self.add(Histogram('signature_seconds', 'Seconds taken to sign or verify a message.',
+                                             ('operation',)))
+        self.invalid_signatures = self.add(Counter('invalid_signatures_total', 'Messages with invalid signatures.'))
+        # Games
+        self.games_started = self.add(Counter('games_started_total', 'Games started.'))
+        self.games_finished = self.add(Counter('games_finished_total', 'Games finished with winners.'))
+        self.games_aborted = self.add(Counter('games_aborted_total', 'Games ended without winners.'))
+        self.disqualifications = self.add(Counter('disqualifications_total', 'Players disqualified, by reason.',
+                                                  ('reason',)))
+        # Log
+        self.log_writes = self.add(Histogram('log_write_seconds',
+                                             'Seconds taken to write (and flush) a batch of entries of the log.'))
+        self.log_dropped = self.add(Counter('log_dropped_total',
+                                            'Entries of the log dropped (its writer fell behind or failed).'))
+
+    def received(self, command: str, size: int):
+        self.messages_received.inc(command)
+        self.bytes_received.inc(command, n=size)
+
+    def sent(self, command: str, size: int, n: int = 1):
+        self.messages_sent.inc(command, n=n)
+        self.bytes_sent.inc(command, n=size * n)
+
+    def disqualified(self, reason: str):
+        # The label is the first one named by the reason (a deck signature counts as a signature)
+        reason = str(reason).lower()
+        self.disqualifications.inc(next((label for label in self.DISQUALIFY_REASONS if label in reason), 'other'))
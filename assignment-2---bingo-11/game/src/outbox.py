@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import socket
+import threading
+from collections import deque
+
+from .protocol import Protocol
+
+
+class Outbox:
+    """Bounded queue of the frames sent to a connection, written by a thread of its own.
+
+    Senders never wait for the connection: a peer too slow to keep its queue under the limit is disconnected
+    (its connection is shut down, so its reader handles it as any other disconnection).
+    """
+
+    IDLE_TIMEOUT = 1.0  # Seconds between checks of whether the connection was closed elsewhere
+
+    def __init__(self, conn: socket.socket, max_size: int, on_overflow=None):
+        self.conn = conn
+        self.max_size = max_size    # Bytes queued (a single frame of any size is accepted if the queue is empty)
+        self.on_overflow = on_overflow
+        self.cond = threading.Condition()
+        self.frames = deque()   # Parts of each frame waiting to be sent
+        self.size = 0
+        self.writing = False
+        self.closing = False    # Close once every frame is sent
+        self.closed = False
+        self.writer = threading.Thread(target=self.write, name='outbox', daemon=True)
+        self.writer.start()
+
+    def put(self, parts: list[bytes]) -> bool:
+        """Queues a frame, returning whether it was queued (not if the connection is closed or too slow)."""
+        n = sum(len(part) for part in parts)
+        with self.cond:
+            if self.closing or self.closed:
+                return False
+            if self.size and self.size + n > self.max_size:
+                self.overflow()
+                return False
+            self.frames.append(parts)
+            self.size += n
+            self.cond.notify()
+        return True
+
+    def overflow(self):
+        self.closed = True
+        self.frames.clear()
+        self.size = 0
+        self.cond.notify_all()
+        if self.on_overflow:
+            self.on_overflow()
+        # Unblock the writer and the reader of the connection
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def write(self):
+        """Writer loop: sends the frames queued meanwhile with a single scatter-gather call."""
+        while True:
+            with self.cond:
+                while not self.frames and not self.closing and not self.closed:
+                    if not self.cond.wait(self.IDLE_TIMEOUT) and self.conn.fileno() == -1:
+                        self.closed = True
+                if self.closed or not self.frames:
+                    break
+                parts = [part for frame in self.frames for part in frame]
+                self.frames.clear()
+                self.writing = True
+            try:
+                Protocol.send_parts(self.conn, parts)
+                failed = False
+            except OSError:
+                failed = True
+            with self.cond:
+                self.closed = self.closed or failed
+                if self.closed:
+                    self.frames.clear()
+                    self.size = 0
+                else:
+                    self.size -= sum(len(part) for part in parts)
+                self.writing = False
+                self.cond.notify_all()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.closing:
+            self.conn.close()
+
+    def join(self, timeout: float = None) -> bool:
+        """Waits until every frame queued is sent, returning whether they were."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.closed or (not self.frames and not self.writing), timeout)
+
+    def close(self):
+        """Closes the connection once every frame queued is sent."""
+        with self.cond:
+            self.closing = True
+            closed = self.closed
+            self.cond.notify_all()
+        # Closed by the writer otherwise
+        if closed:
+            self.conn.close()
@@ -8,15 +8,37 @@ from .utils import *
 
 
 class Player(User):
+    RESUME_ATTEMPTS = 8     # Attempts to resume the session, waiting twice as long before each retry
+    RESUME_DELAY = 0.05     # Seconds before the first retry
 
-    def __init__(self, N, parea_addr, parea_port, nickname, prob_cheat, cc):
-        super().__init__(N, parea_addr, parea_port, nickname, prob_cheat, cc)
+    def __init__(self, N, parea_addr, parea_port, nickname, prob_cheat, cc, codec='BINARY', deck_workers=0, room='default',
+                 trace=None, key_store=None, suite='RSA_PSS'):
+        super().__init__(N, parea_addr, parea_port, nickname, prob_cheat, cc, codec, deck_workers, room, trace,
+                         key_store, suite)
         self.kc.prob_cheat = prob_cheat
 
     def run(self):
         """Player loop."""
         self.logger.log('[INFO ] Player is running...')
 
+        start = self.tracer.now() if self.tracer else 0
+        self.join()
+        if self.tracer:
+            self.tracer.complete('join', 'phase', start, lane='game')
+
+        # Create a thread to run the game loop
+        t0 = threading.Thread(target=self.game_loop)
+        t0.start()
+
+        # Create a thread to receive user input
+        t1 = threading.Thread(target=self.stdin_loop)
+        t1.start()
+
+        t0.join()
+
+    def join(self):
+        """Joins the playing area as player."""
+
         # Sign nickname and public key with citizen card
         m = bytes(repr(json.dumps({
             'nickname': self.nickname,
@@ -26,7 +48,8 @@ class Player(User):
         cert = self.kc.get_cert_cc()
 
         # Create join message
-        join_msg = Protocol.join(self.nickname, 'PLAYER', self.nickname, self.kc.public_key_pem, sm, cert)
+        join_msg = Protocol.join(self.nickname, 'PLAYER', self.nickname, self.kc.public_key_pem, sm, cert,
+                                 self.codecs, self.room, self.suites)
 
         n_attempts = 0
         while True:
@@ -37,27 +60,55 @@ class Player(User):
 
             self.logger.log('[INFO ] Attempting to join playing area...')
             # Send join message to playing area
-            Protocol.send_msg(self.sock, join_msg, self.kc, self.logger)
+            self.send(join_msg)
 
             # Receive response of join message from playing area
-            resp_join_msg, m, sm = Protocol.recv_msg(self.sock, self.logger)
+            resp_join_msg, m, sm = Protocol.recv_msg(self.sock, self.logger, reader=self.reader)
 
             self.logger.log(f'[INFO ] {resp_join_msg.message}')
             if resp_join_msg.to_command == Command.JOIN and resp_join_msg.status == 'OK':
+                self.set_codec(resp_join_msg)
+                self.set_ticket(resp_join_msg)
                 break
             else:
                 sleep(1)
                 continue
 
-        # Create a thread to run the game loop
-        t0 = threading.Thread(target=self.game_loop)
-        t0.start()
-
-        # Create a thread to receive user input
-        t1 = threading.Thread(target=self.stdin_loop)
-        t1.start()
-
-        t0.join()
+    def resume(self) -> bool:
+        """Reconnects to the playing area after losing the connection, resuming the session with its ticket."""
+        if not self.ticket:
+            return False
+        ticket, ticket_signature = self.ticket
+        for attempt in range(self.RESUME_ATTEMPTS):
+            # The playing area may not have noticed the connection was lost yet
+            if attempt:
+                sleep(self.RESUME_DELAY * 2 ** (attempt - 1))
+            self.logger.log('[INFO ] Attempting to resume session...')
+            try:
+                self.connect()
+                # Not kept to be sent again, as it is not part of the session
+                resume_msg = Protocol.resume(self.nickname, self.nickname, ticket, ticket_signature, self.received,
+                                             self.room)
+                Protocol.send_msg(self.sock, resume_msg, self.kc, self.logger, self.codec)
+                resp_msg, m, sm = Protocol.recv_msg(self.sock, self.logger, reader=self.reader)
+            except OSError:
+                continue
+            if resp_msg is None or resp_msg.command != Command.RESPONSE or resp_msg.to_command != Command.RESUME:
+                self.sock.close()
+                continue
+            self.logger.log(f'[INFO ] {resp_msg.message}')
+            if resp_msg.status != 'OK':
+                self.sock.close()
+                continue
+            # Send again the frames the playing area did not receive
+            first = self.sent - len(self.replay)
+            if resp_msg.data[0] < first:
+                self.logger.log('[ERROR] Frames sent meanwhile were lost.')
+                return False
+            for parts in list(self.replay)[resp_msg.data[0] - first:]:
+                Protocol.send_parts(self.sock, parts)
+            return True
+        return False
 
     def stdin_loop(self):
         """User input loop."""
@@ -66,24 +117,32 @@ class Player(User):
             if self.sock.fileno() == -1:
                 return
             self.logger.log(f'[INPUT] Requested command {cmd}')
-            if cmd == '/logs':
-                # Send request log message to playing area
-                rlog_msg = Protocol.request_log(self.nickname)
-                Protocol.send_msg(self.sock, rlog_msg, self.kc, self.logger)
+            if cmd.split()[:1] == ['/logs']:
+                options = parse_log_options(cmd.split()[1:])
+                if options is None:
+                    self.logger.log('[WARN ] Invalid options of /logs.')
+                else:
+                    # Send request log message to playing area
+                    rlog_msg = Protocol.request_log(self.nickname, **options)
+                    self.send(rlog_msg)
             if cmd == '/users':
                 # Send request users message to playing area
                 rusers_msg = Protocol.request_users(self.nickname)
-                Protocol.send_msg(self.sock, rusers_msg, self.kc, self.logger)
+                self.send(rusers_msg)
 
     def game_loop(self):
         """Normal game loop."""
         while True:
-            msg, m, sm = Protocol.recv_msg(self.sock, self.logger)
-            # Playing area disconnected
+            msg, m, sm = Protocol.recv_msg(self.sock, self.logger, reader=self.reader)
+            # Playing area disconnected (unless the session is resumed)
             if msg is None:
-                self.logger.log('[INFO ] Playing area disconnected.')
                 self.sock.close()
+                if self.resume():
+                    continue
+                self.logger.log('[INFO ] Playing area disconnected.')
                 return
+            self.received += 1
+            start = self.tracer.now() if self.tracer else 0
 
             # Take appropriate action
             if msg.command == Command.RESPONSE:
@@ -92,8 +151,8 @@ class Player(User):
                 self.__disconnect(msg)
             if msg.command == Command.START_GAME:
                 self.__start_game(msg)
-            if msg.command == Command.COMMIT_CARD:
-                self.__commit_card(msg)
+            if msg.command == Command.COMMIT_BUNDLE:
+                self.__commit_bundle(msg)
             if msg.command == Command.DISQUALIFY:
                 self.__disqualify(msg)
             if msg.command == Command.SHUFFLE_DECK:
@@ -104,11 +163,15 @@ class Player(User):
                 self.__decks_keys(msg)
             if msg.command == Command.WINNER:
                 self.__winner(msg)
+            if self.tracer:
+                self.trace_message(msg, start)
 
     def __response(self, resp_msg: ResponseMessage):
 
         if resp_msg.to_command == Command.JOIN:
             self.logger.log(f'[INFO ] {resp_msg.message}')
+        elif resp_msg.to_command == Command.REQUEST_LOG and resp_msg.status == 'NOK':
+            self.logger.log(f'[WARN ] {resp_msg.message}')
         elif resp_msg.to_command == Command.REQUEST_LOG:
             print_log(resp_msg.data)
         elif resp_msg.to_command == Command.REQUEST_USERS:
@@ -118,6 +181,7 @@ class Player(User):
 
         if disc_msg.nickname == self.nickname:
             self.logger.log('[INFO ] You have been disconnected.')
+            self.ticket = None
             self.sock.close()
             return
         else:
@@ -125,6 +189,9 @@ class Player(User):
 
     def __start_game(self, sgame_msg: StartGameMessage):
         self.card.clear_user_cards()
+        self.game = sgame_msg.game
+        if self.tracer:
+            self.tracer.begin('game')
 
         # Store everyone's public key pem
         for nickname, public_key_pem in sgame_msg.public_key_pems:
@@ -136,24 +203,20 @@ class Player(User):
         # Send commit card message to playing area
         ccard_msg = Protocol.commit_card(self.nickname, self.card.numbers,
                                          self.kc.sign(b''.join([n.to_bytes(4, 'big') for n in self.card.numbers])))
-        Protocol.send_msg(self.sock, ccard_msg, self.kc, self.logger)
+        self.send(ccard_msg)
         self.logger.log(f'[INFO ] Playing card: {self.card.numbers}')
 
-    def __commit_card(self, ccard_msg: CommitCardMessage):
+    def __commit_bundle(self, ccbundle_msg: CommitBundleMessage):
 
-        # Validate card
-        if self.card.validate_numbers(ccard_msg.numbers, ccard_msg.numbers_signature, self.kc,
-                                      self.kc.get_user_public_key_pem(ccard_msg.sent_by)):
-            # Store card
-            self.card.set_user_card(ccard_msg.sent_by, ccard_msg.numbers)
-            # Send response of commit card message to playing area
-            resp_msg = Protocol.response(self.nickname, Command.COMMIT_CARD, 'OK', '', (ccard_msg.sent_by,))
-            Protocol.send_msg(self.sock, resp_msg, self.kc, self.logger)
+        # Validate and store the cards
+        invalid = self.validate_commits(ccbundle_msg)
+        # Send a single response of commit bundle message to playing area
+        if invalid:
+            resp_msg = Protocol.response(self.nickname, Command.COMMIT_BUNDLE, 'NOK',
+                                         f'Invalid cards of {", ".join(invalid)}.', tuple(invalid))
         else:
-            # Send response of commit card message to playing area
-            resp_msg = Protocol.response(self.nickname, Command.COMMIT_CARD, 'NOK', 'Invalid card.',
-                                         (ccard_msg.sent_by,))
-            Protocol.send_msg(self.sock, resp_msg, self.kc, self.logger)
+            resp_msg = Protocol.response(self.nickname, Command.COMMIT_BUNDLE, 'OK', '', ())
+        self.send(resp_msg)
 
     def __disqualify(self, disq_msg: DisqualifyMessage):
 
@@ -168,10 +231,10 @@ class Player(User):
 
         # Check deck signature before shuffling
         public_key_pem = self.kc.get_user_public_key_pem(shdeck_msg.sent_by)
-        if not self.kc.verify(b''.join(shdeck_msg.numbers), shdeck_msg.numbers_signature, public_key_pem):
+        if not self.kc.verify(shdeck_msg.numbers, shdeck_msg.numbers_signature, public_key_pem):
             # Send request disqualify message to playing area to disqualify user
             rdisq_msg = Protocol.request_disqualify(self.nickname, shdeck_msg.sent_by, 'Invalid deck signature.')
-            Protocol.send_msg(self.sock, rdisq_msg, self.kc, self.logger)
+            self.send(rdisq_msg)
 
         self.deck.numbers = shdeck_msg.numbers
         # Generate the symmetric key
@@ -181,13 +244,14 @@ class Player(User):
         # Shuffle the deck
         self.deck.shuffle_numbers()
         # Send shuffle deck message to playing area
-        shdeck_msg = Protocol.shuffle_deck(self.nickname, self.deck.numbers, self.kc.sign(b''.join(self.deck.numbers)))
-        Protocol.send_msg(self.sock, shdeck_msg, self.kc, self.logger)
+        numbers = self.deck.numbers
+        shdeck_msg = Protocol.shuffle_deck(self.nickname, numbers, self.kc.sign(numbers))
+        self.send(shdeck_msg)
 
     def __playing_deck(self, pdeck_msg):
 
         public_key_pem = self.kc.get_user_public_key_pem(pdeck_msg.sent_by)
-        if not self.kc.verify(b''.join(pdeck_msg.numbers), pdeck_msg.numbers_signature, public_key_pem):
+        if not self.kc.verify(pdeck_msg.numbers, pdeck_msg.numbers_signature, public_key_pem):
             self.logger.log('[WARN ] Invalid deck signature from caller.')
 
         self.pdeck.numbers = pdeck_msg.numbers
@@ -195,7 +259,7 @@ class Player(User):
 
         # Send symmetric key message to playing area
         skey_msg = Protocol.symmetric_key(self.nickname, self.kc.symmetric_key)
-        Protocol.send_msg(self.sock, skey_msg, self.kc, self.logger)
+        self.send(skey_msg)
 
     def __decks_keys(self, dkeys_msg: DecksKeysMessage):
 
@@ -214,7 +278,9 @@ class Player(User):
         self.logger.log(f'[INFO ] Computed winners: {self.winners}')
         # Send winner message to playing area
         winner_msg = Protocol.winner(self.nickname, self.winners)
-        Protocol.send_msg(self.sock, winner_msg, self.kc, self.logger)
+        self.send(winner_msg)
 
     def __winner(self, winner_msg: WinnerMessage):
         self.logger.log(f'[INFO ] Caller winners: {winner_msg.nicknames}')
+        if self.tracer:
+            self.tracer.end('game', 'game', 'phase', {'game': self.game}, 'game')
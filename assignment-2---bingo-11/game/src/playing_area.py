@@ -1,44 +1,91 @@
 from __future__ import annotations
 
+import itertools
 import json
+import os
+import re
 import selectors
 import socket
 import threading
+import time
+from collections import deque
 
-from .keychain import KeyChain
+from .keychain import KeyChain, Suite
 from .logger import Logger
+from .metrics import PlayingAreaMetrics
+from .outbox import Outbox
 from .profile import Profile
 from .protocol import *
+from .room import Room
+from .tracer import Tracer
 from .utils import *
+from .verifier import VerifyPool
 
 
 class PlayingArea:
-
-    def __init__(self, N, addr, port, log):
+    LOG_PAGE_SIZE = 500     # Entries of the log sent in each message
+    MAX_LOG_RANGE = 1 << 48     # Bound of the offset, limit and sequence numbers of a request of the log
+    DEFAULT_ROOM = 'default'
+    ROOM_NAME = re.compile(r'[A-Za-z0-9_-]{1,32}')
+    BACKLOG = 1024          # Connections waiting to be accepted
+    COUNTERS = ('connections', 'handoffs', 'messages_received', 'messages_sent', 'bytes_received', 'bytes_sent',
+                'games_started', 'games_finished')
+
+    def __init__(self, N, addr, port, log, verify_workers=0, max_frame_size=Protocol.MAX_FRAME_SIZE,
+                 log_flush_interval=0.0, log_fsync=False, log_checkpoint=0, log_checkpoint_ms=1000, trace=None,
+                 metrics_port=0, max_queue_size=Protocol.MAX_FRAME_SIZE, resume_grace=0.0, suite='RSA_PSS',
+                 router=None):
         self.N = N
         self.addr = addr
         self.port = port
+        self.max_frame_size = max_frame_size
+        self.max_queue_size = max_queue_size  # Bytes queued for a user before it is disconnected
+        self.resume_grace = resume_grace  # Seconds a player that lost its connection can resume its session
         self.nickname = 'parea'
-        self.kc = KeyChain(asymmetric_key_size=256, symmetric_key_size=32)
+        # A key pair per signature suite (frames sent to each user are signed with the suite it negotiated), the one
+        # of the given suite also signing the logs and the tickets
+        self.keychains = {s: KeyChain(asymmetric_key_size=Protocol.SIGNATURE_SIZE, symmetric_key_size=32, suite=s)
+                          for s in Suite}
+        self.kc = self.keychains[Suite[suite]]
+        # Worker of a supervisor, serving only some rooms (if set)
+        self.router = router
+        # Metrics (served on a local port, if set)
+        self.metrics = PlayingAreaMetrics()
+        for kc in self.keychains.values():
+            kc.metrics = self.metrics
+        if metrics_port:
+            self.metrics.serve('localhost', metrics_port + (self.router.index if self.router else 0))
+        # Tracing of the phases of the games (if enabled)
+        self.tracer = None
+        if trace:
+            if self.router:
+                root, ext = os.path.splitext(trace)
+                trace = f'{root}.worker{self.router.index}{ext}'
+            self.tracer = Tracer(trace, self.nickname)
+        # Verification of signatures on a pool of processes (if enabled)
+        self.vpool = VerifyPool(verify_workers) if verify_workers else None
         # Users
         self.callers = ['Caller', 'CallerJr'] # Citizens eligible to be callers
-        self.profiles = []  # Includes caller and players
-        self.plock = threading.Lock()
-        # Game
-        self.started = False
-        self.pdeck = []
-        self.pdeck_signature = None
-        self.keyed = 0
+        # Games, each with its own users and log (the default room logs to parea.log)
+        self.rooms = {}
+        self.rlock = threading.Lock()
+        self.room_logs = {}     # Logs of each room name so far (a room closed and created again gets a new log)
+        self.log_options = dict(write=log, flush_interval=log_flush_interval, fsync=log_fsync,
+                                checkpoint=log_checkpoint, checkpoint_interval=log_checkpoint_ms / 1000)
         # Logger
-        self.logger = Logger(f'{self.nickname}.log', self.kc, write=log)
-        self.kc.logger = self.logger
+        self.logger = self.get_room(self.DEFAULT_ROOM).logger
         # Config
-        self.kc.generate_asymmetric()
+        for kc in self.keychains.values():
+            kc.logger = self.logger
+            kc.generate_asymmetric()
         # Socket
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.router:
+            # Workers share the port, the kernel balancing the connections between them
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind((self.addr, self.port))
-        self.sock.listen(11)  # 11 concurrent users (1 caller + 10 players)
+        self.sock.listen(self.BACKLOG)
         # Selector
         self.sel = selectors.DefaultSelector()
         self.sel.register(self.sock, selectors.EVENT_READ, self.accept)
@@ -46,114 +93,213 @@ class PlayingArea:
     def accept(self, sock):
         """Accept new connection."""
         conn, addr = sock.accept()
+        self.metrics.connections.inc()
         # Create thread to handle user connection
         t = threading.Thread(target=self.read, args=[conn])
         t.start()
 
-    def read(self, conn: socket.socket):
+    def adopt(self, conn: socket.socket):
+        """Serves a connection handed off by another worker."""
+        t = threading.Thread(target=self.read, args=[conn, False])
+        t.start()
+
+    def read(self, conn: socket.socket, route: bool = True):
         """Read data from connection."""
+        # Send the connection to the worker serving its room
+        if route and self.router and not self.router.route(conn):
+            return
+        if conn.family in (socket.AF_INET, socket.AF_INET6):
+            # Frames are written at once, Nagle's algorithm would only delay the ones following another
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         this_p = None # User profile of this connection
+        reader = FrameReader(conn, self.max_frame_size)
+        self.metrics.active_connections.inc()
         while True:
-            if this_p:
-                conn.recv(1) # Wait for data
-                with this_p.lock:
-                    msg, m, sm = Protocol.recv_msg(conn, self.logger, consumed_flag=True)
-            else:
-                msg, m, sm = Protocol.recv_msg(conn, self.logger)
+            # Sends to this user are queued in its outbox, so reading never waits for them
+            logger = this_p.room.logger if this_p else self.logger
+            try:
+                msg, m, sm = Protocol.recv_msg(conn, logger, reader=reader)
+            except ProtocolBadFormat:
+                # A frame that cannot be decoded ends the connection, as if the user disconnected
+                logger.log('[WARN ] Malformed frame received, closing the connection.')
+                msg = None
             # User disconnected
             if msg is None:
-                if this_p:
-                    self.logger.log(f'[INFO ] User {this_p.nickname} disconnected.')
-                    # Send disconnect message to every user
-                    disc_msg = Protocol.disconnect(self.nickname, this_p.nickname)
-                    for p in self.profiles:
-                        Protocol.send_msg(p.conn, disc_msg, self.kc, self.logger)
-                    # Remove user profile
-                    self.rem_profile(this_p.nickname)
-                conn.close()
+                self.metrics.active_connections.dec()
+                self.disconnected(conn, this_p)
                 return
+            self.metrics.received(msg.command.value, 5 + len(sm) + len(m))
+            start = self.tracer.now() if self.tracer else 0
+            valid = self.verify(m, sm, self.signer_key(this_p, msg))
+            this_p = self.handle(conn, this_p, msg, valid)
+            if self.tracer:
+                self.trace_message(this_p, msg, start)
+
+    def signer_key(self, this_p: Profile | None, msg: Message) -> bytes:
+        """Public key expected to have signed a message received from a connection."""
+        if this_p and not msg.command == Command.JOIN:
+            return this_p.public_key_pem
+        if msg.command == Command.RESUME:
+            # Signed with the key of the suspended session (its ticket is checked when handled)
+            p = self.suspended_profile(msg)
+            return p.public_key_pem if p else self.kc.public_key_pem
+        return msg.public_key_pem
+
+    def verify(self, m: bytes, sm: bytes, public_key_pem: bytes) -> bool:
+        """Verifies the signature of a message, on the pool of processes if enabled."""
+        start = time.perf_counter()
+        if self.vpool:
+            valid = self.vpool.verify(m, sm, public_key_pem)
+        else:
+            valid = self.kc.verify(m, sm, public_key_pem)
+        self.verified(valid, start)
+        return valid
+
+    def verified(self, valid: bool, start: float):
+        self.metrics.signatures.observe(time.perf_counter() - start, 'verify')
+        if not valid:
+            self.metrics.invalid_signatures.inc()
+
+    def disconnected(self, conn, this_p: Profile | None):
+        """Handles the disconnection of a connection."""
+        if this_p and self.suspend(this_p):
+            return
+        if this_p:
+            self.leave(this_p)
+            self.close(this_p)
+        else:
+            conn.close()
+
+    def leave(self, p: Profile):
+        """Removes a user that disconnected, ending the game it was playing."""
+        room = p.room
+        room.logger.log(f'[INFO ] User {p.nickname} disconnected.')
+        self.end_game(room)
+        # Send disconnect message to every user
+        disc_msg = Protocol.disconnect(self.nickname, p.nickname)
+        self.broadcast(room.profiles, disc_msg)
+        # Remove user profile
+        room.rem_profile(p.nickname)
+
+    def suspend(self, p: Profile) -> bool:
+        """Keeps the session of a player that lost its connection until it resumes it or the grace window ends,
+        returning whether it was kept (only for players holding a ticket)."""
+        if not p.ticket or p.room.get_profile(p.nickname) is not p:
+            return False
+        with p.lock:
+            p.suspended = suspended = time.monotonic()
+        self.close(p)
+        p.room.logger.log(f'[INFO ] User {p.nickname} lost its connection, waiting {self.resume_grace} seconds '
+                          f'for it to resume.')
+        self.trace_begin(p.room, 'resume', p.nickname)
+        self.later(self.resume_grace, self.expire, p, suspended)
+        return True
+
+    def expire(self, p: Profile, suspended: float):
+        """Ends the grace window of a suspended session, removing the player if it did not resume it."""
+        with p.lock:
+            if p.suspended != suspended:
+                return
+            p.suspended = None
+            p.ticket = None
+        self.metrics.sessions.inc('expired')
+        self.trace_end(p.room, 'resume', p.nickname)
+        self.leave(p)
+
+    def later(self, delay: float, f, *args):
+        """Calls a function after some seconds, on a thread of its own."""
+        t = threading.Timer(delay, f, args)
+        t.daemon = True
+        t.start()
 
-            if this_p and not msg.command == Command.JOIN:
-                public_key_pem = this_p.public_key_pem
+    def suspended_profile(self, resume_msg: ResumeMessage) -> Profile | None:
+        """Profile of the suspended session a resume message refers to."""
+        with self.rlock:
+            room = self.rooms.get(resume_msg.room, None)
+        p = room.get_profile(resume_msg.nickname) if room else None
+        return p if p and p.suspended is not None else None
+
+    def handle(self, conn, this_p: Profile | None, msg: Message, valid: bool) -> Profile | None:
+        """Handles a message received (and verified) from a connection, returning the user profile of that connection."""
+        # Room of the user (users that did not join yet are in the default room, unless joining another)
+        room = this_p.room if this_p else self.rooms[self.DEFAULT_ROOM]
+        # Every frame the player sent in its session is counted (even if rejected), as the player counts them
+        if this_p and this_p.ticket:
+            this_p.received += 1
+        # Check signature
+        if not valid:
+            if this_p and this_p.is_player:
+                # Send message to caller to disqualify player
+                rdisq_msg = Protocol.request_disqualify(self.nickname, this_p.nickname, 'Invalid signature.')
+                self.send(room.get_caller(), rdisq_msg)
+            elif this_p and not this_p.is_player:
+                # Send message to caller to disconnect
+                disc_msg = Protocol.disconnect(self.nickname, this_p.nickname, 'Invalid signature.')
+                self.broadcast(room.profiles, disc_msg)
+                # Remove caller profile
+                room.rem_profile(this_p.nickname)
+                self.close(this_p)
+            elif msg.command in (Command.JOIN, Command.RESUME):
+                # Send response of join (or resume) message to user
+                resp_msg = Protocol.response(self.nickname, msg.command, 'NOK', 'Invalid signature.')
+                Protocol.send_msg(conn, resp_msg, self.kc, room.logger)
+                return this_p
             else:
-                public_key_pem = msg.public_key_pem
-
-            # Check signature
-            if not self.kc.verify(m, sm, public_key_pem):
-                if this_p and this_p.is_player:
-                    # Send message to caller to disqualify player
-                    rdisq_msg = Protocol.request_disqualify(self.nickname, this_p.nickname, 'Invalid signature.')
-                    Protocol.send_msg(self.get_caller().conn, rdisq_msg, self.kc, self.logger)
-                elif this_p and not this_p.is_player:
-                    # Send message to caller to disconnect
-                    disc_msg = Protocol.disconnect(self.nickname, this_p.nickname, 'Invalid signature.')
-                    for p in self.profiles:
-                        Protocol.send_msg(p.conn, disc_msg, self.kc, self.logger)
-                    # Remove caller profile
-                    self.rem_profile(this_p.nickname)
-                    this_p.conn.close()
-                elif msg.command == Command.JOIN:
-                    # Send response of join message to user
-                    resp_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Invalid signature.')
-                    Protocol.send_msg(conn, resp_msg, self.kc, self.logger)
-                    continue
-                else:
-                    # Disconnect players
-                    for p in self.get_players():
-                        # Send message to player to disconnect
-                        disc_msg = Protocol.disconnect(self.nickname, p.nickname, 'Invalid signature.')
-                        Protocol.send_msg(p.conn, disc_msg, self.kc, self.logger)
-                        # Remove player profile
-                        self.rem_profile(p.nickname)
-                        p.conn.close()
-                # End the game
-                self.started = False
-                continue
-
-           # Take appropriate action
-            if msg.command == Command.JOIN:
-                this_p = self.__join(conn, msg)
-            if msg.command == Command.RESPONSE:
-                self.__response(msg)
-            if msg.command == Command.START_GAME:
-                self.__start_game(msg)
-            if msg.command == Command.DISQUALIFY:
-                self.__disqualify(msg)
-            if msg.command == Command.REQUEST_LOG:
-                self.__request_log(msg)
-            if msg.command == Command.REQUEST_USERS:
-                self.__request_users(msg)
-            if self.started:
-                if msg.command == Command.COMMIT_CARD:
-                    self.__commit_card(msg)
-                if msg.command == Command.SHUFFLE_DECK:
-                    self.__shuffle_deck(msg)
-                if msg.command == Command.PLAYING_DECK:
-                    self.__playing_deck(msg)
-                if msg.command == Command.SYMMETRIC_KEY:
-                    self.__symmetric_key(msg)
-                if msg.command == Command.WINNER:
-                    self.__winner(msg)
-                if msg.command == Command.REQUEST_DISQUALIFY:
-                    self.__request_disqualify(msg)
+                # Disconnect players
+                for p in room.get_players():
+                    # Send message to player to disconnect
+                    disc_msg = Protocol.disconnect(self.nickname, p.nickname, 'Invalid signature.')
+                    self.send(p, disc_msg)
+                    # Remove player profile
+                    room.rem_profile(p.nickname)
+                    self.close(p)
+            self.end_game(room)
+            return this_p
+
+        # Take appropriate action
+        if msg.command == Command.JOIN:
+            this_p = self.__join(conn, msg)
+        if msg.command == Command.RESUME and not this_p:
+            this_p = self.__resume(conn, msg)
+        if msg.command == Command.RESPONSE:
+            self.__response(room, msg)
+        if msg.command == Command.START_GAME:
+            self.__start_game(room, msg)
+        if msg.command == Command.DISQUALIFY:
+            self.__disqualify(room, msg)
+        if msg.command == Command.REQUEST_LOG:
+            self.__request_log(room, msg)
+        if msg.command == Command.REQUEST_USERS:
+            self.__request_users(room, msg)
+        if room.started:
+            if msg.command == Command.COMMIT_CARD:
+                self.__commit_card(room, msg)
+            if msg.command == Command.SHUFFLE_DECK:
+                self.__shuffle_deck(room, msg)
+            if msg.command == Command.PLAYING_DECK:
+                self.__playing_deck(room, msg)
+            if msg.command == Command.SYMMETRIC_KEY:
+                self.__symmetric_key(room, msg)
+            if msg.command == Command.WINNER:
+                self.__winner(room, msg)
+            if msg.command == Command.REQUEST_DISQUALIFY:
+                self.__request_disqualify(room, msg)
+        return this_p
 
     def __join(self, conn, join_msg: JoinMessage) -> Profile | None:
-        is_player = join_msg.role == 'PLAYER'
-        if not is_player:
-            self.started = False
-
-        # Check if game already started
-        if self.started:
-            resp_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Game already started.')
+        # Check the name of the room
+        if not self.ROOM_NAME.fullmatch(join_msg.room):
+            resp_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Invalid room name.')
             Protocol.send_msg(conn, resp_msg, self.kc, self.logger)
             return None
-
-        # Check for users with the same nickname
-        if join_msg.nickname in [p.nickname for p in self.profiles]:
-            resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Nickname already in use.')
-            Protocol.send_msg(conn, resp_join_msg, self.kc, self.logger)
+        # Check if the room is served by this worker (its connections are routed to it)
+        if self.router and not self.router.owns(join_msg.room):
+            resp_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Room served by another worker.')
+            Protocol.send_msg(conn, resp_msg, self.kc, self.logger)
             return None
 
+        is_player = join_msg.role == 'PLAYER'
+
         # Check if user is using a caller reseved nickname
         if is_player and join_msg.nickname in self.callers:
             resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Nickname is not permitted.')
@@ -166,18 +312,6 @@ class PlayingArea:
             Protocol.send_msg(conn, resp_join_msg, self.kc, self.logger)
             return None
 
-        # Check for already existing caller
-        if not is_player and self.get_caller():
-            resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Caller already exists.')
-            Protocol.send_msg(conn, resp_join_msg, self.kc, self.logger)
-            return None
-
-        # Check for callers
-        if is_player and not self.get_caller():
-            resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'No caller available.')
-            Protocol.send_msg(conn, resp_join_msg, self.kc, self.logger)
-            return None
-
         # Check validity of CC signature
         m = bytes(repr(json.dumps({
             'nickname': join_msg.nickname,
@@ -188,220 +322,448 @@ class PlayingArea:
             Protocol.send_msg(conn, resp_join_msg, self.kc, self.logger)
             return None
 
+        # Rooms are created by their callers only (and kept while they are being joined)
+        room = self.get_room(join_msg.room, create=not is_player, joining=True)
+        if room is None:
+            resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'No caller available.')
+            Protocol.send_msg(conn, resp_join_msg, self.kc, self.logger)
+            return None
+        try:
+            return self.__enter(conn, join_msg, room, is_player)
+        finally:
+            self.joined(room)
+
+    def __enter(self, conn, join_msg: JoinMessage, room: Room, is_player: bool) -> Profile | None:
+        if not is_player:
+            self.end_game(room)
+
+        # Check if game already started
+        if room.started:
+            resp_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Game already started.')
+            Protocol.send_msg(conn, resp_msg, self.kc, room.logger)
+            return None
+
+        # Check for users with the same nickname
+        if join_msg.nickname in room.registry:
+            resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Nickname already in use.')
+            Protocol.send_msg(conn, resp_join_msg, self.kc, room.logger)
+            return None
+
+        # Check for already existing caller
+        if not is_player and room.get_caller():
+            resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Caller already exists.')
+            Protocol.send_msg(conn, resp_join_msg, self.kc, room.logger)
+            return None
+
+        # Check for callers
+        if is_player and not room.get_caller():
+            resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'No caller available.')
+            Protocol.send_msg(conn, resp_join_msg, self.kc, room.logger)
+            return None
+
         # Create user profile
         p = Profile(join_msg.nickname, join_msg.public_key_pem, join_msg.cc_signature, join_msg.cc_certificate, conn,
-                    is_player)
+                    is_player, room.next_sequence() if is_player else 0, room)
+        p.codec = Protocol.negotiate(join_msg.codecs)
+        p.suite = Protocol.negotiate_suite(join_msg.suites)
 
         # Assign user profile to caller or player
         if not is_player:
-            self.set_caller(p)
+            room.set_caller(p)
         else:
-            self.add_profile(p)
+            room.add_profile(p)
 
+        self.trace_begin(room, 'join', p.nickname)
         # Send sign user message to caller
         suser_msg = Protocol.sign_user(self.nickname, p.sequence, p.nickname, p.public_key_pem)
-        with self.get_caller().lock:
-            Protocol.send_msg(self.get_caller().conn, suser_msg, self.kc, self.logger)
+        self.send(room.get_caller(), suser_msg)
         return p
 
-    def __response(self, resp_msg: ResponseMessage):
+    def __response(self, room: Room, resp_msg: ResponseMessage):
 
         if resp_msg.to_command == Command.SIGN_USER:
-            p = self.get_profile(resp_msg.data[0])
+            p = room.get_profile(resp_msg.data[0])
             if resp_msg.status == 'OK':
                 # Save the signature in profile
                 p.signature = resp_msg.data[1]
+                # Issue a ticket to resume the session (if enabled), counting the frames from the response on
+                data = (p.codec.name, p.suite.name)
+                if self.resume_grace and p.is_player:
+                    data += self.issue_ticket(p)
                 # Send response of join message to user
                 resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'OK',
-                                                  f'Joined with nickname {p.nickname}.')
-                with p.lock:
-                    Protocol.send_msg(p.conn, resp_join_msg, self.kc, self.logger)
-                self.logger.log(f'[INFO ] User {p.nickname} joined.')
+                                                  f'Joined with nickname {p.nickname}.', data)
+                self.send(p, resp_join_msg)
+                self.trace_end(room, 'join', p.nickname)
+                room.logger.log(f'[INFO ] User {p.nickname} joined.')
                 # Resign player profiles if it was a new caller that joined
                 if not p.is_player:
-                    for pl in self.get_players():
+                    for pl in room.get_players():
                         suser_msg = Protocol.sign_user(self.nickname, pl.sequence, pl.nickname, pl.public_key_pem)
-                        with pl.lock:
-                            Protocol.send_msg(p.conn, suser_msg, self.kc, self.logger)
+                        self.send(p, suser_msg)
             else:
                 # Send response of join message to user
                 resp_join_msg = Protocol.response(self.nickname, Command.JOIN, 'NOK', 'Unable to sign user.')
-                with p.lock:
-                    Protocol.send_msg(p.conn, resp_join_msg, self.kc, self.logger)
+                self.send(p, resp_join_msg)
                 # Remove the profile
-                self.rem_profile(p.nickname)
-        elif resp_msg.to_command == Command.COMMIT_CARD:
+                room.rem_profile(p.nickname)
+        elif resp_msg.to_command == Command.COMMIT_BUNDLE:
             if resp_msg.status == 'NOK':
-                self.logger.log(f'[INFO ] {resp_msg.message}')
+                room.logger.log(f'[INFO ] {resp_msg.message}')
+
+    def issue_ticket(self, p: Profile) -> tuple[bytes, bytes]:
+        """Issues the ticket of a session, bound to the nickname and public key of its user, and its signature."""
+        ticket = bytes(json.dumps({
+            'room': p.room.name,
+            'sequence': p.sequence,
+            'nickname': p.nickname,
+            'public_key_pem': p.public_key_pem,
+            'issued': time.time(),
+        }, sort_keys=True, default=bytes_to_str), 'utf-8')
+        with p.lock:
+            p.ticket = ticket
+            p.replay = deque(maxlen=Protocol.REPLAY_FRAMES)
+            p.sent = p.received = 0
+        return ticket, self.kc.sign(ticket)
+
+    def __resume(self, conn, resume_msg: ResumeMessage) -> Profile | None:
+        p = self.suspended_profile(resume_msg)
+        if p is None or resume_msg.ticket != p.ticket or \
+                not self.kc.verify(resume_msg.ticket, resume_msg.ticket_signature, self.kc.public_key_pem):
+            resp_msg = Protocol.response(self.nickname, Command.RESUME, 'NOK', 'Invalid ticket or session expired.')
+            Protocol.send_msg(conn, resp_msg, self.kc, self.logger)
+            return None
+        room = p.room
+        resp_msg = Protocol.response(self.nickname, Command.RESUME, 'OK', f'Resumed session of {p.nickname}.',
+                                     (p.received,))
+        resp_parts = Protocol.frame_parts(resp_msg, self.keychains[p.suite], p.codec)
+        with p.lock:
+            # Frames sent since the last one the player received (the rest are no longer kept)
+            first = p.sent - len(p.replay)
+            if p.suspended is None or not first <= resume_msg.received <= p.sent:
+                p = None
+            else:
+                p.conn = conn
+                p.outbox = None
+                p.suspended = None
+                outbox = self.outbox(p)
+                outbox.put(resp_parts)
+                for parts in list(p.replay)[resume_msg.received - first:]:
+                    outbox.put(parts)
+        if p is None:
+            resp_msg = Protocol.response(self.nickname, Command.RESUME, 'NOK', 'Frames sent meanwhile were lost.')
+            Protocol.send_msg(conn, resp_msg, self.kc, room.logger)
+            return None
+        self.metrics.sessions.inc('resumed')
+        self.trace_end(room, 'resume', p.nickname)
+        room.logger.log(f'[INFO ] User {p.nickname} resumed its session.')
+        return p
 
-    def __start_game(self, sgame_msg: StartGameMessage):
-        self.started = True
-        self.pdeck = []
-        self.pdeck_signature = None
-        self.keyed = 0
+    def __start_game(self, room: Room, sgame_msg: StartGameMessage):
+        room.started = True
+        room.game += 1
+        self.metrics.games_started.inc()
+        room.pdeck = b''
+        room.pdeck_signature = None
+        room.keyed = 0
+        room.commits = {}
+        room.uncommitted = {p.nickname for p in room.get_players()}
+        self.trace_begin(room, 'game')
+        self.trace_begin(room, 'cards')
+        for p in room.get_players():
+            self.trace_begin(room, 'commit', p.nickname)
 
         # Send start game message to all users with everyone's public key pem
-        sgame_msg = Protocol.start_game(self.nickname, [(p.nickname, p.public_key_pem) for p in self.profiles])
-        for p in self.profiles:
-            with p.lock:
-                Protocol.send_msg(p.conn, sgame_msg, self.kc, self.logger)
-        self.logger.log(f'[INFO ] Game started with players {[p.nickname for p in self.get_players()]}.')
-
-    def __commit_card(self, ccard_msg: CommitCardMessage):
-        self.logger.log(f'[INFO ] Player {ccard_msg.sent_by} commited card {ccard_msg.numbers}.')
-
-        # Forward commit card message to caller and other players
-        for p in [self.get_caller()] + [pl for pl in self.get_players() if pl.nickname != ccard_msg.sent_by]:
-            with p.lock:
-                Protocol.send_msg(p.conn, ccard_msg, self.kc, self.logger)
-
-    def __disqualify(self, disq_msg: DisqualifyMessage):
-        self.logger.log(f'[INFO ] Player {disq_msg.nickname} disqualified.')
+        sgame_msg = Protocol.start_game(self.nickname, [(p.nickname, p.public_key_pem) for p in room.profiles],
+                                        room.game)
+        self.broadcast(room.profiles, sgame_msg)
+        room.logger.log(f'[INFO ] Game started with players {[p.nickname for p in room.get_players()]}.')
+
+    def __commit_card(self, room: Room, ccard_msg: CommitCardMessage):
+        room.logger.log(f'[INFO ] Player {ccard_msg.sent_by} commited card {ccard_msg.numbers}.')
+        self.trace_end(room, 'commit', ccard_msg.sent_by)
+        # Cards committed twice (or by players that joined after the game started) are ignored
+        if ccard_msg.sent_by not in room.uncommitted:
+            return
+
+        # Collect the cards, sent to the caller and every player in a single message once every player committed
+        room.commits[ccard_msg.sent_by] = (ccard_msg.numbers, ccard_msg.numbers_signature)
+        room.uncommitted.discard(ccard_msg.sent_by)
+        if not room.uncommitted:
+            ccbundle_msg = Protocol.commit_bundle(self.nickname, [(nickname, numbers, numbers_signature)
+                                                                  for nickname, (numbers, numbers_signature)
+                                                                  in room.commits.items()])
+            self.broadcast(room.profiles, ccbundle_msg)
+
+    def __disqualify(self, room: Room, disq_msg: DisqualifyMessage):
+        room.logger.log(f'[INFO ] Player {disq_msg.nickname} disqualified.')
+        self.metrics.disqualified(disq_msg.reason)
 
         # Forward disqualify message to all players
-        for p in self.get_players():
-            with p.lock:
-                Protocol.send_msg(p.conn, disq_msg, self.kc, self.logger)
+        self.broadcast(room.get_players(), disq_msg)
         # Remove the disqualified player from the game
-        self.rem_profile(disq_msg.nickname)
-        # End the game
-        self.started = False
+        room.rem_profile(disq_msg.nickname)
+        self.end_game(room)
 
-    def __shuffle_deck(self, shdeck_msg: ShuffleDeckMessage):
-        self.logger.log(f'[INFO ] User {shdeck_msg.sent_by} shuffled deck.')
+    def __shuffle_deck(self, room: Room, shdeck_msg: ShuffleDeckMessage):
+        room.logger.log(f'[INFO ] User {shdeck_msg.sent_by} shuffled deck.')
 
         # Store deck and signature on user profile
-        p = self.get_profile(shdeck_msg.sent_by)
+        p = room.get_profile(shdeck_msg.sent_by)
         p.deck = shdeck_msg.numbers
         p.deck_signature = shdeck_msg.numbers_signature
+        if p is room.get_caller():
+            # The caller shuffles first, once every card is committed
+            self.trace_end(room, 'cards')
+            self.trace_begin(room, 'shuffle')
+        else:
+            self.trace_end(room, 'shuffle', p.nickname)
 
         # Send the deck to the next user to shuffle
-        p = self.get_profile_next(p)
+        p = room.get_profile_next(p)
         if p:
-            with p.lock:
-                Protocol.send_msg(p.conn, shdeck_msg, self.kc, self.logger)
+            self.trace_begin(room, 'shuffle', p.nickname)
+            self.send(p, shdeck_msg)
         # Send it to the caller to finally sign it
         else:
             sideck_msg = Protocol.sign_deck(shdeck_msg.sent_by, shdeck_msg.numbers, shdeck_msg.numbers_signature)
-            with self.get_caller().lock:
-                Protocol.send_msg(self.get_caller().conn, sideck_msg, self.kc, self.logger)
+            self.trace_begin(room, 'sign_deck', room.get_caller().nickname)
+            self.send(room.get_caller(), sideck_msg)
 
-    def __playing_deck(self, pdeck_msg: PlayingDeckMessage):
+    def __playing_deck(self, room: Room, pdeck_msg: PlayingDeckMessage):
 
         # Store deck and signature on playing area
-        self.pdeck = pdeck_msg.numbers
-        self.pdeck_signature = pdeck_msg.numbers_signature
+        room.pdeck = pdeck_msg.numbers
+        room.pdeck_signature = pdeck_msg.numbers_signature
+        self.trace_end(room, 'sign_deck', pdeck_msg.sent_by)
+        self.trace_end(room, 'shuffle')
+        self.trace_begin(room, 'keys')
+        for p in room.profiles:
+            self.trace_begin(room, 'key', p.nickname)
 
         # Forward playing deck message to all players
-        for p in self.get_players():
-            with p.lock:
-                Protocol.send_msg(p.conn, pdeck_msg, self.kc, self.logger)
+        self.broadcast(room.get_players(), pdeck_msg)
 
-    def __symmetric_key(self, skey_msg: SymmetricKeyMessage):
-        self.logger.log(f'[INFO ] User {skey_msg.sent_by} symmetric key: {skey_msg.symmetric_key.hex()}.')
+    def __symmetric_key(self, room: Room, skey_msg: SymmetricKeyMessage):
+        room.logger.log(f'[INFO ] User {skey_msg.sent_by} symmetric key: {skey_msg.symmetric_key.hex()}.')
 
         # Store symmetric key on user profile
-        p = self.get_profile(skey_msg.sent_by)
+        p = room.get_profile(skey_msg.sent_by)
         p.symmetric_key = skey_msg.symmetric_key
-        self.keyed += 1
+        room.keyed += 1
+        self.trace_end(room, 'key', p.nickname)
 
         # Send decks keys message if all users have sent their symmetric key
-        if self.keyed == len(self.profiles):
-            dkeys_msg = Protocol.decks_keys(self.nickname, [(p.nickname, p.deck, p.symmetric_key) for p in self.profiles])
-            for p in self.profiles:
-                with p.lock:
-                    Protocol.send_msg(p.conn, dkeys_msg, self.kc, self.logger)
+        if room.keyed == len(room.registry):
+            self.trace_end(room, 'keys')
+            self.trace_begin(room, 'winners')
+            for pl in room.get_players():
+                self.trace_begin(room, 'winner', pl.nickname)
+            dkeys_msg = Protocol.decks_keys(self.nickname, [(p.nickname, p.deck, p.symmetric_key) for p in room.profiles])
+            self.broadcast(room.profiles, dkeys_msg)
 
-    def __winner(self, winner_msg: WinnerMessage):
+    def __winner(self, room: Room, winner_msg: WinnerMessage):
 
         # Forward winner message from a player to the caller
-        if winner_msg.sent_by != self.get_caller().nickname:
-            self.logger.log(f'[INFO ] Player {winner_msg.sent_by} winners: {winner_msg.nicknames}.')
-            with self.get_caller().lock:
-                Protocol.send_msg(self.get_caller().conn, winner_msg, self.kc, self.logger)
+        if winner_msg.sent_by != room.get_caller().nickname:
+            room.logger.log(f'[INFO ] Player {winner_msg.sent_by} winners: {winner_msg.nicknames}.')
+            self.trace_end(room, 'winner', winner_msg.sent_by)
+            self.send(room.get_caller(), winner_msg)
         # Forward winner message from the caller to all players
-        elif winner_msg.sent_by == self.get_caller().nickname:
-            self.logger.log(f'[INFO ] Caller winners: {winner_msg.nicknames}.')
-            for p in self.get_players():
-                with p.lock:
-                    Protocol.send_msg(p.conn, winner_msg, self.kc, self.logger)
-            # End the game
-            self.started = False
-
-    def __request_log(self, rlog_msg: RequestLogMessage):
-        self.logger.log(f'[INFO ] User {rlog_msg.sent_by} requested log.')
-
-        # Get the log
-        log = self.logger.get_all()
-        # Send log message to user
-        p = self.get_profile(rlog_msg.sent_by)
-        log_msg = Protocol.response(rlog_msg.sent_by, Command.REQUEST_LOG, 'OK', '', tuple(log))
-        with p.lock:
-            Protocol.send_msg(p.conn, log_msg, self.kc, self.logger)
-
-    def __request_users(self, rusers_msg: RequestUsersMessage):
-        self.logger.log(f'[INFO ] User {rusers_msg.sent_by} requested users.')
+        elif winner_msg.sent_by == room.get_caller().nickname:
+            room.logger.log(f'[INFO ] Caller winners: {winner_msg.nicknames}.')
+            self.broadcast(room.get_players(), winner_msg)
+            self.trace_end(room, 'winners')
+            self.end_game(room, winners=True)
+
+    def __request_log(self, room: Room, rlog_msg: RequestLogMessage):
+        room.logger.log(f'[INFO ] User {rlog_msg.sent_by} requested log.')
+        p = room.get_profile(rlog_msg.sent_by)
+
+        # Check the range and filters requested
+        bounds = (rlog_msg.offset, rlog_msg.limit, rlog_msg.first, rlog_msg.last)
+        filters = (rlog_msg.filter_command, rlog_msg.filter_nickname)
+        if not all(type(x) is int and 0 <= x < self.MAX_LOG_RANGE for x in bounds) or \
+                not all(isinstance(x, str) for x in filters):
+            log_msg = Protocol.response(rlog_msg.sent_by, Command.REQUEST_LOG, 'NOK', 'Invalid range or filters.')
+            self.send(p, log_msg)
+            return
+
+        # Get the requested entries of the log, read through its index
+        log = room.logger.search(rlog_msg.first, rlog_msg.last, rlog_msg.filter_command, rlog_msg.filter_nickname)
+        log = itertools.islice(log, rlog_msg.offset, rlog_msg.offset + rlog_msg.limit if rlog_msg.limit else None)
+        # Send log messages to user, in pages
+        page = []
+        for entry in log:
+            page.append(entry)
+            if len(page) == self.LOG_PAGE_SIZE:
+                log_msg = Protocol.response(rlog_msg.sent_by, Command.REQUEST_LOG, 'OK', 'More entries follow.',
+                                            tuple(page))
+                self.send(p, log_msg)
+                page = []
+        log_msg = Protocol.response(rlog_msg.sent_by, Command.REQUEST_LOG, 'OK', '', tuple(page))
+        self.send(p, log_msg)
+
+    def __request_users(self, room: Room, rusers_msg: RequestUsersMessage):
+        room.logger.log(f'[INFO ] User {rusers_msg.sent_by} requested users.')
 
         # Get the users
         users = []
-        for profile in self.profiles:
+        for profile in room.profiles:
             users += [[profile.sequence, profile.nickname, profile.public_key_pem, profile.signature]]
         # Send users message to user
-        p = self.get_profile(rusers_msg.sent_by)
+        p = room.get_profile(rusers_msg.sent_by)
         users_msg = Protocol.response(rusers_msg.sent_by, Command.REQUEST_USERS, 'OK', '', tuple(users))
-        with p.lock:
-            Protocol.send_msg(p.conn, users_msg, self.kc, self.logger)
+        self.send(p, users_msg)
             
-    def __request_disqualify(self, rdisq_msg: RequestDisqualifyMessage):
-        self.logger.log(f'[INFO ] User {rdisq_msg.sent_by} requested disqualify.')
+    def __request_disqualify(self, room: Room, rdisq_msg: RequestDisqualifyMessage):
+        room.logger.log(f'[INFO ] User {rdisq_msg.sent_by} requested disqualify.')
 
         # Forward request disqualify message to caller
-        with self.get_caller().lock:
-            Protocol.send_msg(self.get_caller().conn, rdisq_msg, self.kc, self.logger)
-
-    def get_caller(self):
-        return self.profiles[0] if self.profiles and self.profiles[0].sequence == 0 else None
-
-    def set_caller(self, p: Profile):
-        self.logger.log(f'[INFO ] Caller set to {p.nickname}.')
-        with self.plock:
-            if not self.get_caller():
-                self.profiles.insert(0, p)
-            else:
-                self.profiles[0] = p
-
-    def rem_caller(self):
-        self.logger.log(f'[INFO ] Caller removed.')
-        with self.plock:
-            if self.get_caller():
-                self.profiles.pop(0)
-
-    def get_players(self):
-        return [p for p in self.profiles if p.sequence > 0]
-
-    def get_profile(self, nickname) -> Profile:
-        return next((p for p in self.profiles if p.nickname == nickname), None)
-
-    def get_profile_next(self, p: Profile):
-        for i in range(len(self.profiles)):
-            if self.profiles[i].sequence == p.sequence:
-                if i < len(self.profiles) - 1:
-                    return self.profiles[i + 1]
-        return None
-
-    def add_profile(self, p: Profile):
-        self.logger.log(f'[INFO ] User {p.nickname} added.')
-        with self.plock:
-            self.profiles.append(p)
+        self.send(room.get_caller(), rdisq_msg)
+
+    def send(self, p: Profile, msg: Message):
+        """Sends a message to a user, encoded with the codec and signed with the suite negotiated when joining."""
+        if p.conn.fileno() == -1 and p.suspended is None:
+            return
+        self.queue(p, Protocol.frame_parts(msg, self.keychains[p.suite], p.codec), msg)
+
+    def broadcast(self, profiles: list[Profile], msg: Message):
+        """Sends a message to several users, serializing and signing it only once per codec and suite."""
+        frames = {}
+        for p in profiles:
+            if p.conn.fileno() == -1 and p.suspended is None:
+                continue
+            if (p.codec, p.suite) not in frames:
+                frames[p.codec, p.suite] = Protocol.frame_parts(msg, self.keychains[p.suite], p.codec)
+            self.queue(p, frames[p.codec, p.suite], msg)
 
-    def rem_profile(self, nickname):
-        self.logger.log(f'[INFO ] User {nickname} removed.')
-        with self.plock:
-            self.profiles = [p for p in self.profiles if p.nickname != nickname]
+    def queue(self, p: Profile, parts: list[bytes], msg: Message):
+        """Queues a frame in the outbox of a user, without waiting for it to be sent."""
+        with p.lock:
+            if p.ticket:
+                # Kept to be sent again if the session is resumed (only kept while suspended)
+                p.replay.append(parts)
+                p.sent += 1
+            if p.suspended is not None:
+                return
+            queued = self.outbox(p).put(parts)
+        if queued:
+            (p.room.logger if p.room else self.logger).log(f'[PROTO] Sent {msg.command.value} message.')
+            self.metrics.sent(msg.command.value, sum(len(part) for part in parts))
+
+    def outbox(self, p: Profile) -> Outbox:
+        """Outbound queue of a user, created when first sent to (called with the lock of the user)."""
+        if p.outbox is None:
+            p.outbox = Outbox(p.conn, self.max_queue_size, lambda: self.overflowed(p))
+        return p.outbox
+
+    def overflowed(self, p: Profile):
+        (p.room.logger if p.room else self.logger).log(
+            f'[WARN ] Outbound queue of {p.nickname} overflowed, disconnecting.')
+        self.metrics.outbox_overflows.inc()
+        # Too slow to resume its session
+        p.ticket = None
+
+    def close(self, p: Profile):
+        """Closes the connection of a user once the frames queued for it are sent."""
+        with p.lock:
+            outbox = p.outbox
+        if outbox:
+            outbox.close()
+        else:
+            p.conn.close()
+
+    def get_room(self, name: str, create: bool = True, joining: bool = False) -> Room | None:
+        """Returns a room, created (with its own log) when first joined, or None if there is none and it is not
+        created. Rooms being joined are kept until the join ends (see joined)."""
+        with self.rlock:
+            room = self.rooms.get(name, None)
+            if room is None:
+                if not create:
+                    return None
+                n = self.room_logs[name] = self.room_logs.get(name, 0) + 1
+                if self.router and not self.router.owns(name):
+                    # Default room of a worker not serving it, which only logs the events of the worker
+                    fname = f'{self.nickname}.worker{self.router.index}.log'
+                elif name == self.DEFAULT_ROOM:
+                    fname = f'{self.nickname}.log'
+                else:
+                    fname = f'{self.nickname}.{name}.log' if n == 1 else f'{self.nickname}.{name}.{n}.log'
+                room = self.rooms[name] = Room(name, Logger(fname, self.kc, **self.log_options))
+                room.logger.metrics = self.metrics
+                if name != self.DEFAULT_ROOM:
+                    room.on_empty = self.drop_room
+                    self.logger.log(f'[INFO ] Room {name} created.')
+            if joining:
+                room.joining += 1
+        return room
+
+    def joined(self, room: Room):
+        """Ends a join of a room, dropping the room if it was left without users."""
+        with self.rlock:
+            room.joining -= 1
+        self.drop_room(room)
+
+    def drop_room(self, room: Room):
+        """Closes the log of a room left by all its users (and not being joined) and forgets it. The default room is
+        kept."""
+        with self.rlock:
+            if room.name == self.DEFAULT_ROOM or room.joining or len(room.registry) or \
+                    self.rooms.get(room.name, None) is not room:
+                return
+            del self.rooms[room.name]
+        room.logger.close()
+        self.logger.log(f'[INFO ] Room {room.name} closed.')
+
+    def trace_begin(self, room: Room, phase: str, nickname: str = ''):
+        """Begins a phase of the game of a room (or the part of a user in it), if tracing."""
+        if self.tracer:
+            self.tracer.begin((room.name, phase, nickname))
+
+    def trace_end(self, room: Room, phase: str, nickname: str = ''):
+        """Ends a phase begun with trace_begin, on the lane of the room (or of the user)."""
+        if self.tracer:
+            lane = f'room {room.name} / {nickname}' if nickname else f'room {room.name}'
+            self.tracer.end((room.name, phase, nickname), phase, 'user' if nickname else 'phase',
+                            {'game': room.game}, lane)
+
+    def trace_message(self, this_p: Profile | None, msg: Message, start: int):
+        """Records the time taken to verify and handle a message."""
+        self.tracer.complete(msg.command.value, 'message', start,
+                             {'from': msg.sent_by, 'game': this_p.room.game if this_p else 0})
+
+    def end_game(self, room: Room, winners: bool = False):
+        """Ends the game of a room, if started."""
+        if room.started:
+            (self.metrics.games_finished if winners else self.metrics.games_aborted).inc()
+            self.trace_end(room, 'game')
+        room.started = False
+
+    def stats(self) -> dict:
+        """Counters of the playing area, with the number of rooms and users."""
+        with self.rlock:
+            rooms = list(self.rooms.values())
+        m = self.metrics
+        stats = {
+            'connections': m.connections.total(),
+            'handoffs': m.handoffs.total(),
+            'messages_received': m.messages_received.total(),
+            'messages_sent': m.messages_sent.total(),
+            'bytes_received': m.bytes_received.total(),
+            'bytes_sent': m.bytes_sent.total(),
+            'games_started': m.games_started.total(),
+            'games_finished': m.games_finished.total(),
+        }
+        stats['rooms'] = sum(1 for room in rooms if len(room.registry))
+        stats['users'] = sum(len(room.registry) for room in rooms)
+        return stats
 
     def run(self):
         """Playing area loop."""
         self.logger.log('[INFO ] Playing area is running...')
+        if self.router:
+            self.router.start(self)
 
         while True:
             events = self.sel.select()
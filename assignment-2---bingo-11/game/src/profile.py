@@ -1,11 +1,13 @@
 import threading
 
+from .keychain import Suite
+from .protocol import Codec
+
 
 class Profile:
-    counter = 0
 
-    def __init__(self, nickname, public_key_pem, cc_signature, cc_certificate, conn, is_player):
-        self.sequence = self.__next_sequence_number() if is_player else 0
+    def __init__(self, nickname, public_key_pem, cc_signature, cc_certificate, conn, is_player, sequence=0, room=None):
+        self.sequence = sequence if is_player else 0   # Given by the room, 0 for the caller
         self.nickname = nickname
         self.public_key_pem = public_key_pem
         self.cc_signature = cc_signature
@@ -14,12 +16,18 @@ class Profile:
 
         self.conn = conn
         self.lock = threading.Lock()
+        self.outbox = None        # Frames queued to be sent, created when first sent to
+        # Session (if it can be resumed)
+        self.ticket = None        # Issued when joining
+        self.suspended = None     # Time the connection was lost, while it can be resumed
+        self.replay = None        # Last frames sent, sent again when resumed
+        self.sent = 0             # Frames sent in the session
+        self.received = 0         # Frames received in the session
+        self.codec = Codec.JSON   # Negotiated when joining
+        self.suite = Suite.RSA_PSS    # Negotiated when joining
+        self.room = room          # Game the user joined
 
         self.signature = None     # Done by the caller: 'sequence, nickname, public_key'
         self.symmetric_key = None # Generated to encrypt each deck
         self.deck = None          # Encrypted deck by this user
         self.deck_signature = None
-
-    def __next_sequence_number(self):
-        Profile.counter += 1
-        return Profile.counter
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import hashlib
 import json
 import socket
+import struct
 import threading
 
 from datetime import datetime
 from enum import Enum
-from .keychain import KeyChain
+from functools import partial
+from .keychain import KeyChain, Suite
 from .utils import *
 
 class Command(Enum):
@@ -28,310 +31,508 @@ class Command(Enum):
     REQUEST_LOG = 'REQUEST_LOG'
     REQUEST_USERS = 'REQUEST_USERS'
     REQUEST_DISQUALIFY = 'REQUEST_DISQUALIFY'
+    COMMIT_BUNDLE = 'COMMIT_BUNDLE'
+    RESUME = 'RESUME'                   # Last, as the binary codec sends the index of each command
 
 
-class Message:
-    """Message Type"""
+class Codec(Enum):
+    """Wire encoding of a message body, carried in the flag byte of every frame."""
+    JSON = 0
+    BINARY = 1
 
-    def __init__(self, command: Command):
-        self.command = command
 
+class Field:
+    """Types of the fields of a message, shared by every codec."""
+    STR = 'str'        # Text
+    BYTES = 'bytes'    # Byte string
+    INT = 'int'        # Integer
+    INTS = 'ints'      # List of integers (numbers of a card)
+    BLOCKS = 'blocks'  # 16-byte numbers, concatenated (numbers of a deck, sent by JSON as a list)
+    COMMAND = 'cmd'    # Command
+    DATA = 'data'      # Data of a response, whose type depends on the command it responds to
+    ANY = 'any'        # Value of unknown type
+    # Composite types: (list, T) and (tuple, T) for sequences of T, (tuple, T1, T2, ...) for fixed tuples
 
-class JoinMessage(Message):
-    """Message used to join the playing area."""
 
-    def __init__(self, sent_by: str, role: str, nickname: str, public_key_pem: bytes, cc_signature: bytes,
-                 cc_certificate: bytes):
-        super().__init__(Command.JOIN)
-        self.sent_by = sent_by
-        self.role = role
-        self.nickname = nickname
-        self.public_key_pem = public_key_pem
-        self.cc_signature = cc_signature
-        self.cc_certificate = cc_certificate
+def slots(fields: tuple) -> tuple:
+    """Names of the attributes of a message, from its fields."""
+    return tuple(name for name, *_ in fields)
 
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'role': self.role,
-            'nickname': self.nickname,
-            'public_key_pem': base64.b64encode(self.public_key_pem).decode('utf-8'),
-            'cc_signature': base64.b64encode(self.cc_signature).decode('utf-8'),
-            'cc_certificate': base64.b64encode(self.cc_certificate).decode('utf-8')
-        }, sort_keys=True, default=bytes_to_str)
 
+MESSAGES = {}  # Registry of message classes, by command
 
-class ResponseMessage(Message):
-    """Message used as a response of a given command."""
 
-    def __init__(self, sent_by: str, to_command: Command, status: str, message: str, data: tuple):
-        super().__init__(Command.RESPONSE)
-        self.sent_by = sent_by
-        self.to_command = to_command
-        self.status = status
-        self.message = message
-        self.data = data
+def same(value):
+    """Value of a field used as it is."""
+    return value
 
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'to_command': self.to_command.value,
-            'status': self.status,
-            'message': self.message,
-            'data': (self.data[0], base64.b64encode(self.data[1]).decode('utf-8')) if self.to_command == Command.SIGN_USER
-                else tuple([[sequence,nickname,base64.b64encode(public_key_pem).decode('utf-8'),base64.b64encode(signature).decode('utf-8')] for sequence, nickname, public_key_pem, signature in self.data]) if self.to_command == Command.REQUEST_USERS
-                else tuple(self.data)
-        }, sort_keys=True, default=bytes_to_str)
 
+def message(cls):
+    """Registers a message class, so it can be decoded from its command."""
+    MESSAGES[cls.COMMAND] = cls
+    return cls
 
-class SignUserMessage(Message):
-    """Message used for caller to sign a user that joined the playing area."""
 
-    def __init__(self, sent_by: str, sequence: int, nickname: str, public_key_pem: bytes):
-        super().__init__(Command.SIGN_USER)
-        self.sent_by = sent_by
-        self.sequence = sequence
-        self.nickname = nickname
-        self.public_key_pem = public_key_pem
+class Message:
+    """Message Type
+
+    Each message declares its command and its fields (name, type and, optionally, a default used when decoding
+    messages that lack it), in the order taken by its constructor.
+    """
+    __slots__ = ('command',)
+    COMMAND: Command = None
+    FIELDS: tuple = ()
+
+    def __init__(self, *values):
+        self.command = self.COMMAND
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
 
     def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'sequence': self.sequence,
-            'nickname': self.nickname,
-            'public_key_pem': base64.b64encode(self.public_key_pem).decode('utf-8')
-        }, sort_keys=True, default=bytes_to_str)
+        return JsonCodec.encode(self).decode('utf-8')
 
 
-class DisconnectMessage(Message):
-    """Message used to inform a disconnection from the playing area."""
+@message
+class JoinMessage(Message):
+    """Message used to join the playing area."""
+    COMMAND = Command.JOIN
+    FIELDS = (('sent_by', Field.STR), ('role', Field.STR), ('nickname', Field.STR), ('public_key_pem', Field.BYTES),
+              ('cc_signature', Field.BYTES), ('cc_certificate', Field.BYTES),
+              ('codecs', (list, Field.STR), [Codec.JSON.name]),  # Supported codecs, by order of preference
+              ('room', Field.STR, 'default'),                     # Game to join
+              ('suites', (list, Field.STR), [Suite.RSA_PSS.name]))  # Signature suites, by order of preference
+    __slots__ = slots(FIELDS)
 
-    def __init__(self, sent_by: str, nickname: str, reason: str):
-        super().__init__(Command.DISCONNECT)
-        self.sent_by = sent_by
-        self.nickname = nickname
-        self.reason = reason
 
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'nickname': self.nickname,
-            'reason': self.reason
-        }, sort_keys=True, default=bytes_to_str)
+@message
+class ResponseMessage(Message):
+    """Message used as a response of a given command."""
+    COMMAND = Command.RESPONSE
+    FIELDS = (('sent_by', Field.STR), ('to_command', Field.COMMAND), ('status', Field.STR), ('message', Field.STR),
+              ('data', Field.DATA))
+    __slots__ = slots(FIELDS)
+    # Type of the data, by command it responds to (any other data is sent as it is)
+    DATA = {
+        # Codec and signature suite, then ticket and its signature (if any)
+        Command.JOIN: (tuple, Field.STR, Field.STR, Field.BYTES, Field.BYTES),
+        Command.SIGN_USER: (tuple, Field.STR, Field.BYTES),
+        Command.REQUEST_USERS: (tuple, (tuple, Field.INT, Field.STR, Field.BYTES, Field.BYTES)),
+        Command.COMMIT_BUNDLE: (tuple, Field.STR),  # Nicknames of the invalid cards
+    }
+
+
+@message
+class SignUserMessage(Message):
+    """Message used for caller to sign a user that joined the playing area."""
+    COMMAND = Command.SIGN_USER
+    FIELDS = (('sent_by', Field.STR), ('sequence', Field.INT), ('nickname', Field.STR), ('public_key_pem', Field.BYTES))
+    __slots__ = slots(FIELDS)
 
 
-class StartGameMessage(Message):
-    """Message used to start the game."""
+@message
+class DisconnectMessage(Message):
+    """Message used to inform a disconnection from the playing area."""
+    COMMAND = Command.DISCONNECT
+    FIELDS = (('sent_by', Field.STR), ('nickname', Field.STR), ('reason', Field.STR))
+    __slots__ = slots(FIELDS)
 
-    def __init__(self, sent_by: str, public_key_pems: list[tuple[str, bytes]]):
-        super().__init__(Command.START_GAME)
-        self.sent_by = sent_by
-        self.public_key_pems = public_key_pems
 
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'public_key_pems': [(nickname, base64.b64encode(public_key_pem).decode('utf-8'))
-                                for nickname, public_key_pem in self.public_key_pems]
-        }, sort_keys=True, default=bytes_to_str)
+@message
+class StartGameMessage(Message):
+    """Message used to start the game."""
+    COMMAND = Command.START_GAME
+    FIELDS = (('sent_by', Field.STR), ('public_key_pems', (list, (tuple, Field.STR, Field.BYTES))),
+              ('game', Field.INT, 0))  # Number of the game in its room
+    __slots__ = slots(FIELDS)
 
 
+@message
 class CommitCardMessage(Message):
     """Message used to commit a card to the caller and other players."""
+    COMMAND = Command.COMMIT_CARD
+    FIELDS = (('sent_by', Field.STR), ('numbers', Field.INTS), ('numbers_signature', Field.BYTES))
+    __slots__ = slots(FIELDS)
 
-    def __init__(self, sent_by: str, numbers: list, numbers_signature: bytes):
-        super().__init__(Command.COMMIT_CARD)
-        self.sent_by = sent_by
-        self.numbers = numbers
-        self.numbers_signature = numbers_signature
 
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'numbers': self.numbers,
-            'numbers_signature': base64.b64encode(self.numbers_signature).decode('utf-8')
-        }, sort_keys=True, default=bytes_to_str)
+@message
+class CommitBundleMessage(Message):
+    """Message used to announce the cards committed by every player to the caller and players, at once."""
+    COMMAND = Command.COMMIT_BUNDLE
+    FIELDS = (('sent_by', Field.STR), ('commits', (list, (tuple, Field.STR, Field.INTS, Field.BYTES))))
+    __slots__ = slots(FIELDS)
 
 
-class DisqualifyMessage(Message):
-    """Message used to disqualify a player."""
+@message
+class ResumeMessage(Message):
+    """Message used by a player that lost its connection to resume its session with the ticket received when joining."""
+    COMMAND = Command.RESUME
+    FIELDS = (('sent_by', Field.STR), ('nickname', Field.STR), ('ticket', Field.BYTES),
+              ('ticket_signature', Field.BYTES),
+              ('received', Field.INT),          # Frames received in the session, the rest are sent again
+              ('room', Field.STR, 'default'))
+    __slots__ = slots(FIELDS)
 
-    def __init__(self, sent_by: str, nickname: str, reason: str):
-        super().__init__(Command.DISQUALIFY)
-        self.sent_by = sent_by
-        self.nickname = nickname
-        self.reason = reason
 
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'nickname': self.nickname,
-            'reason': self.reason
-        }, sort_keys=True, default=bytes_to_str)
+@message
+class DisqualifyMessage(Message):
+    """Message used to disqualify a player."""
+    COMMAND = Command.DISQUALIFY
+    FIELDS = (('sent_by', Field.STR), ('nickname', Field.STR), ('reason', Field.STR))
+    __slots__ = slots(FIELDS)
 
 
+@message
 class ShuffleDeckMessage(Message):
     """Message used to shuffle the deck."""
-
-    def __init__(self, sent_by: str, numbers: list[bytes], numbers_signature: bytes):
-        super().__init__(Command.SHUFFLE_DECK)
-        self.sent_by = sent_by
-        self.numbers = numbers
-        self.numbers_signature = numbers_signature
-
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'numbers': [base64.b64encode(n).decode('utf-8') for n in self.numbers],
-            'numbers_signature': base64.b64encode(self.numbers_signature).decode('utf-8')
-        }, sort_keys=True, default=bytes_to_str)
+    COMMAND = Command.SHUFFLE_DECK
+    FIELDS = (('sent_by', Field.STR), ('numbers', Field.BLOCKS), ('numbers_signature', Field.BYTES))
+    __slots__ = slots(FIELDS)
 
 
+@message
 class SignDeckMessage(Message):
     """Message used to sign the deck."""
-
-    def __init__(self, sent_by: str, numbers: list[bytes], numbers_signature: bytes):
-        super().__init__(Command.SIGN_DECK)
-        self.sent_by = sent_by
-        self.numbers = numbers
-        self.numbers_signature = numbers_signature
-
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'numbers': [base64.b64encode(n).decode('utf-8') for n in self.numbers],
-            'numbers_signature': base64.b64encode(self.numbers_signature).decode('utf-8')
-        }, sort_keys=True, default=bytes_to_str)
+    COMMAND = Command.SIGN_DECK
+    FIELDS = (('sent_by', Field.STR), ('numbers', Field.BLOCKS), ('numbers_signature', Field.BYTES))
+    __slots__ = slots(FIELDS)
 
 
+@message
 class PlayingDeckMessage(Message):
     """Message used to announce the playing deck to the playing area."""
-
-    def __init__(self, sent_by: str, numbers: list[bytes], numbers_signature: bytes):
-        super().__init__(Command.PLAYING_DECK)
-        self.sent_by = sent_by
-        self.numbers = numbers
-        self.numbers_signature = numbers_signature
-
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'numbers': [base64.b64encode(n).decode('utf-8') for n in self.numbers],
-            'numbers_signature': base64.b64encode(self.numbers_signature).decode('utf-8')
-        }, sort_keys=True, default=bytes_to_str)
+    COMMAND = Command.PLAYING_DECK
+    FIELDS = (('sent_by', Field.STR), ('numbers', Field.BLOCKS), ('numbers_signature', Field.BYTES))
+    __slots__ = slots(FIELDS)
 
 
+@message
 class SymmetricKeyMessage(Message):
     """Message used to announce the symmetric key."""
-
-    def __init__(self, sent_by: str, symmetric_key: bytes):
-        super().__init__(Command.SYMMETRIC_KEY)
-        self.sent_by = sent_by
-        self.symmetric_key = symmetric_key
-
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'symmetric_key': base64.b64encode(self.symmetric_key).decode('utf-8')
-        }, sort_keys=True, default=bytes_to_str)
+    COMMAND = Command.SYMMETRIC_KEY
+    FIELDS = (('sent_by', Field.STR), ('symmetric_key', Field.BYTES))
+    __slots__ = slots(FIELDS)
 
 
+@message
 class DecksKeysMessage(Message):
     """Message used to announce the shuffled decks and symmetric keys of each user."""
-
-    def __init__(self, sent_by: str, decks_keys: list[tuple[str, list[bytes], bytes]]):
-        super().__init__(Command.DECKS_KEYS)
-        self.sent_by = sent_by
-        self.decks_keys = decks_keys
-
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'decks_keys': [(nickname, [base64.b64encode(n).decode('utf-8') for n in numbers],
-                            base64.b64encode(symmetric_key).decode('utf-8'))
-                           for nickname, numbers, symmetric_key in self.decks_keys]
-        }, sort_keys=True, default=bytes_to_str)
+    COMMAND = Command.DECKS_KEYS
+    FIELDS = (('sent_by', Field.STR), ('decks_keys', (list, (tuple, Field.STR, Field.BLOCKS, Field.BYTES))))
+    __slots__ = slots(FIELDS)
 
 
+@message
 class WinnerMessage(Message):
     """Message to announce the winner of the game."""
-
-    def __init__(self, sent_by: str, nicknames: list[str]):
-        super().__init__(Command.WINNER)
-        self.sent_by = sent_by
-        self.nicknames = nicknames
-
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'nicknames': self.nicknames
-        }, sort_keys=True, default=bytes_to_str)
+    COMMAND = Command.WINNER
+    FIELDS = (('sent_by', Field.STR), ('nicknames', (list, Field.STR)))
+    __slots__ = slots(FIELDS)
 
 
+@message
 class RequestLogMessage(Message):
-    """Message to request the log of the game."""
-
-    def __init__(self, sent_by: str):
-        super().__init__(Command.REQUEST_LOG)
-        self.sent_by = sent_by
-
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by
-        }, sort_keys=True, default=bytes_to_str)
+    """Message to request the log of the game (or the page of its entries matching a range and filters)."""
+    COMMAND = Command.REQUEST_LOG
+    FIELDS = (('sent_by', Field.STR), ('offset', Field.INT, 0), ('limit', Field.INT, 0), ('first', Field.INT, 0),
+              ('last', Field.INT, 0), ('filter_command', Field.STR, ''), ('filter_nickname', Field.STR, ''))
+    __slots__ = slots(FIELDS)
 
 
+@message
 class RequestUsersMessage(Message):
     """Message to request the list of users."""
+    COMMAND = Command.REQUEST_USERS
+    FIELDS = (('sent_by', Field.STR),)
+    __slots__ = slots(FIELDS)
 
-    def __init__(self, sent_by: str):
-        super().__init__(Command.REQUEST_USERS)
-        self.sent_by = sent_by
-
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by
-        }, sort_keys=True, default=bytes_to_str)
 
+@message
 class RequestDisqualifyMessage(Message):
     """Message to request the disqualification of a user."""
+    COMMAND = Command.REQUEST_DISQUALIFY
+    FIELDS = (('sent_by', Field.STR), ('nickname', Field.STR), ('reason', Field.STR))
+    __slots__ = slots(FIELDS)
 
-    def __init__(self, sent_by: str, nickname: str, reason: str):
-        super().__init__(Command.REQUEST_DISQUALIFY)
-        self.sent_by = sent_by
-        self.nickname = nickname
-        self.reason = reason
 
-    def __repr__(self):
-        return json.dumps({
-            'command': self.command.value,
-            'sent_by': self.sent_by,
-            'nickname': self.nickname,
-            'reason': self.reason
-        }, sort_keys=True, default=bytes_to_str)
+class JsonCodec:
+    """JSON encoding of messages, with byte strings encoded in base64."""
+
+    CONVERTERS = {}  # Function converting the JSON value of each field type, built when first decoded
+    PLANS = {}       # Class and fields of each command (by its value), with their converters, built when first decoded
+
+    @classmethod
+    def encode(cls, msg: Message) -> bytes:
+        """Encodes a message into its JSON representation."""
+        d = {'command': msg.command.value}
+        for name, t, *_ in msg.FIELDS:
+            if t == Field.DATA:
+                t = ResponseMessage.DATA.get(msg.to_command, (tuple, Field.ANY))
+            d[name] = cls.__to_json(t, getattr(msg, name))
+        return bytes(json.dumps(d, sort_keys=True, default=bytes_to_str), 'utf-8')
+
+    @classmethod
+    def decode(cls, m: bytes) -> Message:
+        """Decodes the JSON representation of a message."""
+        try:
+            d = json.loads(m)
+            command = d['command']
+            msg_cls, plan = cls.PLANS.get(command) or cls.__plan(command)
+            values = []
+            for name, f, default in plan:
+                if name not in d:
+                    # Fields added after the message was first sent have a default
+                    if not default:
+                        raise ProtocolBadFormat(m)
+                    values.append(default[0])
+                elif f is None:
+                    values.append(d[name])
+                elif f is Field.DATA:
+                    t = ResponseMessage.DATA.get(values[1], (tuple, Field.ANY))
+                    values.append((cls.CONVERTERS.get(t) or cls.__converter(t))(d[name]))
+                else:
+                    values.append(f(d[name]))
+        except (KeyError, TypeError, ValueError):
+            raise ProtocolBadFormat(m)
+        return msg_cls(*values)
+
+    @classmethod
+    def __to_json(cls, t, value):
+        if t == Field.BYTES:
+            return base64.b64encode(value).decode('utf-8')
+        elif t == Field.BLOCKS:
+            size = BinaryCodec.BLOCK_SIZE
+            return [base64.b64encode(value[i:i + size]).decode('utf-8') for i in range(0, len(value), size)]
+        elif t == Field.COMMAND:
+            return value.value
+        elif type(t) is tuple:
+            if len(t) == 2:
+                return [cls.__to_json(t[1], v) for v in value]
+            return [cls.__to_json(vt, v) for vt, v in zip(t[1:], value)]
+        return value
+
+    @classmethod
+    def __blocks(cls, value: list) -> bytes:
+        """Numbers of a deck, from the list of their base64 encodings."""
+        numbers = list(map(base64.b64decode, value))
+        if numbers and set(map(len, numbers)) != {BinaryCodec.BLOCK_SIZE}:
+            raise ValueError(f'Numbers must have {BinaryCodec.BLOCK_SIZE} bytes.')
+        return b''.join(numbers)
+
+    @classmethod
+    def __plan(cls, command) -> tuple:
+        """Builds the class of a command and its fields, each with the function converting its JSON value (None if
+        used as it is, Field.DATA if it depends on the command responded to) and its default (if any)."""
+        msg_cls = MESSAGES[Command(command)]
+        plan = []
+        for name, t, *default in msg_cls.FIELDS:
+            f = Field.DATA if t == Field.DATA else cls.__converter(t)
+            plan.append((name, None if f is same else f, tuple(default)))
+        cls.PLANS[command] = msg_cls, tuple(plan)
+        return cls.PLANS[command]
+
+    @staticmethod
+    def __convert_items(items: list, value: list) -> tuple:
+        """Converts the items of a fixed tuple, by their index (trailing optional items may be missing)."""
+        value = list(value)
+        for i, item in items:
+            if i >= len(value):
+                break
+            value[i] = item(value[i])
+        return tuple(value)
+
+    @classmethod
+    def __converter(cls, t):
+        """Builds the function converting the JSON value of a field type (composite types convert each item)."""
+        if t in cls.CONVERTERS:
+            return cls.CONVERTERS[t]
+        b64decode = base64.b64decode
+        if t == Field.BYTES:
+            f = b64decode
+        elif t == Field.BLOCKS:
+            f = cls.__blocks
+        elif t == Field.COMMAND:
+            f = {c.value: c for c in Command}.__getitem__
+        elif type(t) is tuple and len(t) == 2:
+            seq, item = t[0], cls.__converter(t[1])
+            f = seq if item is same else lambda value: seq([item(v) for v in value])
+        elif type(t) is tuple:
+            # Only the items that are not used as they are get converted, by their index
+            items = [(i, item) for i, item in enumerate(cls.__converter(vt) for vt in t[1:]) if item is not same]
+            f = tuple if not items else partial(cls.__convert_items, items)
+        else:
+            f = same
+        cls.CONVERTERS[t] = f
+        return f
+
+
+class BinaryCodec:
+    """Compact binary encoding of messages.
+
+    A body is the index of the command (1 byte) followed by the fields of the message, in the order of its
+    constructor. Strings and byte strings are length-prefixed and sent raw, integers have a fixed width and
+    deck numbers are sent as a single contiguous block of 16-byte numbers. The data of a response is tagged
+    with its type.
+    """
+
+    BLOCK_SIZE = 16
+    COMMANDS = list(Command)
+
+    U8 = struct.Struct('>B')
+    U32 = struct.Struct('>I')
+    I64 = struct.Struct('>q')
+
+    @classmethod
+    def encode(cls, msg: Message) -> bytes:
+        """Encodes a message into its binary representation."""
+        out = bytearray(cls.U8.pack(cls.COMMANDS.index(msg.command)))
+        for name, t, *_ in msg.FIELDS:
+            cls.__pack(out, t, getattr(msg, name))
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, m: bytes) -> Message:
+        """Decodes the binary representation of a message."""
+        try:
+            msg_cls = MESSAGES[cls.COMMANDS[m[0]]]
+            pos, values = 1, []
+            for _, t, *_ in msg_cls.FIELDS:
+                value, pos = cls.__unpack(m, pos, t)
+                values.append(value)
+        except (IndexError, KeyError, ValueError, struct.error):
+            raise ProtocolBadFormat(m)
+        if pos != len(m):
+            raise ProtocolBadFormat(m)
+        return msg_cls(*values)
+
+    @classmethod
+    def __pack(cls, out: bytearray, t, value):
+        if t == Field.STR:
+            value = value.encode('utf-8')
+            out += cls.U32.pack(len(value))
+            out += value
+        elif t == Field.BYTES:
+            out += cls.U32.pack(len(value))
+            out += value
+        elif t == Field.INT:
+            out += cls.I64.pack(value)
+        elif t == Field.INTS:
+            out += cls.U32.pack(len(value))
+            out += struct.pack(f'>{len(value)}I', *value)
+        elif t == Field.BLOCKS:
+            if len(value) % cls.BLOCK_SIZE:
+                raise ValueError(f'Numbers must have {cls.BLOCK_SIZE} bytes.')
+            out += cls.U32.pack(len(value) // cls.BLOCK_SIZE)
+            out += value
+        elif t == Field.COMMAND:
+            out += cls.U8.pack(cls.COMMANDS.index(value))
+        elif t in (Field.DATA, Field.ANY):
+            cls.__pack_any(out, value)
+        elif len(t) == 2:
+            out += cls.U32.pack(len(value))
+            for v in value:
+                cls.__pack(out, t[1], v)
+        else:
+            for vt, v in zip(t[1:], value):
+                cls.__pack(out, vt, v)
+
+    @classmethod
+    def __unpack(cls, m: bytes, pos: int, t) -> tuple:
+        if t == Field.STR:
+            n, = cls.U32.unpack_from(m, pos)
+            return cls.__slice(m, pos + 4, n).decode('utf-8'), pos + 4 + n
+        elif t == Field.BYTES:
+            n, = cls.U32.unpack_from(m, pos)
+            return cls.__slice(m, pos + 4, n), pos + 4 + n
+        elif t == Field.INT:
+            return cls.I64.unpack_from(m, pos)[0], pos + 8
+        elif t == Field.INTS:
+            n, = cls.U32.unpack_from(m, pos)
+            return list(struct.unpack_from(f'>{n}I', m, pos + 4)), pos + 4 + 4 * n
+        elif t == Field.BLOCKS:
+            n, = cls.U32.unpack_from(m, pos)
+            return cls.__slice(m, pos + 4, cls.BLOCK_SIZE * n), pos + 4 + cls.BLOCK_SIZE * n
+        elif t == Field.COMMAND:
+            return cls.COMMANDS[m[pos]], pos + 1
+        elif t == Field.DATA:
+            value, pos = cls.__unpack_any(m, pos)
+            return tuple(value), pos
+        elif t == Field.ANY:
+            return cls.__unpack_any(m, pos)
+        elif len(t) == 2:
+            n, = cls.U32.unpack_from(m, pos)
+            pos += 4
+            values = []
+            for _ in range(n):
+                v, pos = cls.__unpack(m, pos, t[1])
+                values.append(v)
+            return t[0](values), pos
+        else:
+            values = []
+            for vt in t[1:]:
+                v, pos = cls.__unpack(m, pos, vt)
+                values.append(v)
+            return tuple(values), pos
+
+    @classmethod
+    def __pack_any(cls, out: bytearray, value):
+        """Tagged encoding of a value of unknown type."""
+        if value is None:
+            out += b'N'
+        elif isinstance(value, bool):
+            out += b'T' if value else b'F'
+        elif isinstance(value, int):
+            out += b'i'
+            out += cls.I64.pack(value)
+        elif isinstance(value, str):
+            out += b's'
+            cls.__pack(out, Field.STR, value)
+        elif isinstance(value, (bytes, bytearray)):
+            out += b'b'
+            cls.__pack(out, Field.BYTES, value)
+        elif isinstance(value, (list, tuple)):
+            out += b'l'
+            out += cls.U32.pack(len(value))
+            for v in value:
+                cls.__pack_any(out, v)
+        else:
+            raise ValueError(f'Unable to encode {type(value)}.')
+
+    @classmethod
+    def __unpack_any(cls, m: bytes, pos: int) -> tuple:
+        tag, pos = m[pos:pos + 1], pos + 1
+        if tag == b'N':
+            return None, pos
+        elif tag in (b'T', b'F'):
+            return tag == b'T', pos
+        elif tag == b'i':
+            return cls.__unpack(m, pos, Field.INT)
+        elif tag == b's':
+            return cls.__unpack(m, pos, Field.STR)
+        elif tag == b'b':
+            return cls.__unpack(m, pos, Field.BYTES)
+        elif tag == b'l':
+            return cls.__unpack(m, pos, (list, Field.ANY))
+        raise ValueError(f'Unknown tag {tag}.')
+
+    @classmethod
+    def __slice(cls, m: bytes, pos: int, n: int) -> bytes:
+        if pos + n > len(m):
+            raise ValueError('Truncated message.')
+        return m[pos:pos + n]
 
 
 class Protocol:
+    MAX_FRAME_SIZE = 64 * 1024 * 1024  # Frames announcing a larger length are refused
+    SIGNATURE_SIZE = 256    # Bytes of RSA signatures (the size of the RSA keys of every user)
+    ED25519_SIGNATURE_SIZE = 64
+    IOV_MAX = 1024          # Buffers sent by each scatter-gather call (the limit of Linux)
+    REPLAY_FRAMES = 64      # Last frames sent in a session kept by both ends, to be sent again when it is resumed
 
     @classmethod
     def join(cls, sent_by: str, role: str, nickname: str, public_key_pem: bytes, cc_signature: bytes,
-             cc_certificate: bytes) -> JoinMessage:
-        return JoinMessage(sent_by, role, nickname, public_key_pem, cc_signature, cc_certificate)
+             cc_certificate: bytes, codecs: list[str] = ['JSON'], room: str = 'default',
+             suites: list[str] = ['RSA_PSS']) -> JoinMessage:
+        return JoinMessage(sent_by, role, nickname, public_key_pem, cc_signature, cc_certificate, codecs, room, suites)
 
     @classmethod
     def response(cls, sent_by: str, to_command: Command, status: str, message: str,
@@ -347,27 +548,37 @@ class Protocol:
         return DisconnectMessage(sent_by, nickname, reason)
 
     @classmethod
-    def start_game(cls, sent_by: str, public_key_pems: list[tuple[str, bytes]] = []) -> StartGameMessage:
-        return StartGameMessage(sent_by, public_key_pems)
+    def start_game(cls, sent_by: str, public_key_pems: list[tuple[str, bytes]] = [],
+                   game: int = 0) -> StartGameMessage:
+        return StartGameMessage(sent_by, public_key_pems, game)
 
     @classmethod
     def commit_card(cls, sent_by: str, numbers: list, numbers_signature: bytes) -> CommitCardMessage:
         return CommitCardMessage(sent_by, numbers, numbers_signature)
 
+    @classmethod
+    def commit_bundle(cls, sent_by: str, commits: list[tuple[str, list, bytes]]) -> CommitBundleMessage:
+        return CommitBundleMessage(sent_by, commits)
+
+    @classmethod
+    def resume(cls, sent_by: str, nickname: str, ticket: bytes, ticket_signature: bytes, received: int,
+               room: str = 'default') -> ResumeMessage:
+        return ResumeMessage(sent_by, nickname, ticket, ticket_signature, received, room)
+
     @classmethod
     def disqualify(cls, sent_by: str, nickname: str, reason: str) -> DisqualifyMessage:
         return DisqualifyMessage(sent_by, nickname, reason)
 
     @classmethod
-    def shuffle_deck(cls, sent_by: str, numbers: list[bytes], numbers_signature: bytes) -> ShuffleDeckMessage:
+    def shuffle_deck(cls, sent_by: str, numbers: bytes, numbers_signature: bytes) -> ShuffleDeckMessage:
         return ShuffleDeckMessage(sent_by, numbers, numbers_signature)
 
     @classmethod
-    def sign_deck(cls, sent_by: str, numbers: list[bytes], numbers_signature: bytes) -> SignDeckMessage:
+    def sign_deck(cls, sent_by: str, numbers: bytes, numbers_signature: bytes) -> SignDeckMessage:
         return SignDeckMessage(sent_by, numbers, numbers_signature)
 
     @classmethod
-    def playing_deck(cls, sent_by: str, numbers: list[bytes], numbers_signature: bytes) -> PlayingDeckMessage:
+    def playing_deck(cls, sent_by: str, numbers: bytes, numbers_signature: bytes) -> PlayingDeckMessage:
         return PlayingDeckMessage(sent_by, numbers, numbers_signature)
 
     @classmethod
@@ -375,7 +586,7 @@ class Protocol:
         return SymmetricKeyMessage(sent_by, symmetric_key)
 
     @classmethod
-    def decks_keys(cls, sent_by: str, decks_keys: list[tuple[str, list[bytes], bytes]]) -> DecksKeysMessage:
+    def decks_keys(cls, sent_by: str, decks_keys: list[tuple[str, bytes, bytes]]) -> DecksKeysMessage:
         return DecksKeysMessage(sent_by, decks_keys)
 
     @classmethod
@@ -383,8 +594,9 @@ class Protocol:
         return WinnerMessage(sent_by, nicknames)
 
     @classmethod
-    def request_log(cls, sent_by: str) -> RequestLogMessage:
-        return RequestLogMessage(sent_by)
+    def request_log(cls, sent_by: str, offset: int = 0, limit: int = 0, first: int = 0, last: int = 0,
+                    filter_command: str = '', filter_nickname: str = '') -> RequestLogMessage:
+        return RequestLogMessage(sent_by, offset, limit, first, last, filter_command, filter_nickname)
 
     @classmethod
     def request_users(cls, sent_by: str) -> RequestUsersMessage:
@@ -395,107 +607,173 @@ class Protocol:
         return RequestDisqualifyMessage(sent_by, nickname, reason)
 
     @classmethod
-    def serialize(cls, msg: Message) -> bytes:
-        return bytes(repr(msg), 'utf-8')
+    def negotiate(cls, codecs: list[str]) -> Codec:
+        """Chooses the first supported codec from a list ordered by preference, falling back to JSON."""
+        return next((Codec[c] for c in codecs if c in Codec.__members__), Codec.JSON)
 
     @classmethod
-    def unserialize(cls, msg: bytes) -> dict:
-        return json.loads(msg, object_hook=str_to_bytes)
+    def negotiate_suite(cls, suites: list[str]) -> Suite:
+        """Chooses the first supported signature suite from a list ordered by preference, falling back to RSA-PSS."""
+        return next((Suite[s] for s in suites if s in Suite.__members__), Suite.RSA_PSS)
 
     @classmethod
-    def send_msg(cls, conn: socket.socket, msg: Message, kc: KeyChain, logger) -> (Message, bytes, bytes):
-        """Sends thought a connection a serialized Message object."""
-        if conn.fileno() == -1:
-            return
-        # Flag to indicate there is a message
-        flag = bytes(1)
+    def signature_size(cls, suite: Suite) -> int:
+        return cls.ED25519_SIGNATURE_SIZE if suite == Suite.ED25519 else cls.SIGNATURE_SIZE
+
+    @classmethod
+    def parse_flag(cls, flag: int) -> tuple[Codec, int]:
+        """Codec of the body and size of the signature of a frame, from its flag (the codec in the low 4 bits and the
+        signature suite in the high 4 bits)."""
+        if flag & 0x0F not in Codec._value2member_map_ or flag >> 4 not in Suite._value2member_map_:
+            raise ProtocolBadFormat()
+        return Codec(flag & 0x0F), cls.signature_size(Suite(flag >> 4))
+
+    @classmethod
+    def serialize(cls, msg: Message, codec: Codec = Codec.JSON) -> bytes:
+        if codec == Codec.BINARY:
+            return BinaryCodec.encode(msg)
+        return JsonCodec.encode(msg)
+
+    @classmethod
+    def frame_parts(cls, msg: Message, kc: KeyChain, codec: Codec = Codec.JSON) -> list[bytes]:
+        """Serializes and signs a Message object into the header, signature and body of a frame, which can be sent
+        (without joining them) to any number of connections."""
         # Serialize message
-        m: bytes = Protocol.serialize(msg)
+        m: bytes = Protocol.serialize(msg, codec)
         # Sign message
         sm: bytes = kc.sign(m)
-        # Length of message
-        m_len: bytes = (256 + len(m)).to_bytes(4, 'big')
-        # Send message
-        conn.sendall(flag + m_len + sm + m)
+        # Flag to indicate there is a message (how it is encoded and signed), followed by the length of message
+        header = bytes([codec.value | kc.suite.value << 4]) + (len(sm) + len(m)).to_bytes(4, 'big')
+        return [header, sm, m]
+
+    @classmethod
+    def frame(cls, msg: Message, kc: KeyChain, codec: Codec = Codec.JSON) -> bytes:
+        """Serializes and signs a Message object into a frame, which can be sent to any number of connections."""
+        return b''.join(cls.frame_parts(msg, kc, codec))
+
+    @classmethod
+    def send_parts(cls, conn: socket.socket, parts: list[bytes]):
+        """Sends several buffers with scatter-gather calls (without joining them), resuming after partial sends."""
+        if not hasattr(conn, 'sendmsg'):
+            conn.sendall(b''.join(parts))
+            return
+        views = [memoryview(part) for part in parts if part]
+        i = 0
+        while i < len(views):
+            n = conn.sendmsg(views[i:i + cls.IOV_MAX])
+            # Skip the buffers sent, and the part sent of the last one
+            while n and n >= len(views[i]):
+                n -= len(views[i])
+                i += 1
+            if n:
+                views[i] = views[i][n:]
+
+    @classmethod
+    def send_frame(cls, conn: socket.socket, parts: list[bytes], msg: Message, logger):
+        """Sends thought a connection a frame previously built from a Message object."""
+        if conn.fileno() == -1:
+            return
+        cls.send_parts(conn, parts)
 
         logger.log(f'[PROTO] Sent {msg.command.value} message.')
 
     @classmethod
-    def recv_msg(cls, conn: socket.socket, logger, consumed_flag=False) -> (Message, bytes, bytes):
+    def send_msg(cls, conn: socket.socket, msg: Message, kc: KeyChain, logger,
+                 codec: Codec = Codec.JSON) -> (Message, bytes, bytes):
+        """Sends thought a connection a serialized Message object."""
         if conn.fileno() == -1:
-            return None, None, None
-        if not consumed_flag:
-            conn.recv(1)
+            return
+        Protocol.send_frame(conn, Protocol.frame_parts(msg, kc, codec), msg, logger)
 
-        m_len = int.from_bytes(conn.recv(4), 'big')
-        if m_len == 0:
+    @classmethod
+    def recv_msg(cls, conn: socket.socket, logger, reader: FrameReader = None) -> (Message, bytes, bytes):
+        if conn.fileno() == -1:
             return None, None, None
-
-        sm: bytes = conn.recv(256)  # Signature
-        if len(sm) != 256:
+        if reader is None:
+            reader = FrameReader(conn)
+
+        try:
+            # Flag and length of the signature and message
+            header = reader.read(5)
+            if header is None:
+                return None, None, None
+            codec, signature_size = cls.parse_flag(header[0])
+            m_len = int.from_bytes(header[1:], 'big')
+            if m_len < signature_size:
+                return None, None, None
+            if m_len > reader.max_frame_size:
+                logger.log(f'[WARN ] Frame of {m_len} bytes exceeds the maximum of {reader.max_frame_size} bytes.')
+                return None, None, None
+
+            # Signature and message
+            frame = reader.read(m_len)
+            if frame is None:
+                return None, None, None
+        except ConnectionError:
             return None, None, None
+        sm: bytes = bytes(frame[:signature_size])
+        m: bytes = bytes(frame[signature_size:])
+
+        return cls.__decode_frame(codec, m, logger), m, sm
 
-        m: bytes = cls.__recvall(conn, m_len - 256)
-        if m is None:
+    @classmethod
+    async def recv_msg_async(cls, reader: asyncio.StreamReader, logger,
+                             max_frame_size: int = None) -> (Message, bytes, bytes):
+        """Receives a message from an asyncio stream, without blocking the event loop."""
+        if max_frame_size is None:
+            max_frame_size = cls.MAX_FRAME_SIZE
+        try:
+            flag = await reader.readexactly(1)
+            codec, signature_size = cls.parse_flag(flag[0])
+            m_len = int.from_bytes(await reader.readexactly(4), 'big')
+            if m_len < signature_size:
+                return None, None, None
+            if m_len > max_frame_size:
+                logger.log(f'[WARN ] Frame of {m_len} bytes exceeds the maximum of {max_frame_size} bytes.')
+                return None, None, None
+            sm: bytes = await reader.readexactly(signature_size)  # Signature
+            m: bytes = await reader.readexactly(m_len - signature_size)
+        except (asyncio.IncompleteReadError, ConnectionError):
             return None, None, None
-        d = Protocol.unserialize(m)
 
-        if 'command' not in d:
-            raise ProtocolBadFormat(m)
+        return cls.__decode_frame(codec, m, logger), m, sm
 
-        logger.log(f'[PROTO] Received {d["command"]} message from {d["sent_by"]}.')
-
-        if d['command'] == Command.JOIN.value and 'sent_by' in d and 'role' in d and 'nickname' in d and 'public_key_pem' in d and 'cc_signature' in d and 'cc_certificate' in d:
-            msg = Protocol.join(d['sent_by'], d['role'], d['nickname'], base64.b64decode(d['public_key_pem'].encode('utf-8')), base64.b64decode(d['cc_signature'].encode('utf-8')), base64.b64decode(d['cc_certificate'].encode('utf-8')))
-        elif d['command'] == Command.RESPONSE.value and 'sent_by' in d and 'to_command' in d and 'status' in d and 'message' in d and 'data' in d:
-            if d['to_command'] == Command.SIGN_USER.value:
-                msg = Protocol.response(d['sent_by'], Command(d['to_command']), d['status'], d['message'], (d['data'][0], base64.b64decode(d['data'][1].encode('utf-8'))))
-            elif d['to_command'] == Command.REQUEST_USERS.value:
-                msg = Protocol.response(d['sent_by'], Command(d['to_command']), d['status'], d['message'], tuple([[sequence,nickname,base64.b64decode(public_key_pem.encode('utf-8')),base64.b64decode(signature.encode('utf-8'))] for sequence, nickname, public_key_pem, signature in d['data']]))
-            else:
-                msg = Protocol.response(d['sent_by'], Command(d['to_command']), d['status'], d['message'], tuple(d['data']))
-        elif d['command'] == Command.SIGN_USER.value and 'sent_by' in d and 'sequence' in d and 'nickname' in d and 'public_key_pem' in d:
-            msg = Protocol.sign_user(d['sent_by'], d['sequence'], d['nickname'],  base64.b64decode(d['public_key_pem'].encode('utf-8')))
-        elif d['command'] == Command.DISCONNECT.value and 'sent_by' in d and 'nickname' in d and 'reason' in d:
-            msg = Protocol.disconnect(d['sent_by'], d['nickname'], d['reason'])
-        elif d['command'] == Command.START_GAME.value and 'sent_by' in d and 'public_key_pems' in d:
-            msg = Protocol.start_game(d['sent_by'], [(nickname, base64.b64decode(public_key_pem.encode('utf-8'))) for nickname, public_key_pem in d['public_key_pems']])
-        elif d['command'] == Command.COMMIT_CARD.value and 'sent_by' in d and 'numbers' in d and 'numbers_signature' in d:
-            msg = Protocol.commit_card(d['sent_by'], d['numbers'], base64.b64decode(d['numbers_signature'].encode('utf-8')))
-        elif d['command'] == Command.DISQUALIFY.value and 'sent_by' in d and 'nickname' in d and 'reason' in d:
-            msg = Protocol.disqualify(d['sent_by'], d['nickname'], d['reason'])
-        elif d['command'] == Command.SHUFFLE_DECK.value and 'sent_by' in d and 'numbers' in d and 'numbers_signature' in d:
-            msg = Protocol.shuffle_deck(d['sent_by'], [base64.b64decode(n.encode('utf-8')) for n in d['numbers']], base64.b64decode(d['numbers_signature'].encode('utf-8')))
-        elif d['command'] == Command.SIGN_DECK.value and 'sent_by' in d and 'numbers' in d and 'numbers_signature' in d:
-            msg = Protocol.sign_deck(d['sent_by'], [base64.b64decode(n.encode('utf-8')) for n in d['numbers']], base64.b64decode(d['numbers_signature'].encode('utf-8')))
-        elif d['command'] == Command.PLAYING_DECK.value and 'sent_by' in d and 'numbers' in d and 'numbers_signature' in d:
-            msg = Protocol.playing_deck(d['sent_by'], [base64.b64decode(n.encode('utf-8')) for n in d['numbers']], base64.b64decode(d['numbers_signature'].encode('utf-8')))
-        elif d['command'] == Command.SYMMETRIC_KEY.value and 'sent_by' in d and 'symmetric_key' in d:
-            msg = Protocol.symmetric_key(d['sent_by'], base64.b64decode(d['symmetric_key'].encode('utf-8')))
-        elif d['command'] == Command.DECKS_KEYS.value and 'sent_by' in d and 'decks_keys' in d:
-            msg = Protocol.decks_keys(d['sent_by'], [(nickname, [base64.b64decode(n.encode('utf-8')) for n in numbers], base64.b64decode(symmetric_key.encode('utf-8'))) for nickname, numbers, symmetric_key in d['decks_keys']])
-        elif d['command'] == Command.WINNER.value and 'sent_by' in d and 'nicknames' in d:
-            msg = Protocol.winner(d['sent_by'], d['nicknames'])
-        elif d['command'] == Command.REQUEST_LOG.value and 'sent_by' in d:
-            msg = Protocol.request_log(d['sent_by'])
-        elif d['command'] == Command.REQUEST_USERS.value and 'sent_by' in d:
-            msg = Protocol.request_users(d['sent_by'])
-        elif d['command'] == Command.REQUEST_DISQUALIFY.value and 'sent_by' in d and 'nickname' in d and 'reason' in d:
-            msg = Protocol.request_disqualify(d['sent_by'], d['nickname'], d['reason'])
-        else:
-            raise ProtocolBadFormat(m)
-        return msg, m, sm
+    @classmethod
+    def __decode_frame(cls, codec: Codec, m: bytes, logger) -> Message:
+        msg = cls.decode(m, codec)
+
+        logger.log(f'[PROTO] Received {msg.command.value} message from {msg.sent_by}.')
+        return msg
 
     @classmethod
-    def __recvall(cls, conn: socket.socket, n: int) -> bytes:
-        """Receives n bytes through a connection."""
-        data = bytearray()
-        while len(data) < n:
-            pack = conn.recv(n - len(data))
-            if not pack:
+    def decode(cls, m: bytes, codec: Codec = Codec.JSON) -> Message:
+        """Builds a Message object from its serialized representation."""
+        if codec == Codec.BINARY:
+            return BinaryCodec.decode(m)
+        return JsonCodec.decode(m)
+
+
+class FrameReader:
+    """Reader of the frames of a connection, receiving them into a buffer reused for every frame."""
+
+    def __init__(self, conn: socket.socket, max_frame_size: int = None):
+        self.conn = conn
+        self.max_frame_size = max_frame_size or Protocol.MAX_FRAME_SIZE
+        self.buffer = bytearray(4096)
+        self.view = memoryview(self.buffer)
+
+    def read(self, n: int) -> memoryview | None:
+        """Receives exactly n bytes, returning a view of the buffer valid until the next read (or None if closed)."""
+        if n > len(self.buffer):
+            self.buffer = bytearray(n)
+            self.view = memoryview(self.buffer)
+        pos = 0
+        while pos < n:
+            k = self.conn.recv_into(self.view[pos:n], n - pos)
+            if k == 0:
                 return None
-            data.extend(pack)
-        return bytes(data)  # Immutable
+            pos += k
+        return self.view[:n]
 
 
 class ProtocolBadFormat(Exception):
@@ -507,5 +785,7 @@ class ProtocolBadFormat(Exception):
 
     @property
     def original_msg(self) -> str:
-        """Retrieve original message as a string."""
-        return self.original.decode('utf-8')
+        """Retrieve original message as a string (binary bodies are not UTF-8, frames with a bad flag have none)."""
+        if self.original is None:
+            return ''
+        return bytes(self.original).decode('utf-8', 'replace')
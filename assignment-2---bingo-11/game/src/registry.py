@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import threading
+
+from .profile import Profile
+
+
+class ProfileRegistry:
+    """Profiles of the users of the playing area: the caller and the players, in the order they joined.
+
+    Profiles are found by nickname and the next user in the chain in constant time. Iterating returns immutable
+    snapshots, so profiles can be added and removed while messages are broadcast to them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.caller: Profile | None = None
+        self.profiles: dict[str, Profile] = {}  # Caller and players, by nickname
+        # Players, linked by nickname in the order they joined
+        self.first: str | None = None
+        self.last: str | None = None
+        self.next: dict[str, str | None] = {}
+        self.prev: dict[str, str | None] = {}
+        # Snapshots (rebuilt when first read after a change)
+        self.snapshot: tuple[Profile, ...] | None = ()
+        self.players_snapshot: tuple[Profile, ...] | None = ()
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def __contains__(self, nickname: str) -> bool:
+        return nickname in self.profiles
+
+    def get(self, nickname: str) -> Profile | None:
+        return self.profiles.get(nickname, None)
+
+    def get_next(self, p: Profile) -> Profile | None:
+        """Returns the user after a given one in the chain (the caller is followed by the first player)."""
+        with self.lock:
+            if p is self.caller:
+                nickname = self.first
+            elif self.profiles.get(p.nickname, None) is p:
+                nickname = self.next[p.nickname]
+            else:
+                return None
+            return self.profiles[nickname] if nickname else None
+
+    def all(self) -> tuple[Profile, ...]:
+        """Returns the caller (if any) and the players."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            with self.lock:
+                snapshot = self.snapshot = self.__build()
+        return snapshot
+
+    def players(self) -> tuple[Profile, ...]:
+        snapshot = self.players_snapshot
+        if snapshot is None:
+            with self.lock:
+                snapshot = self.players_snapshot = self.__build()[1 if self.caller else 0:]
+        return snapshot
+
+    def set_caller(self, p: Profile):
+        with self.lock:
+            if self.caller:
+                del self.profiles[self.caller.nickname]
+            self.caller = p
+            self.profiles[p.nickname] = p
+            self.__changed()
+
+    def rem_caller(self):
+        with self.lock:
+            if self.caller:
+                del self.profiles[self.caller.nickname]
+                self.caller = None
+                self.__changed()
+
+    def add(self, p: Profile):
+        """Adds a player at the end of the chain."""
+        with self.lock:
+            self.profiles[p.nickname] = p
+            self.next[p.nickname] = None
+            self.prev[p.nickname] = self.last
+            if self.last:
+                self.next[self.last] = p.nickname
+            else:
+                self.first = p.nickname
+            self.last = p.nickname
+            self.__changed()
+
+    def remove(self, nickname: str):
+        with self.lock:
+            p = self.profiles.pop(nickname, None)
+            if p is None:
+                return
+            if p is self.caller:
+                self.caller = None
+            else:
+                # Unlink the player
+                prev, following = self.prev.pop(nickname), self.next.pop(nickname)
+                if prev:
+                    self.next[prev] = following
+                else:
+                    self.first = following
+                if following:
+                    self.prev[following] = prev
+                else:
+                    self.last = prev
+            self.__changed()
+
+    def __changed(self):
+        self.snapshot = None
+        self.players_snapshot = None
+
+    def __build(self) -> tuple[Profile, ...]:
+        profiles = [self.caller] if self.caller else []
+        nickname = self.first
+        while nickname:
+            profiles.append(self.profiles[nickname])
+            nickname = self.next[nickname]
+        return tuple(profiles)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import itertools
+
+from .logger import Logger
+from .profile import Profile
+from .registry import ProfileRegistry
+
+
+class Room:
+    """A game hosted by the playing area, with its own users, deck and log."""
+
+    def __init__(self, name: str, logger: Logger):
+        self.name = name
+        self.logger = logger
+        # Users
+        self.registry = ProfileRegistry()  # Includes caller and players
+        self.sequences = itertools.count(1)  # Sequence numbers of the players
+        # Game
+        self.started = False
+        self.game = 0   # Number of the last game started
+        self.pdeck = b''
+        self.pdeck_signature = None
+        self.keyed = 0
+        self.commits = {}  # Cards committed in this game, by nickname
+        self.uncommitted = set()  # Players of this game yet to commit their card
+        # Lifetime
+        self.joining = 0        # Joins in progress (the room is kept meanwhile)
+        self.on_empty = None    # Called when the last user is removed (if set)
+
+    def next_sequence(self) -> int:
+        return next(self.sequences)
+
+    @property
+    def profiles(self) -> tuple[Profile, ...]:
+        return self.registry.all()
+
+    def get_caller(self):
+        return self.registry.caller
+
+    def set_caller(self, p: Profile):
+        self.logger.log(f'[INFO ] Caller set to {p.nickname}.')
+        self.registry.set_caller(p)
+
+    def rem_caller(self):
+        self.logger.log(f'[INFO ] Caller removed.')
+        self.registry.rem_caller()
+        self.emptied()
+
+    def get_players(self):
+        return self.registry.players()
+
+    def get_profile(self, nickname) -> Profile:
+        return self.registry.get(nickname)
+
+    def get_profile_next(self, p: Profile):
+        return self.registry.get_next(p)
+
+    def add_profile(self, p: Profile):
+        self.logger.log(f'[INFO ] User {p.nickname} added.')
+        self.registry.add(p)
+
+    def rem_profile(self, nickname):
+        self.logger.log(f'[INFO ] User {nickname} removed.')
+        self.registry.remove(nickname)
+        self.emptied()
+
+    def emptied(self):
+        if self.on_empty and not len(self.registry):
+            self.on_empty(self)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import multiprocessing
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+from .protocol import *
+
+
+def owner(room: str, workers: int) -> int:
+    """Worker serving a room (the same in every process)."""
+    return zlib.crc32(room.encode('utf-8')) % workers
+
+
+class Router:
+    """Sends each connection of a worker to the worker serving the room it joins, passing its file descriptor."""
+
+    TIMEOUT = 60.0              # Seconds to wait for the join message before serving the connection here
+    MAX_JOIN_SIZE = 64 * 1024   # Larger join messages are not routed (they may not fit the receive buffer)
+    FIELDS = ('heartbeat', 'rooms', 'users')  # Reported by every worker, followed by its counters
+
+    def __init__(self, index: int, inboxes: list[socket.socket], stats, stats_interval: float = 1.0):
+        self.index = index
+        self.workers = len(inboxes)
+        self.inboxes = inboxes      # Connections handed off to each worker
+        self.stats = stats          # Shared with the supervisor
+        self.stats_interval = stats_interval
+        self.pa = None
+
+    def owns(self, room: str) -> bool:
+        return owner(room, self.workers) == self.index
+
+    def start(self, pa):
+        """Starts receiving the connections handed off by the other workers and reporting the stats."""
+        self.pa = pa
+        threading.Thread(target=self.receive, name='router', daemon=True).start()
+        threading.Thread(target=self.report, name='stats', daemon=True).start()
+
+    def route(self, conn: socket.socket) -> bool:
+        """Hands off a new connection to the worker serving its room, returning whether it is served here."""
+        room = self.peek_room(conn)
+        if room is None or self.owns(room):
+            return True
+        worker = owner(room, self.workers)
+        self.inboxes[worker].sendmsg([room.encode('utf-8')],
+                                     [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array('i', [conn.fileno()]))])
+        conn.close()
+        self.pa.metrics.handoffs.inc()
+        return False
+
+    def peek_room(self, conn: socket.socket) -> str | None:
+        """Room of the join (or resume) message at the start of a connection, read without consuming it."""
+        try:
+            header = self.peek(conn, 5)
+            if header is None:
+                return None
+            codec, signature_size = Protocol.parse_flag(header[0])
+            m_len = int.from_bytes(header[1:], 'big')
+            if not signature_size < m_len <= self.MAX_JOIN_SIZE:
+                return None
+            frame = self.peek(conn, 5 + m_len)
+            if frame is None:
+                return None
+            msg = Protocol.decode(frame[5 + signature_size:], codec)
+            room = msg.room if msg.command in (Command.JOIN, Command.RESUME) else None
+            return room if isinstance(room, str) else None
+        except Exception:
+            # Any message that cannot be routed is served here (and rejected by the playing area if invalid)
+            return None
+        finally:
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVLOWAT, 1)
+
+    def peek(self, conn: socket.socket, n: int) -> bytes | None:
+        """Waits (up to the timeout) until n bytes can be read from a connection, returning them unconsumed."""
+        # The connection is not readable until n bytes arrive (or it is closed)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVLOWAT, n)
+        readable, _, _ = select.select([conn], [], [], self.TIMEOUT)
+        if not readable:
+            return None
+        data = conn.recv(n, socket.MSG_PEEK)
+        return data if len(data) == n else None
+
+    def receive(self):
+        """Serves the connections handed off by the other workers."""
+        inbox = self.inboxes[self.index]
+        fds = array('i')
+        while True:
+            room, ancdata, _, _ = inbox.recvmsg(1024, socket.CMSG_SPACE(fds.itemsize))
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    for fd in array('i', data[:len(data) - len(data) % fds.itemsize]):
+                        self.pa.logger.log(f'[INFO ] Connection to room {room.decode("utf-8")} handed off.')
+                        self.pa.adopt(socket.socket(fileno=fd))
+
+    def report(self):
+        """Writes the health and counters of this worker where the supervisor reads them."""
+        fields = self.FIELDS + self.pa.COUNTERS
+        base = self.index * len(fields)
+        while True:
+            values = self.pa.stats()
+            values['heartbeat'] = time.time()
+            for i, field in enumerate(fields):
+                self.stats[base + i] = values[field]
+            time.sleep(self.stats_interval)
+
+
+def run_worker(router: Router, pa_cls, args: list):
+    """Entry point of a worker process."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    pa = pa_cls(*args, router=router)
+    pa.run()
+
+
+class Supervisor:
+    """Forks worker processes serving the playing area on the same port, each with its own rooms."""
+
+    def __init__(self, workers: int, pa_cls, args: list, stats_interval: float = 5.0):
+        self.workers = workers
+        self.pa_cls = pa_cls
+        self.args = args
+        self.stats_interval = stats_interval
+        self.fields = Router.FIELDS + pa_cls.COUNTERS
+        self.context = multiprocessing.get_context('fork')
+        # Connections handed off to each worker (each worker receives from its own and sends to every other)
+        self.inboxes = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(workers)]
+        # Health and counters of each worker
+        self.stats = self.context.Array('d', workers * len(self.fields), lock=False)
+        self.processes = [None] * workers
+
+    def start(self, index: int):
+        router = Router(index, [inbox[0] if i == index else inbox[1] for i, inbox in enumerate(self.inboxes)],
+                        self.stats, min(1.0, self.stats_interval))
+        p = self.context.Process(target=run_worker, args=(router, self.pa_cls, self.args), name=f'worker{index}')
+        p.start()
+        self.processes[index] = p
+
+    def worker_stats(self, index: int) -> dict:
+        base = index * len(self.fields)
+        return {field: self.stats[base + i] for i, field in enumerate(self.fields)}
+
+    def run(self):
+        """Supervisor loop: restarts the workers that exit and logs their aggregated counters."""
+        print(f'[INFO ] Supervisor is running with {self.workers} workers...')
+        for i in range(self.workers):
+            self.start(i)
+        # Stop the workers when terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        last, last_finished = time.monotonic(), 0
+        try:
+            while True:
+                time.sleep(self.stats_interval)
+                alive = 0
+                totals = dict.fromkeys(self.fields, 0)
+                for i, p in enumerate(self.processes):
+                    stats = self.worker_stats(i)
+                    if not p.is_alive():
+                        print(f'[WARN ] Worker {i} exited with code {p.exitcode}, restarting.')
+                        self.start(i)
+                        continue
+                    if time.time() - stats['heartbeat'] > 3 * self.stats_interval:
+                        print(f'[WARN ] Worker {i} is not responding.')
+                        continue
+                    alive += 1
+                    for field in self.fields:
+                        totals[field] += stats[field]
+                now = time.monotonic()
+                rate = max(0, totals['games_finished'] - last_finished) / (now - last)
+                last, last_finished = now, totals['games_finished']
+                print(f'[INFO ] Workers {alive}/{self.workers} alive: {int(totals["rooms"])} rooms, '
+                      f'{int(totals["users"])} users, {int(totals["connections"])} connections '
+                      f'({int(totals["handoffs"])} handed off), {int(totals["messages_received"])} messages received, '
+                      f'{int(totals["games_started"])} games started, {int(totals["games_finished"])} finished '
+                      f'({rate:.2f} games/s).')
+        except (KeyboardInterrupt, SystemExit):
+            for p in self.processes:
+                p.terminate()
+            for p in self.processes:
+                p.join()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    """Writes spans to a trace file in the Chrome trace event format (chrome://tracing or ui.perfetto.dev).
+
+    Timestamps are taken from the wall clock, so the traces of every role of a game line up when opened together.
+    """
+
+    def __init__(self, fname: str, process_name: str):
+        self.fname = fname
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.lanes = {}     # Tracks of spans not bound to a thread, by name
+        self.open = {}      # Start of the spans begun and not yet ended, by key
+        self.f = open(fname, 'w', buffering=1)   # Written line by line, so traces of killed processes are complete
+        self.f.write('[\n')
+        self.event({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': process_name}})
+        atexit.register(self.close)
+
+    @staticmethod
+    def now() -> int:
+        """Microseconds since the epoch."""
+        return time.time_ns() // 1000
+
+    def event(self, event: dict):
+        with self.lock:
+            if self.f is not None:
+                self.f.write(json.dumps(event, default=str) + ',\n')
+
+    def lane(self, name: str) -> int:
+        """Track of a lane of spans (a game or a user), named when first used."""
+        with self.lock:
+            tid = self.lanes.get(name, None)
+            if tid is not None:
+                return tid
+            tid = self.lanes[name] = -len(self.lanes) - 1   # Negative, not to clash with the ids of threads
+        self.event({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}})
+        return tid
+
+    def complete(self, name: str, cat: str, start: int, args: dict = None, lane: str = None):
+        """Records a span from start until now, on a lane or on the current thread."""
+        tid = self.lane(lane) if lane else threading.get_native_id()
+        self.event({'name': name, 'cat': cat, 'ph': 'X', 'ts': start, 'dur': self.now() - start, 'pid': self.pid,
+                    'tid': tid, 'args': args or {}})
+
+    def begin(self, key, start: int = None):
+        """Begins a span that ends on another message (and possibly another thread)."""
+        with self.lock:
+            self.open[key] = self.now() if start is None else start
+
+    def end(self, key, name: str, cat: str, args: dict = None, lane: str = None) -> bool:
+        """Ends a span begun with the same key, returning whether it was begun."""
+        with self.lock:
+            start = self.open.pop(key, None)
+        if start is None:
+            return False
+        self.complete(name, cat, start, args, lane)
+        return True
+
+    def close(self):
+        with self.lock:
+            if self.f is None:
+                return
+            # Closing the array is optional in the format (traces of killed processes can be read too)
+            self.f.write(json.dumps({'name': 'trace_end', 'ph': 'i', 's': 'g', 'ts': self.now(), 'pid': self.pid,
+                                     'tid': 0}) + '\n]\n')
+            self.f.close()
+            self.f = None
@@ -1,34 +1,110 @@
 import socket
+from collections import deque
 
 from .card import Card
 from .deck import Deck
-from .keychain import KeyChain
+from .keychain import KeyChain, Suite
 from .logger import Logger
+from .protocol import Codec, CommitBundleMessage, FrameReader, Message, Protocol
+from .tracer import Tracer
 
 
 class User:
 
-    def __init__(self, N, parea_addr, parea_port, nickname, prob_cheat, cc):
+    def __init__(self, N, parea_addr, parea_port, nickname, prob_cheat, cc, codec='BINARY', deck_workers=0, room='default',
+                 trace=None, key_store=None, suite='RSA_PSS'):
         self.N = N
         self.parea_addr = parea_addr
         self.parea_port = parea_port
         self.nickname = nickname
         self.prob_cheat = prob_cheat
         self.card = Card(N, prob_cheat)
-        self.deck = Deck(N)
-        self.kc = KeyChain(asymmetric_key_size=256, symmetric_key_size=32, cc=cc)
+        self.deck = Deck(N, workers=deck_workers)
+        self.kc = KeyChain(asymmetric_key_size=Protocol.SIGNATURE_SIZE, symmetric_key_size=32, cc=cc,
+                           suite=Suite[suite])
+        # Codecs supported by this user, by order of preference (JSON is always a fallback)
+        self.codecs = list(dict.fromkeys([codec, Codec.JSON.name]))
+        self.codec = Codec.JSON  # Negotiated when joining
+        # Signature suites of the frames of the playing area, by order of preference (RSA-PSS is always a fallback)
+        self.suites = list(dict.fromkeys([suite, Suite.RSA_PSS.name]))
+        self.parea_suite = Suite.RSA_PSS  # Negotiated when joining
+        self.room = room
         # Game
         self.started = False
-        self.pdeck = Deck(N)
+        self.pdeck = Deck(N, workers=deck_workers)
         self.winner = None
+        self.game = 0   # Number of the game in its room
+        # Session, resumed with its ticket if the connection is lost (if issued when joining)
+        self.ticket = None
+        self.replay = deque(maxlen=Protocol.REPLAY_FRAMES)  # Last frames sent, sent again when resumed
+        self.sent = 0       # Frames sent in the session
+        self.received = 0   # Frames received in the session
+        # Tracing of the handling of messages (if enabled)
+        self.tracer = Tracer(trace, nickname) if trace else None
         # Logger
         self.logger = Logger(f'{nickname}.log', self.kc, write=False)
         self.kc.logger = self.logger
         self.card.logger = self.logger # For cheats
         self.pdeck.logger = self.logger # For cheats
-        # Config
-        self.kc.generate_asymmetric()
+        # Config (the key pair is reused across runs if there is a key store)
+        if key_store:
+            self.kc.load_asymmetric(key_store, nickname)
+        else:
+            self.kc.generate_asymmetric()
         self.kc.init_cc()
         # Socket
+        self.connect()
+
+    def connect(self):
+        """Connects to the playing area."""
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.connect((self.parea_addr, self.parea_port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = FrameReader(self.sock)
+
+    def trace_message(self, msg: Message, start: int):
+        """Records the time taken to handle a message."""
+        self.tracer.complete(msg.command.value, 'message', start, {'from': msg.sent_by, 'game': self.game})
+
+    def validate_commits(self, ccbundle_msg: CommitBundleMessage) -> list[str]:
+        """Validates (and stores) the cards of every other player, returning the nicknames of the invalid ones."""
+        invalid = []
+        for nickname, numbers, numbers_signature in ccbundle_msg.commits:
+            if nickname == self.nickname:
+                continue
+            if self.card.validate_numbers(numbers, numbers_signature, self.kc,
+                                          self.kc.get_user_public_key_pem(nickname)):
+                self.card.set_user_card(nickname, numbers)
+            else:
+                invalid.append(nickname)
+        return invalid
+
+    def send(self, msg: Message):
+        """Sends a message to the playing area, encoded with the codec negotiated when joining."""
+        if not self.ticket:
+            Protocol.send_msg(self.sock, msg, self.kc, self.logger, self.codec)
+            return
+        parts = Protocol.frame_parts(msg, self.kc, self.codec)
+        # Kept to be sent again if the session is resumed
+        self.replay.append(parts)
+        self.sent += 1
+        try:
+            Protocol.send_frame(self.sock, parts, msg, self.logger)
+        except OSError:
+            self.logger.log(f'[WARN ] Failed to send {msg.command.value} message, sent again when resumed.')
+
+    def set_codec(self, resp_join_msg):
+        """Sets the codec and signature suite chosen by the playing area in the response to the join message."""
+        if resp_join_msg.data:
+            self.codec = Codec[resp_join_msg.data[0]]
+        if len(resp_join_msg.data) > 1:
+            self.parea_suite = Suite[resp_join_msg.data[1]]
+
+    def set_ticket(self, resp_join_msg):
+        """Sets the ticket issued in the response to the join message (if any), starting the session with it."""
+        if len(resp_join_msg.data) < 4:
+            return
+        self.ticket = tuple(resp_join_msg.data[2:4])
+        self.replay.clear()
+        self.sent = 0
+        self.received = 1   # The response itself
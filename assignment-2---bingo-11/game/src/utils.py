@@ -17,6 +17,23 @@ def str_to_bytes(obj):
     return obj
 
 
+def parse_log_options(args: list[str]) -> dict:
+    """Used to parse the options of the /logs command (e.g. 'limit=20 command=JOIN'), None if they are invalid."""
+    names = {'offset': 'offset', 'limit': 'limit', 'first': 'first', 'last': 'last',
+             'command': 'filter_command', 'nickname': 'filter_nickname'}
+    options = {}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if name not in names or not value:
+            return None
+        if name in ('offset', 'limit', 'first', 'last'):
+            if not value.isdigit():
+                return None
+            value = int(value)
+        options[names[name]] = value
+    return options
+
+
 def print_log(log: tuple[str]):
     """Used to print log from playing area."""
     for entry in log:
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from .keychain import KeyChain
+
+
+class VerifyPool:
+    """Pool of processes verifying message signatures outside the GIL, on every core."""
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count()
+        # Processes are started by a fork server, not forked from this process on demand: a fork while another thread
+        # (the logger writer, a reader) holds a lock would leave it held forever in the child
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('forkserver'))
+
+    def submit(self, m: bytes, sm: bytes, public_key_pem: bytes) -> Future:
+        """Submits a verification job, returning a future of its verdict."""
+        return self.executor.submit(KeyChain.verify, m, sm, public_key_pem)
+
+    def verify(self, m: bytes, sm: bytes, public_key_pem: bytes) -> bool:
+        """Verifies a signature, blocking (only) the calling thread until the verdict is known."""
+        return self.submit(m, sm, public_key_pem).result()
+
+    def shutdown(self):
+        self.executor.shutdown()
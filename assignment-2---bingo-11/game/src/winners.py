@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from array import array
+from itertools import accumulate, chain
+
+
+class WinnerEngine:
+    """Finds the winners of a game, indexing which cards contain each number of the deck."""
+
+    def __init__(self, N, user_cards: dict[str, list]):
+        self.N = N
+        self.nicknames = list(user_cards.keys())
+        # Numbers left to be drawn in each card (repeated numbers are only counted once)
+        cards = [set(numbers) for numbers in user_cards.values()]
+        self.sizes = array('I', [len(numbers) for numbers in cards])
+        # Inverted index: the cards containing number n are cards[offsets[n]:offsets[n+1]]
+        index = [[] for _ in range(N)]
+        for i, numbers in enumerate(cards):
+            for n in numbers:
+                if 0 <= n < N:
+                    index[n].append(i)
+        self.offsets = array('I', accumulate(map(len, index), initial=0))
+        self.cards = array('I', chain.from_iterable(index))
+        self.remaining = array('I', self.sizes)
+        self.drawn = bytearray(N)  # Numbers already drawn (a deck with repeated numbers draws each once)
+
+    def reset(self):
+        self.remaining = array('I', self.sizes)
+        self.drawn = bytearray(self.N)
+
+    def draw(self, n: int) -> list[str]:
+        """Marks a number as drawn, returning the players whose card was completed by it."""
+        return [self.nicknames[i] for i in sorted(self.__draw(n))]
+
+    def get_winners(self, numbers: list) -> list[str]:
+        """Draws the numbers in order until some card is completed, returning the players with completed cards."""
+        self.reset()
+        # Empty cards are completed by the first number drawn
+        completed = [i for i, size in enumerate(self.sizes) if size == 0]
+        for n in numbers:
+            completed += self.__draw(n)
+            if len(completed) > 0:
+                return [self.nicknames[i] for i in sorted(completed)]
+        return []
+
+    def __draw(self, n: int) -> list[int]:
+        completed = []
+        if 0 <= n < self.N and not self.drawn[n]:
+            self.drawn[n] = 1
+            remaining = self.remaining
+            for i in self.cards[self.offsets[n]:self.offsets[n + 1]]:
+                remaining[i] -= 1
+                if remaining[i] == 0:
+                    completed.append(i)
+        return completed
@@ -0,0 +1,35 @@
+import sys
+import time
+
+import click
+
+from src.logverify import LogVerifier
+
+
+@click.command()
+@click.option('--log',        type=str, default='parea.log', help='Log to verify')
+@click.option('--public_key', type=str, default=None,        help='Public key of the playing area (default: <log>.pem)')
+@click.option('--workers',    type=int, default=0,           help='Processes verifying the log (0 for one per core)')
+@click.option('--chunk_size', type=int, default=4 * 1024 * 1024, help='Bytes of the log verified by each job')
+@click.option('--allow_unsigned_tail', type=bool, default=False,
+              help='Accept entries after the last checkpoint (the log of a running playing area)')
+def main(log, public_key, workers, chunk_size, allow_unsigned_tail):
+    with open(public_key or f'{log}.pem', 'rb') as f:
+        public_key_pem = f.read()
+
+    verifier = LogVerifier(log, public_key_pem, workers, chunk_size, allow_unsigned_tail)
+    t0 = time.perf_counter()
+    valid = verifier.verify()
+    elapsed = time.perf_counter() - t0
+    if not valid:
+        print(f'[ERROR] Entry {verifier.broken} is broken: {verifier.reason}')
+        sys.exit(1)
+    mode = 'checkpoint' if verifier.checkpoint else 'entry'
+    print(f'[INFO ] Verified {verifier.entries} entries ({mode} signatures) in {elapsed:.2f}s '
+          f'({verifier.entries / max(elapsed, 1e-9):.0f} entries/s).')
+    if verifier.unsigned:
+        print(f'[WARN ] The last {verifier.unsigned} entries are not covered by a checkpoint.')
+
+
+if __name__ == '__main__':
+    main()